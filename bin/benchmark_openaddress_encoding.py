@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+import argparse
+import importlib.util
+import os
+import random
+import struct
+from binascii import hexlify
+from time import time
+
+import numpy as np
+from pyproj import Proj
+
+
+
+def load_importer():
+    """
+    Import ``import_openaddress_data.py`` from the directory of this script, it is not
+    a module of the package. This benchmark is a development tool and not installed.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_openaddress_data.py')
+    spec = importlib.util.spec_from_file_location('import_openaddress_data', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+importer = load_importer()
+encode_houses = importer.encode_houses
+HOUSE_BATCH = importer.HOUSE_BATCH
+
+
+def random_locations(count):
+    # coordinates are strings as they come from the CSV reader
+    return [
+        ('{:.7f}'.format(random.uniform(-180.0, 180.0)), '{:.7f}'.format(random.uniform(-85.0, 85.0)))
+        for _ in range(count)
+    ]
+
+
+def per_point(proj, locations):
+    """Encoding as done before batching, one call per point"""
+    import geohash
+
+    for lon, lat in locations:
+        x, y = proj(lon, lat)
+        wkb = '0101000020110F0000' + (hexlify(struct.pack('<d', x)) + hexlify(struct.pack('<d', y))).decode('ascii')
+        hsh = geohash.encode(float(lat), float(lon))
+
+
+def batched(proj, locations, batch_size):
+    for i in range(0, len(locations), batch_size):
+        batch = locations[i:i + batch_size]
+        lon = np.array([item[0] for item in batch], dtype=np.float64)
+        lat = np.array([item[1] for item in batch], dtype=np.float64)
+        wkbs, hashes = encode_houses(proj, lon, lat)
+
+
+def measure(name, func, *args):
+    start = time()
+    func(*args)
+    elapsed = time() - start
+    print('{:12} {:>10} rows/second'.format(name, round(len(args[1]) / elapsed)))
+
+
+def parse_cmdline():
+    parser = argparse.ArgumentParser(description='Benchmark the coordinate encoding of the openaddresses.io importer')
+    parser.add_argument(
+        '--rows',
+        type=int,
+        dest='rows',
+        default=1000000,
+        help='Number of random locations to encode'
+    )
+    parser.add_argument(
+        '--batch',
+        type=int,
+        dest='batch',
+        default=HOUSE_BATCH,
+        help='Batch size for the vectorized encoding'
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_cmdline()
+    proj = Proj(init='epsg:3857')
+    locations = random_locations(args.rows)
+
+    try:
+        measure('per point', per_point, proj, locations)
+    except ImportError:
+        print('per point: python-geohash is not installed, skipping')
+    measure('batched', batched, proj, locations, args.batch)
@@ -19,6 +19,16 @@ from pkg_resources import resource_exists, resource_listdir, resource_string
 import psycopg2
 from psycopg2.extras import DictCursor
 
+try:
+    from osmgeocoder.prediction import build_prediction_index
+    from osmgeocoder.reverse_index import build_reverse_index
+    from osmgeocoder.maintenance import write_index, set_telemetry, telemetry
+except (ImportError, ModuleNotFoundError):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from osmgeocoder.prediction import build_prediction_index
+    from osmgeocoder.reverse_index import build_reverse_index
+    from osmgeocoder.maintenance import write_index, set_telemetry, telemetry
+
 #
 # DB-Utility functions
 #
@@ -39,7 +49,9 @@ def load_sql(db, path):
             sql_files.sort()
             for f in sql_files:
                 print('Executing {}...'.format(f))
+                start = time()
                 db.execute(resource_string('osmgeocoder', os.path.join(path, f)))
+                telemetry('sql_file', path=path, name=f, seconds=round(time() - start, 3))
     except (ImportError, ModuleNotFoundError):
         # if not found, assume we have been started from a source checkout
         my_dir = os.path.dirname(os.path.abspath(__file__))
@@ -49,8 +61,10 @@ def load_sql(db, path):
 
         for f in sql_files:
             print('Executing {}...'.format(f))
+            start = time()
             with open(f, 'r') as fp:
                 db.execute(fp.read())
+            telemetry('sql_file', path=path, name=os.path.basename(f), seconds=round(time() - start, 3))
 
 
 def finish_db(db):
@@ -102,6 +116,27 @@ def parse_cmdline():
         required=True,
         help='Postgis DB URL'
     )
+    parser.add_argument(
+        '--telemetry',
+        type=str,
+        dest='telemetry',
+        default=None,
+        help='Append timing events as JSON lines to this file'
+    )
+    parser.add_argument(
+        '--prediction-index',
+        type=str,
+        dest='prediction_index',
+        default=None,
+        help='Write the wordlist into this file for in-process text prediction (config key `prediction_index`)'
+    )
+    parser.add_argument(
+        '--reverse-index',
+        type=str,
+        dest='reverse_index',
+        default=None,
+        help='Export the houses into this file for in-process reverse geocoding without the DB (config key `reverse_index`)'
+    )
     parser.add_argument(
         '--dump',
         type=str,
@@ -114,8 +149,13 @@ def parse_cmdline():
 
 if __name__ == '__main__':
     args = parse_cmdline()
+    set_telemetry(args.telemetry)
     db = open_db(args.db_url)
     finish_db(db)
+    if args.prediction_index:
+        write_index(db, args.prediction_index, build_prediction_index, 'prediction_index', 'words', telemetry)
+    if args.reverse_index:
+        write_index(db, args.reverse_index, build_reverse_index, 'reverse_index', 'houses', telemetry)
     close_db(db)
     if args.dump_file:
         dump(args.db_url, args.dump_file, 4)
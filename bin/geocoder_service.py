@@ -93,11 +93,38 @@ def predict():
     if query is None:
         abort(400)
 
-    predictions = list(geocoder.predict_text(query))
+    center = data.get('center', None)
+    region = data.get('region', None)
+
+    predictions = list(geocoder.predict_text(query, center=center, region=region))
     return jsonify({
         "predictions": predictions
     })
 
+@app.route('/complete', methods=['POST'])
+def complete():
+    if not request.is_json:
+        abort(400)
+    data = request.get_json()
+    query = data.get('query', None)
+    if query is None:
+        abort(400)
+
+    center = data.get('center', None)
+    limit = data.get('limit', 10)
+
+    completions = [
+        {
+            "address": result['address'],
+            "lat": result['lat'],
+            "lon": result['lon']
+        }
+        for result in geocoder.complete_address(query, center=center, limit=limit)
+    ]
+    return jsonify({
+        "completions": completions
+    })
+
 # when running this script directly execute gunicorn to serve
 if __name__ == "__main__":
     os.execlp(
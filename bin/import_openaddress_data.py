@@ -6,24 +6,94 @@ import argparse
 import psycopg2
 import hashlib
 import random
-import uuid
 from time import time, sleep
 from psycopg2.extras import execute_batch
 import io
 import os
+import math
+import uuid
+import sys
+import heapq
+import resource
+from operator import itemgetter
 from pprint import pprint
 from multiprocessing import Pool, Manager
-from itertools import zip_longest
-from sys import intern
+from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from queue import Queue
+from itertools import zip_longest, islice
 
 from tempfile import TemporaryFile
 
 import struct
-from binascii import hexlify
-from pyproj import Proj, transform
-import geohash
+import numpy as np
+from pyproj import Proj
+
+try:
+    from osmgeocoder.maintenance import maintenance_budget, set_telemetry, get_telemetry, telemetry
+except (ImportError, ModuleNotFoundError):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from osmgeocoder.maintenance import maintenance_budget, set_telemetry, get_telemetry, telemetry
 
 PARTITION_SIZE = 360
+SAMPLE_ROWS = 10000
+MEMORY_LIMIT = 512   # MB per import worker for sorting rows, the rest is spilled to disk
+ROW_SIZE = 1024      # approximate bytes of a parsed CSV row in memory
+MERGE_FAN_IN = 64    # spilled runs merged at once, more runs are merged in several passes
+MIN_RUN_BUFFER = 64 * 1024  # bytes, smallest read or write buffer of a spilled run
+ID_BLOCK_SIZE = 10000
+SHARD_SIZE = 1024    # MB of CSV data per shard, bigger files are split and imported by several threads
+HOUSE_BATCH = 10000  # houses projected and encoded in one go
+
+# ewkb point header: little endian, point type with srid flag, srid 3857
+EWKB_POINT_HEADER = np.frombuffer(bytes.fromhex('0101000020110F0000'), dtype=np.uint8)
+EWKB_POINT = np.dtype([('header', np.uint8, 9), ('x', '<f8'), ('y', '<f8')])
+
+GEOHASH_ALPHABET = np.frombuffer(b'0123456789bcdefghjkmnpqrstuvwxyz', dtype='S1')
+GEOHASH_PRECISION = 12
+
+COPY_BUFFER_SIZE = 256 * 1024  # bytes sent to the database in one go
+COPY_QUEUE_SIZE = 16           # buffers waiting for the database per COPY stream
+
+# binary COPY format, see https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+COPY_TRAILER = struct.pack('>h', -1)
+COPY_NULL = struct.pack('>i', -1)
+COPY_ENCODERS = {
+    'int4': struct.Struct('>i').pack,
+    'int8': struct.Struct('>q').pack,
+    'text': lambda value: value.encode('utf8'),
+    'uuid': lambda value: uuid.UUID(str(value)).bytes,
+    'bytes': lambda value: value,  # already in the binary representation, ewkb for geometries
+}
+
+# (column, type) of the COPY streams
+CITY_COLUMNS = (('id', 'int4'), ('key', 'int8'), ('city', 'text'), ('district', 'text'), ('region', 'text'), ('postcode', 'text'), ('license_id', 'uuid'))
+STREET_COLUMNS = (('id', 'int4'), ('key', 'int8'), ('street', 'text'), ('unit', 'text'), ('city_id', 'int4'))
+HOUSE_COLUMNS = (('id', 'int8'), ('key', 'int8'), ('location', 'bytes'), ('housenumber', 'text'), ('geohash', 'bytes'), ('source', 'text'), ('street_id', 'int4'))
+DIFF_COLUMNS = (('kind', 'text'), ('key', 'int8'), ('parent_key', 'int8'), ('a', 'text'), ('b', 'text'), ('c', 'text'), ('d', 'text'), ('location', 'bytes'), ('geohash', 'bytes'))
+
+# rows are sorted by city, street and house content key
+SORT_KEY = itemgetter(0, 1, 2)
+
+# word counts of the cities of one source (or shard) per region like in `build_wordlist()`
+OA_WORD_COUNTS = '''
+    SELECT public._word_region(s.extent) AS region, unnest(regexp_split_to_array(c.city, '\\W')) AS word, count(s.*) AS ct
+        FROM public.oa_city c
+        JOIN public.oa_street s ON c.id = s.city_id
+        WHERE c.license_id = %(license_id)s AND (c."key" %% %(shards)s + %(shards)s) %% %(shards)s = %(shard)s
+    GROUP BY c.city, public._word_region(s.extent)
+    UNION ALL
+    SELECT public._word_region(s.extent) AS region, unnest(regexp_split_to_array(s.street, '\\W')) AS word, count(h.*) AS ct
+        FROM public.oa_city c
+        JOIN public.oa_street s ON c.id = s.city_id
+        JOIN public.oa_house h ON s.id = h.street_id
+        WHERE c.license_id = %(license_id)s AND (c."key" %% %(shards)s + %(shards)s) %% %(shards)s = %(shard)s
+    GROUP BY s.street, public._word_region(s.extent)
+'''
+
+# namespace for the deterministic license ids
+LICENSE_NAMESPACE = uuid.UUID('4d1ab0d1-8a6f-4c1e-9a44-6f2b1c3e7d10')
 
 def grouper(n, iterable, fillvalue=None):
     "Collect data into fixed-length chunks or blocks"
@@ -31,6 +101,147 @@ def grouper(n, iterable, fillvalue=None):
     args = [iter(iterable)] * n
     return zip_longest(fillvalue=fillvalue, *args)
 
+def content_key(*values):
+    """Deterministic signed 64 bit key for a tuple of normalized values"""
+    digest = hashlib.md5('\x1f'.join(str(v) for v in values).encode('utf8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+def ewkb_points(x, y):
+    """EWKB points (web mercator) for arrays of coordinates, returns a list of byte strings"""
+    points = np.empty(len(x), dtype=EWKB_POINT)
+    points['header'] = EWKB_POINT_HEADER
+    points['x'] = x
+    points['y'] = y
+    data = points.tobytes()
+    return [data[i:i + EWKB_POINT.itemsize] for i in range(0, len(data), EWKB_POINT.itemsize)]
+
+def geohashes(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohashes for arrays of WGS84 coordinates, returns a list of byte strings"""
+    lat_bits = precision * 5 // 2
+    lon_bits = precision * 5 - lat_bits
+
+    # longitudes wrap into [-180, 180) like python-geohash, so 180 is the cell of -180,
+    # latitudes are clipped, 90 is in the northernmost cell
+    outside = (lon < -180.0) | (lon >= 180.0)
+    lon = np.where(outside, lon - 360.0 * np.floor((lon + 180.0) / 360.0), lon)
+
+    # position of the coordinate in the bisected interval as an integer
+    lat_q = np.clip(np.floor((lat + 90.0) / 180.0 * (1 << lat_bits)), 0, (1 << lat_bits) - 1).astype(np.uint64)
+    lon_q = np.clip(np.floor((lon + 180.0) / 360.0 * (1 << lon_bits)), 0, (1 << lon_bits) - 1).astype(np.uint64)
+
+    # interleave the bits, longitude first, one loop iteration per bit for all points at once
+    code = np.zeros(len(lat), dtype=np.uint64)
+    for i in range(lon_bits):
+        code = (code << np.uint64(1)) | ((lon_q >> np.uint64(lon_bits - 1 - i)) & np.uint64(1))
+        if i < lat_bits:
+            code = (code << np.uint64(1)) | ((lat_q >> np.uint64(lat_bits - 1 - i)) & np.uint64(1))
+
+    # 5 bits per character
+    chars = np.empty((len(lat), precision), dtype='S1')
+    for i in range(precision):
+        chars[:, i] = GEOHASH_ALPHABET[(code >> np.uint64(5 * (precision - 1 - i))) & np.uint64(31)]
+    return chars.view('S{}'.format(precision)).ravel().tolist()
+
+def encode_houses(proj, lon, lat):
+    """
+    Project arrays of WGS84 coordinates to web mercator, returns the EWKB
+    and the geohashes of the locations as byte strings
+    """
+    x, y = proj(lon, lat)
+    return ewkb_points(x, y), geohashes(lat, lon)
+
+class CopyStream:
+    """
+    Stream rows into ``COPY ... FROM STDIN`` in binary format.
+
+    The COPY runs in a thread on the given connection and is fed from a bounded
+    queue, so encoding rows and loading them overlap and the producer waits when
+    the database can not keep up.
+    """
+
+    def __init__(self, db, table, columns):
+        self.db = db
+        self.sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT binary)'.format(
+            table,
+            ', '.join('"{}"'.format(column) for column, _ in columns)
+        )
+        self.encoders = [COPY_ENCODERS[kind] for _, kind in columns]
+        self.field_count = struct.pack('>h', len(columns))
+        self.buffer = bytearray(COPY_HEADER)
+        self.queue = Queue(maxsize=COPY_QUEUE_SIZE)
+        self.table = table
+        self.error = None
+        self.finished = False # the COPY has read the end of the stream
+        self.rows = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.waiting = 0.0 # time the COPY waited for rows, the rest is database time
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        start = time()
+        try:
+            self.db.copy_expert(self.sql, self, size=COPY_BUFFER_SIZE)
+            self.elapsed = time() - start
+        except Exception as e:
+            self.error = e
+            # keep consuming until the end of the stream, the producer finds the error on
+            # the next flush. Errors of the server are only reported after the end was read.
+            if not self.finished:
+                while self.queue.get() is not None:
+                    pass
+
+    def read(self, size=-1):
+        # called by copy_expert, an empty result ends the COPY
+        start = time()
+        data = self.queue.get()
+        self.waiting += time() - start
+        if data is None:
+            self.finished = True
+            return b''
+        return data
+
+    def write(self, values):
+        buffer = self.buffer
+        buffer += self.field_count
+        for encode, value in zip(self.encoders, values):
+            if value is None:
+                buffer += COPY_NULL
+            else:
+                data = encode(value)
+                buffer += struct.pack('>i', len(data))
+                buffer += data
+        self.rows += 1
+        if len(buffer) >= COPY_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        if len(self.buffer) > 0:
+            self.bytes += len(self.buffer)
+            self.queue.put(bytes(self.buffer))
+            self.buffer = bytearray()
+
+    def close(self):
+        """Send the remaining rows and wait for the COPY to finish"""
+        self.buffer += COPY_TRAILER
+        try:
+            self.flush()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return dict(table=self.table, rows=self.rows, bytes=self.bytes, seconds=round(self.elapsed, 3), db_seconds=round(self.elapsed - self.waiting, 3))
+
+    def abort(self):
+        """End the stream without sending the trailer, roll back the connection afterwards"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
 class CountingTextIOWrapper(io.TextIOWrapper):
     """Wrapper for the TextIOWrapper to be able to count already consumed bytes"""
 
@@ -62,14 +273,84 @@ def open_db(url, transaction=True):
 def clear_db(db):
     print('Cleaning up')
     db.execute('''
-        DROP VIEW IF EXISTS address_data;
-        DROP TABLE IF EXISTS house;
-        DROP TABLE IF EXISTS street;
-        DROP TABLE IF EXISTS city;
-        DROP TABLE IF EXISTS license;
+        DROP VIEW IF EXISTS public.oa_address_data;
+        DROP TABLE IF EXISTS public.oa_house;
+        DROP TABLE IF EXISTS public.oa_street;
+        DROP TABLE IF EXISTS public.oa_city;
+        DROP TABLE IF EXISTS public.oa_license;
+        DROP TABLE IF EXISTS public.oa_import_state;
+        DROP SEQUENCE IF EXISTS public.oa_house_id_seq;
     ''')
 
-def prepare_db(db):
+def partitions_exist(db):
+    db.execute("SELECT to_regclass('public.oa_house');")
+    if db.fetchone()[0] is None:
+        return False
+    db.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = 'public.oa_house'::regclass;")
+    return db.fetchone()[0] > 0
+
+def reservoir_sample(iterable, k, rnd):
+    """
+    Uniform random sample of ``k`` items of an iterable of unknown length in one pass,
+    skips the items between the picks instead of drawing a random number per item
+    (algorithm L by Li, 1994)
+    """
+    iterator = iter(iterable)
+    reservoir = list(islice(iterator, k))
+    if len(reservoir) < k:
+        return reservoir
+
+    w = math.exp(math.log(rnd.random()) / k)
+    while True:
+        skip = math.floor(math.log(rnd.random()) / math.log(1 - w))
+        item = next(islice(iterator, skip, skip + 1), None)
+        if item is None:
+            return reservoir
+        reservoir[rnd.randrange(k)] = item
+        w *= math.exp(math.log(rnd.random()) / k)
+
+def sample_x_coordinates(z, files, rows_per_file=SAMPLE_ROWS):
+    """
+    Sample mercator x-coordinates from all rows of every CSV in the zip file (the
+    files are often sorted by region, so the first rows are not representative),
+    returns a list of (x, weight) tuples, samples are weighted by the file size
+    """
+    rnd = random.Random(0)
+    samples = []
+    for name in files:
+        size = z.getinfo(name).file_size
+        xs = []
+        with z.open(name, 'r') as fp:
+            next(fp, None)  # skip header
+            # only the sampled lines are parsed
+            lines = reservoir_sample(fp, rows_per_file, rnd)
+        for row in csv.reader(line.decode('utf8', errors='replace') for line in lines):
+            try:
+                # web mercator x is linear in the longitude
+                xs.append(math.radians(float(row[0])) * 6378137.0)
+            except (ValueError, IndexError):
+                continue
+        for x in xs:
+            samples.append((x, size / len(xs)))
+    return samples
+
+def partition_bounds(samples, partitions):
+    """Calculate inner bounds that split the weighted samples into ``partitions`` ranges of equal weight"""
+    samples.sort()
+    step = sum(weight for _, weight in samples) / partitions
+    target = step
+    accumulated = 0.0
+    bounds = []
+    for x, weight in samples:
+        accumulated += weight
+        while accumulated >= target and len(bounds) < partitions - 1:
+            # skip duplicates, dense spots just lead to fewer partitions
+            if len(bounds) == 0 or x > bounds[-1]:
+                bounds.append(x)
+            target += step
+    return bounds
+
+def prepare_db(db, partitions=PARTITION_SIZE, bounds=None, drop_indices=True):
     print('Creating tables...')
     db.execute('''
         DO
@@ -90,7 +371,8 @@ def prepare_db(db):
         );
 
         CREATE TABLE IF NOT EXISTS public.oa_city (
-            id uuid PRIMARY KEY,
+            id serial PRIMARY KEY,
+            "key" bigint,
             city TEXT,
             district TEXT,
             region TEXT,
@@ -99,22 +381,43 @@ def prepare_db(db):
         );
 
         CREATE TABLE IF NOT EXISTS public.oa_street (
-            id uuid PRIMARY KEY,
+            id serial PRIMARY KEY,
+            "key" bigint,
             street TEXT,
             unit TEXT,
-            city_id uuid
+            city_id integer,
+            extent gis.geometry(geometry, 3857)
         );
 
+        CREATE SEQUENCE IF NOT EXISTS public.oa_house_id_seq AS bigint;
         CREATE TABLE IF NOT EXISTS public.oa_house (
-            id uuid,
+            id bigint DEFAULT nextval('public.oa_house_id_seq'),
+            "key" bigint,
             location gis.geometry(POINT, 3857),
             "name" TEXT,
             housenumber TEXT,
             geohash TEXT,
-            street_id uuid,
+            street_id integer,
             "source" coordinate_source
         ) PARTITION BY RANGE (ST_X(location));
 
+        --
+        -- Import state of every file (or shard of a file), reruns skip finished files
+        --
+        CREATE TABLE IF NOT EXISTS public.oa_import_state (
+            file TEXT,
+            shard integer,
+            shards integer,
+            checksum TEXT,
+            status TEXT,
+            cities integer,
+            streets integer,
+            houses bigint,
+            started timestamptz,
+            finished timestamptz,
+            PRIMARY KEY (file, shard)
+        );
+
         --
         -- Re-assembly of openaddresses.io data into one view
         --
@@ -134,24 +437,31 @@ def prepare_db(db):
         );
     ''')
 
-    print('Creating shard tables...')
-    min_val = -20026376.39
-    max_val = 20026376.39
-    val_inc = (max_val - min_val) / PARTITION_SIZE
-    for i in range(0, PARTITION_SIZE):
-        print('  {}" {} TO {}'.format(
-            i,
-            min_val + val_inc * i,
-            min_val + val_inc * (i + 1)
-        ))
-        db.execute('''
-            CREATE TABLE IF NOT EXISTS public.oa_house_{}
-            PARTITION OF public.oa_house FOR VALUES FROM ({}) TO ({});
-        '''.format(
-            i,
-            min_val + val_inc * i,
-            min_val + val_inc * (i + 1)
-        ))
+    if partitions_exist(db):
+        # bounds of existing shards can not be changed without re-importing
+        print('Shard tables already exist, keeping them')
+    else:
+        print('Creating shard tables...')
+        if bounds is None:
+            # fixed width shards over the complete mercator x-range
+            min_val = -20026376.39
+            max_val = 20026376.39
+            val_inc = (max_val - min_val) / partitions
+            ranges = [(min_val + val_inc * i, min_val + val_inc * (i + 1)) for i in range(0, partitions)]
+        else:
+            # shards of roughly equal size, the outermost ones are open ended
+            limits = ['MINVALUE'] + bounds + ['MAXVALUE']
+            ranges = list(zip(limits[:-1], limits[1:]))
+
+        for i, (lower, upper) in enumerate(ranges):
+            print('  {}" {} TO {}'.format(i, lower, upper))
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS public.oa_house_{}
+                PARTITION OF public.oa_house FOR VALUES FROM ({}) TO ({});
+            '''.format(i, lower, upper))
+
+    if not drop_indices:
+        return
 
     print('Dropping indices and constraints for speed improvement...')
     db.execute('''
@@ -161,6 +471,11 @@ def prepare_db(db):
         DROP INDEX IF EXISTS street_trgm_idx;
         DROP INDEX IF EXISTS city_trgm_idx;
         DROP INDEX IF EXISTS street_city_id_idx;
+        DROP INDEX IF EXISTS street_extent_idx;
+        DROP INDEX IF EXISTS city_postcode_trgm_idx;
+        DROP INDEX IF EXISTS city_key_idx;
+        DROP INDEX IF EXISTS city_license_id_idx;
+        DROP INDEX IF EXISTS street_key_idx;
 
         DROP INDEX IF EXISTS house_street_id_idx;
         DROP INDEX IF EXISTS house_location_geohash_idx;
@@ -168,6 +483,22 @@ def prepare_db(db):
         DROP INDEX IF EXISTS house_location_idx;
         DROP INDEX IF EXISTS house_id_idx;
         DROP INDEX IF EXISTS house_housenumber_idx;
+        DROP INDEX IF EXISTS house_key_idx;
+    ''')
+
+def prepare_diff(db):
+    """
+    Make sure the indices a diff import needs exist (they are created by the
+    optimize step), the other indices and the constraints stay in place
+    """
+    print('Checking indices for diff import...')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS city_key_idx ON public.oa_city USING BTREE("key");
+        CREATE INDEX IF NOT EXISTS city_license_id_idx ON public.oa_city USING BTREE(license_id);
+        CREATE INDEX IF NOT EXISTS street_key_idx ON public.oa_street USING BTREE("key");
+        CREATE INDEX IF NOT EXISTS street_city_id_idx ON public.oa_street USING BTREE(city_id);
+        CREATE INDEX IF NOT EXISTS house_key_idx ON public.oa_house USING BTREE("key");
+        CREATE INDEX IF NOT EXISTS house_street_id_idx ON public.oa_house USING BTREE(street_id);
     ''')
 
 def finalize_db(db, optimize=False):
@@ -184,63 +515,124 @@ def finalize_db(db, optimize=False):
         ])
 
     sql.extend([
-        ('house: FK constraint',  'ALTER TABLE public.oa_house ADD CONSTRAINT house_street_id_fk FOREIGN KEY (street_id) REFERENCES public.oa_street (id) ON DELETE CASCADE ON UPDATE CASCADE INITIALLY DEFERRED;'),
-        ('city: FK constraint',   'ALTER TABLE public.oa_city ADD CONSTRAINT city_license_id_fk FOREIGN KEY (license_id) REFERENCES public.oa_license (id) ON DELETE CASCADE ON UPDATE CASCADE INITIALLY DEFERRED;'),
-        ('street: FK constraint', 'ALTER TABLE public.oa_street ADD CONSTRAINT street_city_id_fk FOREIGN KEY (city_id) REFERENCES public.oa_city (id) ON DELETE CASCADE ON UPDATE CASCADE INITIALLY DEFERRED;')
+        ('house: FK constraint',  'ALTER TABLE public.oa_house DROP CONSTRAINT IF EXISTS house_street_id_fk, ADD CONSTRAINT house_street_id_fk FOREIGN KEY (street_id) REFERENCES public.oa_street (id) ON DELETE CASCADE ON UPDATE CASCADE INITIALLY DEFERRED;'),
+        ('city: FK constraint',   'ALTER TABLE public.oa_city DROP CONSTRAINT IF EXISTS city_license_id_fk, ADD CONSTRAINT city_license_id_fk FOREIGN KEY (license_id) REFERENCES public.oa_license (id) ON DELETE CASCADE ON UPDATE CASCADE INITIALLY DEFERRED;'),
+        ('street: FK constraint', 'ALTER TABLE public.oa_street DROP CONSTRAINT IF EXISTS street_city_id_fk, ADD CONSTRAINT street_city_id_fk FOREIGN KEY (city_id) REFERENCES public.oa_city (id) ON DELETE CASCADE ON UPDATE CASCADE INITIALLY DEFERRED;')
     ])
 
     for log, item in sql:
         print(' - {}'.format(log))
+        start = time()
         db.execute(item)
-
-
-def cluster_worker(id, db_url):
-    # open all connections and inputs
-    db = open_db(db_url)
-
-    print('{i}, '.format(i=id), end='', flush=True)
-    db.execute('CLUSTER public.oa_house_{i} USING oa_house_{i}_geohash_idx;'.format(i=id))
-
-    close_db(db)
-
-
-def optimize_db(db, threads, url):
-    print('Adding indices on tables...')
-    sql = [
-        ('house: Geohash',                    'CREATE INDEX IF NOT EXISTS house_location_geohash_idx ON public.oa_house USING BTREE(geohash);'),
-        #('Cluster house on geohash',         'CLUSTER house USING house_location_geohash_idx;'),
-        ('house: House number trigram index', 'CREATE INDEX IF NOT EXISTS house_trgm_idx ON public.oa_house USING GIN (housenumber gin_trgm_ops);'),
-        ('house: Spatial index on location',  'CREATE INDEX IF NOT EXISTS house_location_idx ON public.oa_house USING GIST(location);'),
-        ('house: Btree index house number',   'CREATE INDEX IF NOT EXISTS house_housenumber_idx ON public.oa_house USING BTREE(housenumber);'),
-        ('house: Btree index id',             'CREATE INDEX IF NOT EXISTS house_id_idx ON public.oa_house USING BTREE(id);'),
-        ('house: Update planner statistics',  'ANALYZE public.oa_house;'),
-
-        ('city: Trigram index name',          'CREATE INDEX IF NOT EXISTS city_trgm_idx ON public.oa_city USING GIN (city gin_trgm_ops);'),
-        ('city: Btree Postcode',              'CREATE INDEX IF NOT EXISTS city_postcode_idx ON public.oa_city USING BTREE(postcode);'),
-        ('city: Btree name',                  'CREATE INDEX IF NOT EXISTS city_city_idx ON public.oa_city USING BTREE(city);'),
-        ('city: Update planner statistics',   'ANALYZE public.oa_city;'),
-
-        ('street: Trigram index name',        'CREATE INDEX IF NOT EXISTS street_trgm_idx ON public.oa_street USING GIN (street gin_trgm_ops);'),
-        ('street: Update planner statistics', 'ANALYZE public.oa_street;'),
+        telemetry('finalize', step=log, seconds=round(time() - start, 3))
+
+
+def run_job(url, name, sql, budget):
+    memory, workers = budget.acquire()
+    try:
+        db = open_db(url, transaction=False)
+        db.execute('SET maintenance_work_mem = %s;', ('{}MB'.format(memory),))
+        if workers is not None:
+            db.execute('SET max_parallel_maintenance_workers = %s;', (workers,))
+        start = time()
+        db.execute(sql)
+        elapsed = time() - start
+        close_db(db)
+    finally:
+        budget.release(memory, workers)
+
+    telemetry('optimize', step=name, seconds=round(elapsed, 3), memory=memory, workers=workers)
+    return elapsed
+
+
+def run_jobs(url, jobs, threads, budget):
+    """
+    Run ``(name, sql, depends)`` jobs on up to ``threads`` connections, a job is started
+    when all jobs named in ``depends`` are finished. Prints the runtime of every job.
+    """
+    done = {}
+    pending = list(jobs)
+    running = {}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while pending or running:
+            ready = [
+                job for job in pending
+                if all(dependency in done for dependency in job[2])
+            ][:threads - len(running)]
+            # reserve before starting, so the first job does not take the whole budget
+            budget.reserve(len(ready))
+            for job in ready:
+                name, sql, depends = job
+                pending.remove(job)
+                running[executor.submit(run_job, url, name, sql, budget)] = name
+            if not running:
+                raise ValueError('Unresolvable job dependencies: {}'.format(', '.join(job[0] for job in pending)))
+
+            finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                done[name] = future.result()
+                print(' - {:40} {:>10} s'.format(name, round(done[name], 2)), flush=True)
+    return done
+
+
+def optimize_db(db, threads, url, memory=None):
+    budget = maintenance_budget(db, memory, threads)
+
+    # CLUSTER rebuilds all indices of a table, so the house table is clustered on the
+    # geohash index before building the other house indices
+    print('Adding geohash index...')
+    run_jobs(url, [
+        ('house: Geohash', 'CREATE INDEX IF NOT EXISTS house_location_geohash_idx ON public.oa_house USING BTREE(geohash);', []),
+    ], threads, budget)
+
+    # find the shards and their part of the partitioned geohash index
+    db.execute('''
+        SELECT t.relname, ci.relname
+        FROM pg_inherits ii
+        JOIN pg_class ci ON ci.oid = ii.inhrelid
+        JOIN pg_index x ON x.indexrelid = ci.oid
+        JOIN pg_class t ON t.oid = x.indrelid
+        WHERE ii.inhparent = 'public.house_location_geohash_idx'::regclass
+        ORDER BY t.relname;
+    ''')
+    clusters = [
+        ('cluster: {}'.format(table), 'CLUSTER public.{t} USING {i};'.format(t=table, i=index), [])
+        for table, index in db.fetchall()
+    ]
+    clustered = [name for name, _, _ in clusters]
+
+    # house indices lock all shards and the street extents read all of them, so both
+    # wait for the clustering. Indices on the same table are built concurrently.
+    house_indices = [
+        ('house: House number trigram index', 'CREATE INDEX IF NOT EXISTS house_trgm_idx ON public.oa_house USING GIN (housenumber gin_trgm_ops);', clustered),
+        ('house: Spatial index on location',  'CREATE INDEX IF NOT EXISTS house_location_idx ON public.oa_house USING GIST(location);', clustered),
+        ('house: Btree index house number',   'CREATE INDEX IF NOT EXISTS house_housenumber_idx ON public.oa_house USING BTREE(housenumber);', clustered),
+        ('house: Btree index id',             'CREATE INDEX IF NOT EXISTS house_id_idx ON public.oa_house USING BTREE(id);', clustered),
+        ('house: Btree index content key',    'CREATE INDEX IF NOT EXISTS house_key_idx ON public.oa_house USING BTREE("key");', clustered),
+    ]
+    city_indices = [
+        ('city: Trigram index name',          'CREATE INDEX IF NOT EXISTS city_trgm_idx ON public.oa_city USING GIN (city gin_trgm_ops);', []),
+        ('city: Btree Postcode',              'CREATE INDEX IF NOT EXISTS city_postcode_idx ON public.oa_city USING BTREE(postcode);', []),
+        ('city: Btree name',                  'CREATE INDEX IF NOT EXISTS city_city_idx ON public.oa_city USING BTREE(city);', []),
+        ('city: Trigram index postcode',      'CREATE INDEX IF NOT EXISTS city_postcode_trgm_idx ON public.oa_city USING GIN (postcode gin_trgm_ops);', []),
+        ('city: Btree content key',           'CREATE INDEX IF NOT EXISTS city_key_idx ON public.oa_city USING BTREE("key");', []),
+        ('city: Btree license',               'CREATE INDEX IF NOT EXISTS city_license_id_idx ON public.oa_city USING BTREE(license_id);', []),
+    ]
+    street_indices = [
+        ('street: Trigram index name',        'CREATE INDEX IF NOT EXISTS street_trgm_idx ON public.oa_street USING GIN (street gin_trgm_ops);', ['street: Extent from houses']),
+        ('street: Btree content key',         'CREATE INDEX IF NOT EXISTS street_key_idx ON public.oa_street USING BTREE("key");', ['street: Extent from houses']),
+        ('street: Spatial index on extent',   'CREATE INDEX IF NOT EXISTS street_extent_idx ON public.oa_street USING GIST(extent);', ['street: Extent from houses']),
     ]
 
-    for log, item in sql:
-        print(' - {}'.format(log))
-        db.execute(item)
-
-    print('Clustering house tables...')
-    queue = []
-    for i in range(0, PARTITION_SIZE):
-        queue.append((i, url))
-
-    # run and wait for all import threads to exit
-    if threads == 1:
-        for f in queue:
-            cluster_worker(*f)
-    else:
-        with Pool(threads, maxtasksperchild=1) as p:
-            p.starmap(cluster_worker, queue, 1)
-    print('ok')
+    print('Clustering house tables and adding indices...')
+    run_jobs(url, clusters + house_indices + city_indices + [
+        ('street: Extent from houses',        'UPDATE public.oa_street s SET extent = x.extent FROM (SELECT street_id, gis.ST_SetSRID(gis.ST_Extent(location), 3857) AS extent FROM public.oa_house GROUP BY street_id) x WHERE s.id = x.street_id;', clustered),
+    ] + street_indices + [
+        ('house: Update planner statistics',  'ANALYZE public.oa_house;', [name for name, _, _ in house_indices]),
+        ('city: Update planner statistics',   'ANALYZE public.oa_city;', [name for name, _, _ in city_indices]),
+        ('street: Update planner statistics', 'ANALYZE public.oa_street;', [name for name, _, _ in street_indices]),
+    ], threads, budget)
 
     finalize_db(db)
 
@@ -252,13 +644,108 @@ def close_db(db):
     db.close()
     conn.close()
 
+def reserve_ids(db, sequence, count):
+    """Reserve a consecutive block of ``count`` ids from ``sequence``, returns the first id"""
+    if count == 0:
+        return None
+
+    # sequence functions are not transactional, so the lock is only held while
+    # moving the sequence forward, not until the import transaction commits
+    db.execute('SELECT pg_advisory_lock(hashtext(%s));', (sequence,))
+    db.execute('SELECT nextval(%s);', (sequence,))
+    first = db.fetchone()[0]
+    if count > 1:
+        db.execute('SELECT setval(%s, %s);', (sequence, first + count - 1))
+    db.execute('SELECT pg_advisory_unlock(hashtext(%s));', (sequence,))
+
+    return first
+
+class IdBlocks:
+    """Hand out ids from ``sequence``, reserving them in blocks of ``size``"""
+
+    def __init__(self, db, sequence, size):
+        self.db = db
+        self.sequence = sequence
+        self.size = max(1, size)
+        self.current = 0
+        self.last = -1
+
+    def next(self):
+        if self.current > self.last:
+            self.current = reserve_ids(self.db, self.sequence, self.size)
+            self.last = self.current + self.size - 1
+        result = self.current
+        self.current += 1
+        return result
+
+def load_import_state(db):
+    """Import state of all files, returns a dict of file name to a list of (shard, shards, checksum, status)"""
+    db.execute('SELECT file, shard, shards, checksum, status FROM public.oa_import_state ORDER BY file, shard;')
+    result = {}
+    for file, shard, shards, checksum, status in db.fetchall():
+        result.setdefault(file, []).append((shard, shards, checksum, status))
+    return result
+
+def start_import(db, name, shard, shards, checksum):
+    """Record that a file (shard) is being imported, committed right away so a crash leaves a trace"""
+    db.execute('''
+        INSERT INTO public.oa_import_state (file, shard, shards, checksum, status, started)
+        VALUES (%(file)s, %(shard)s, %(shards)s, %(checksum)s, 'running', now())
+        ON CONFLICT (file, shard) DO UPDATE SET
+            shards = EXCLUDED.shards,
+            checksum = EXCLUDED.checksum,
+            status = EXCLUDED.status,
+            cities = NULL,
+            streets = NULL,
+            houses = NULL,
+            started = EXCLUDED.started,
+            finished = NULL;
+    ''', dict(file=name, shard=shard, shards=shards, checksum=checksum))
+    db.connection.commit()
+
+def finish_import(db, name, shard, counts):
+    db.execute('''
+        UPDATE public.oa_import_state
+        SET status = 'done', cities = %(cities)s, streets = %(streets)s, houses = %(houses)s, finished = clock_timestamp()
+        WHERE file = %(file)s AND shard = %(shard)s;
+    ''', dict(file=name, shard=shard, cities=counts[0], streets=counts[1], houses=counts[2]))
+
+def remove_shard(db, name, license_id, shard=0, shards=1):
+    """Delete the rows a (partial) import of a file or one of its shards left behind"""
+    params = dict(file=name, license_id=license_id, shard=shard, shards=shards)
+    in_shard = 'c.license_id = %(license_id)s AND (c."key" %% %(shards)s + %(shards)s) %% %(shards)s = %(shard)s'
+    db.execute('''
+        DELETE FROM public.oa_house h
+        USING public.oa_street s, public.oa_city c
+        WHERE h.street_id = s.id AND s.city_id = c.id AND {in_shard};
+        DELETE FROM public.oa_street s
+        USING public.oa_city c
+        WHERE s.city_id = c.id AND {in_shard};
+        DELETE FROM public.oa_city c
+        WHERE {in_shard};
+    '''.format(in_shard=in_shard), params)
+    if shards == 1:
+        db.execute('DELETE FROM public.oa_import_state WHERE file = %(file)s;', params)
+    else:
+        db.execute('DELETE FROM public.oa_import_state WHERE file = %(file)s AND shard = %(shard)s;', params)
+
 #
 # Data importer
 #
 
-def save_license(record, db):
-    sql = 'INSERT INTO public.oa_license (website, license, attribution, "source") VALUES (%s, %s, %s, %s) RETURNING id;'
+def save_license(record, fname, db):
+    # the id is derived from the file name, so re-imports keep referencing the same license
+    sql = '''
+        INSERT INTO public.oa_license (id, website, license, attribution, "source") VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (id) DO UPDATE SET
+            website = EXCLUDED.website,
+            license = EXCLUDED.license,
+            attribution = EXCLUDED.attribution,
+            "source" = EXCLUDED."source"
+        RETURNING id;
+    '''
     db.execute(sql, (
+        str(uuid.uuid5(LICENSE_NAMESPACE, fname)),
         record['website'],
         record['license'],
         record['attribution'],
@@ -274,7 +761,7 @@ def import_licenses(license_data, db):
         'license': 'Open Data Commons Open Database License (ODbL)',
         'attribution': '© OpenStreetMap contributors',
         'website': 'https://www.openstreetmap.org/copyright'
-    }, db)
+    }, 'osm', db)
 
     lines = license_data.split(b"\n")[2:] # skip header
 
@@ -297,7 +784,7 @@ def import_licenses(license_data, db):
             # if record['license'] == 'Unknown':
             #     continue
             fname = record['file'] + '.csv'
-            licenses[fname] = save_license(record, db)
+            licenses[fname] = save_license(record, fname, db)
             print('Saved license for {}: {}'.format(
                 fname, licenses[fname]
             ))
@@ -335,264 +822,601 @@ def import_license_from_readme(readme_data, fname, db):
             if a != 'Yes':
                 record['attribution'] = a
 
-    licenses[fname] = save_license(record, db)
+    licenses[fname] = save_license(record, fname, db)
     print('Saved license for {}: {}'.format(
         fname, licenses[fname]
     ))
     return licenses
 
 
-def import_csv(csv_stream, size, license_id, name, db, line):
-    # space optimization, reference these strings instead of copying them
-    key_city = intern('city')
-    key_streets = intern('streets')
-    key_street = intern('street')
-    key_houses = intern('houses')
-    key_id = intern('id')
-
-    print("\033[{line};0H\033[KPreparing data for {name}, 0%...".format(line=line, name=name))
+def create_diff_staging(db):
+    """
+    Temporary staging table for a diff import, cities, streets and houses share
+    one table (told apart by ``kind``) so they can be loaded with one COPY
+    """
+    db.execute('''
+        CREATE TEMPORARY TABLE oa_new (
+            kind "char",
+            "key" bigint,
+            parent_key bigint,
+            a TEXT, b TEXT, c TEXT, d TEXT,
+            location gis.geometry(POINT, 3857),
+            geohash TEXT
+        ) ON COMMIT DROP;
+    ''')
 
-    # projection setup, we need WebMercator
-    mercProj = Proj(init='epsg:3857')
 
-    # Wrap the byte stream into a TextIOWrapper, we have subclassed it to count
-    # the consumed bytes for progress display
-    wrapped = CountingTextIOWrapper(csv_stream, encoding='utf8')
-    reader = csv.reader(wrapped)
+def apply_diff(db, license_id, shard=0, shards=1):
+    """
+    Apply only the inserted, changed and deleted rows staged in ``oa_new`` (see
+    ``create_diff_staging``) to the imported data of one source, or the cities
+    of one shard of it.
 
-    # skip header
-    reader.__next__()
+    Rows are matched by their content key, so unchanged rows keep their ids and
+    all indices stay in place. The word counts of the wordlist are updated by the
+    difference of the counts of the source before and after, the address completion
+    keys of deleted and moved houses are replaced.
+    Returns a list of (description, row count) tuples.
+    """
+    db.execute('''
+        CREATE TEMPORARY TABLE oa_city_new ON COMMIT DROP AS
+            SELECT "key", a AS city, b AS district, c AS region, d AS postcode FROM oa_new WHERE kind = 'c';
+        CREATE TEMPORARY TABLE oa_street_new ON COMMIT DROP AS
+            SELECT "key", parent_key AS city_key, a AS street, b AS unit FROM oa_new WHERE kind = 's';
+        CREATE TEMPORARY TABLE oa_house_new ON COMMIT DROP AS
+            SELECT "key", parent_key AS street_key, location, a AS housenumber, geohash FROM oa_new WHERE kind = 'h';
+        DROP TABLE oa_new;
+    ''')
 
-    cities = {}
-    timeout = time() # status update timeout
-    for row in reader:
-        row = [s.title() for s in row]
-
-        # build a street hash
-        strt = intern(hashlib.md5(
-            (row[3] +
-            row[4]).encode('utf8')
-        ).hexdigest())
-
-        # build city hash
-        cty = intern(hashlib.md5(
-            (row[5] +
-            row[6] +
-            row[7] +
-            row[8]).encode('utf8')
-        ).hexdigest())
-
-        # add city if not already in the list
-        if cty not in cities:
-            cities[cty] = {
-                key_id: str(uuid.uuid4()),
-                key_city: (
-                    row[5],
-                    row[6],
-                    row[7],
-                    row[8].upper()
-                ),
-                key_streets: {}
-            }
+    # current rows of this source
+    db.execute('''
+        CREATE INDEX ON oa_city_new ("key");
+        CREATE INDEX ON oa_street_new ("key");
+        CREATE INDEX ON oa_house_new ("key");
+        ANALYZE oa_city_new;
+        ANALYZE oa_street_new;
+        ANALYZE oa_house_new;
+
+        CREATE TEMPORARY TABLE oa_city_old ON COMMIT DROP AS
+            SELECT c.id, c."key" FROM public.oa_city c WHERE c.license_id = %(license_id)s AND (c."key" %% %(shards)s + %(shards)s) %% %(shards)s = %(shard)s;
+        CREATE TEMPORARY TABLE oa_street_old ON COMMIT DROP AS
+            SELECT s.id, s."key" FROM public.oa_street s JOIN oa_city_old c ON s.city_id = c.id;
+        CREATE TEMPORARY TABLE oa_house_old ON COMMIT DROP AS
+            SELECT h.id, h."key", h.street_id FROM public.oa_house h JOIN oa_street_old s ON h.street_id = s.id;
+        ANALYZE oa_city_old;
+        ANALYZE oa_street_old;
+        ANALYZE oa_house_old;
+    ''', dict(license_id=license_id, shard=shard, shards=shards))
+
+    # wordlists built before the regional counts existed have to be rebuilt to be updated
+    db.execute("SELECT to_regclass('public.wordlist_region') IS NOT NULL;")
+    update_words = db.fetchone()[0]
+    if update_words:
+        db.execute(
+            'CREATE TEMPORARY TABLE _word_delta ON COMMIT DROP AS '
+            'SELECT x.region COLLATE "C" AS region, x.word, -x.ct AS ct FROM (' + OA_WORD_COUNTS + ') x;',
+            dict(license_id=license_id, shard=shard, shards=shards)
+        )
+
+    # address completion keys of houses that are deleted or moved (the region depends on
+    # the location), changed addresses have a new content key and are deleted too
+    db.execute("SELECT to_regclass('public.address_completion') IS NOT NULL;")
+    update_completion = db.fetchone()[0]
+    if update_completion:
+        db.execute('''
+            CREATE TEMPORARY TABLE oa_house_changed ON COMMIT DROP AS
+                SELECT o.id
+                FROM oa_house_old o
+                JOIN public.oa_house h ON h.street_id = o.street_id AND h.id = o.id
+                LEFT JOIN oa_house_new n ON n."key" = o."key"
+                WHERE n."key" IS NULL OR NOT gis.ST_OrderingEquals(h.location, n.location);
+            ANALYZE oa_house_changed;
+            DELETE FROM public.address_completion a
+            USING oa_house_changed o
+            WHERE a.source = 'a' AND a.id = o.id;
+        ''')
+        completion_deleted = db.rowcount
 
-        # add street if not already in the list
-        if strt not in cities[cty][key_streets]:
-            cities[cty][key_streets][strt] = {
-                key_id: str(uuid.uuid4()),
-                key_street: (
-                    row[3],
-                    row[4],
-                ),
-                key_houses: {}
-            }
+    sql = [
+        ('houses deleted', '''
+            DELETE FROM public.oa_house h
+            USING oa_house_old o
+            WHERE
+                h.street_id = o.street_id
+                AND h.id = o.id
+                AND NOT EXISTS (SELECT 1 FROM oa_house_new n WHERE n."key" = o."key");
+        '''),
+        ('houses moved', '''
+            UPDATE public.oa_house h SET location = n.location, geohash = n.geohash
+            FROM oa_house_old o
+            JOIN oa_house_new n ON n."key" = o."key"
+            WHERE
+                h.street_id = o.street_id
+                AND h.id = o.id
+                AND NOT gis.ST_OrderingEquals(h.location, n.location);
+        '''),
+        ('streets deleted', '''
+            DELETE FROM public.oa_street s
+            USING oa_street_old o
+            WHERE s.id = o.id AND NOT EXISTS (SELECT 1 FROM oa_street_new n WHERE n."key" = o."key");
+        '''),
+        ('cities deleted', '''
+            DELETE FROM public.oa_city c
+            USING oa_city_old o
+            WHERE c.id = o.id AND NOT EXISTS (SELECT 1 FROM oa_city_new n WHERE n."key" = o."key");
+        '''),
+        ('cities inserted', '''
+            INSERT INTO public.oa_city ("key", city, district, region, postcode, license_id)
+            SELECT n."key", n.city, n.district, n.region, n.postcode, %(license_id)s
+            FROM oa_city_new n
+            WHERE NOT EXISTS (SELECT 1 FROM oa_city_old o WHERE o."key" = n."key");
+        '''),
+        ('streets inserted', '''
+            INSERT INTO public.oa_street ("key", street, unit, city_id)
+            SELECT n."key", n.street, n.unit, c.id
+            FROM oa_street_new n
+            JOIN public.oa_city c ON c."key" = n.city_key AND c.license_id = %(license_id)s
+            WHERE NOT EXISTS (SELECT 1 FROM oa_street_old o WHERE o."key" = n."key");
+        '''),
+        ('houses inserted', '''
+            INSERT INTO public.oa_house ("key", location, housenumber, geohash, "source", street_id)
+            SELECT n."key", n.location, n.housenumber, n.geohash, 'openaddresses.io', s.id
+            FROM oa_house_new n
+            JOIN public.oa_street s ON s."key" = n.street_key
+            JOIN public.oa_city c ON s.city_id = c.id AND c.license_id = %(license_id)s
+            WHERE NOT EXISTS (SELECT 1 FROM oa_house_old o WHERE o."key" = n."key");
+        '''),
+        ('street extents updated', '''
+            UPDATE public.oa_street s SET extent = x.extent
+            FROM (
+                SELECT h.street_id, gis.ST_SetSRID(gis.ST_Extent(h.location), 3857) AS extent
+                FROM public.oa_house h
+                JOIN public.oa_street st ON h.street_id = st.id
+                JOIN public.oa_city c ON st.city_id = c.id
+                WHERE c.license_id = %(license_id)s AND (c."key" %% %(shards)s + %(shards)s) %% %(shards)s = %(shard)s
+                GROUP BY h.street_id
+            ) x
+            WHERE s.id = x.street_id AND s.extent IS DISTINCT FROM x.extent;
+        '''),
+    ]
 
-        # add house to street
-        cities[cty][key_streets][strt][key_houses][row[2]] = (row[0], row[1])
+    result = []
+    for log, item in sql:
+        db.execute(item, dict(license_id=license_id, shard=shard, shards=shards))
+        result.append((log, db.rowcount))
 
+    # keys of the inserted and moved houses (see address_completion/001)
+    if update_completion:
+        db.execute('''
+            INSERT INTO public.address_completion (key, region, source, id, road, house_number, postcode, city, geometry)
+            SELECT k.key, public._word_region(h.location), 'a', h.id, trim(s.street), trim(h.housenumber), NULLIF(trim(c.postcode), ''), NULLIF(trim(c.city), ''), h.location
+            FROM public.oa_house h
+            JOIN public.oa_street s ON h.street_id = s.id
+            JOIN public.oa_city c ON s.city_id = c.id
+            CROSS JOIN LATERAL public.address_keys(trim(s.street), trim(h.housenumber), trim(c.postcode), trim(c.city)) k(key)
+            WHERE
+                c.license_id = %(license_id)s AND (c."key" %% %(shards)s + %(shards)s) %% %(shards)s = %(shard)s
+                AND trim(s.street) <> ''
+                AND (
+                    NOT EXISTS (SELECT 1 FROM oa_house_old o WHERE o.id = h.id)
+                    OR EXISTS (SELECT 1 FROM oa_house_changed o WHERE o.id = h.id)
+                );
+        ''', dict(license_id=license_id, shard=shard, shards=shards))
+        result.append(('address completion keys deleted', completion_deleted))
+        result.append(('address completion keys inserted', db.rowcount))
+
+    if update_words:
+        db.execute(
+            'INSERT INTO _word_delta SELECT x.region, x.word, x.ct FROM (' + OA_WORD_COUNTS + ') x;',
+            dict(license_id=license_id, shard=shard, shards=shards)
+        )
+        db.execute('SELECT public._apply_word_delta();')
+        db.execute('SELECT count(*) FROM (SELECT word FROM _word_delta GROUP BY word HAVING sum(ct) <> 0) x;')
+        result.append(('word counts updated', db.fetchone()[0]))
+    return result
+
+
+def read_rows(reader, wrapped, size, name, line, shard=0, shards=1):
+    """
+    Normalize the CSV rows and prefix them with their content keys, so sorting the
+    rows groups them by city, then street, then house.
+
+    When a file is split into ``shards`` only the rows of the cities belonging
+    to ``shard`` are returned, every city with its streets and houses is imported
+    by exactly one shard.
+    """
+    timeout = time() # status update timeout
+    for row in reader:
         # status update
         if time() - timeout > 1.0:
             percentage = round(wrapped.position / size * 100.0, 2)
             print("\033[{line};0H\033[KPreparing data for {name}, {percentage} %...".format(
-                line=line, name=name, percentage=percentage
+                line=line, name=shard_label(name, shard, shards), percentage=percentage
             ))
+            telemetry('read', file=name, shard=shard, bytes=wrapped.position, size=size, percentage=percentage, peak_memory=peak_memory())
             timeout = time()
 
+        # content keys: city by source and address parts, street by city, house by street
+        # and number. These are stable over re-imports and used to find changed rows.
+        # The city is keyed first so rows of other shards are skipped before normalizing.
+        city, district, region = (s.strip().title() for s in row[5:8])
+        postcode = row[8].strip().title().upper()
+        cty = content_key(name, city, district, region, postcode)
+        if cty % shards != shard:
+            continue
+
+        row = [s.strip().title() for s in row[:5]]
+        strt = content_key(cty, row[3], row[4])
+        yield (
+            cty, strt, content_key(strt, row[2]),
+            row[0], row[1],                  # lon, lat
+            row[2],                          # house number
+            row[3], row[4],                  # street, unit
+            city, district, region, postcode # city, district, region, postcode
+        )
+
+
+def shard_label(name, shard, shards):
+    if shards == 1:
+        return name
+    return '{} [{}/{}]'.format(name, shard + 1, shards)
+
+
+def spill_rows(rows, buffer_size):
+    """
+    Write a sorted run of rows to a temporary file, returns the unbuffered file
+    so waiting runs do not hold on to a buffer
+    """
+    raw = TemporaryFile(buffering=0)
+    fp = io.TextIOWrapper(io.BufferedWriter(raw, buffer_size), encoding='utf8', newline='')
+    csv.writer(fp).writerows(rows)
+    fp.flush()
+    fp.detach().detach()
+    raw.seek(0)
+    return raw
+
+
+def read_run(raw, buffer_size):
+    with io.TextIOWrapper(io.BufferedReader(raw, buffer_size), encoding='utf8', newline='') as fp:
+        for row in csv.reader(fp):
+            yield (int(row[0]), int(row[1]), int(row[2])) + tuple(row[3:])
+
+
+def merge_runs(runs, buffer_size):
+    """Merge the sorted runs written by ``spill_rows``, removes the files when done"""
+    try:
+        # heapq.merge is stable, duplicate keys keep the order they had in the input
+        yield from heapq.merge(*[read_run(raw, buffer_size) for raw in runs], key=SORT_KEY)
+    finally:
+        for raw in runs:
+            raw.close()
+
+
+def sort_rows(rows, chunk_rows):
+    """
+    Sort rows by their content keys in bounded memory: chunks of ``chunk_rows`` are
+    sorted in memory and spilled to disk, then merged again.
+
+    The merge reads at most ``MERGE_FAN_IN`` runs at once (more runs are merged in
+    several passes) and their buffers share the memory of a chunk, so the memory
+    does not grow with the size of the file.
+
+    Returns the number of rows, the number of spilled chunks and an iterator over the sorted rows.
+    """
+    # one more buffer for writing the runs of a merge pass
+    buffer_size = max(MIN_RUN_BUFFER, chunk_rows * ROW_SIZE // (MERGE_FAN_IN + 1))
+    runs = []
+    chunk = []
+    count = 0
+    for row in rows:
+        chunk.append(row)
+        count += 1
+        if len(chunk) >= chunk_rows:
+            chunk.sort(key=SORT_KEY)
+            runs.append(spill_rows(chunk, buffer_size))
+            chunk = []
+    chunk.sort(key=SORT_KEY)
+
+    if len(runs) == 0:
+        # fits into memory, no need to touch the disk
+        return count, 0, iter(chunk)
+
+    if len(chunk) > 0:
+        runs.append(spill_rows(chunk, buffer_size))
+    del chunk
+    spilled = len(runs)
+
+    while len(runs) > MERGE_FAN_IN:
+        runs = [
+            spill_rows(merge_runs(runs[i:i + MERGE_FAN_IN], buffer_size), buffer_size)
+            for i in range(0, len(runs), MERGE_FAN_IN)
+        ]
+    return count, spilled, merge_runs(runs, buffer_size)
+
+
+def peak_memory():
+    """Peak resident set size of this process in MB"""
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return round(rss / 1024, 1)
+
+
+def import_csv(csv_stream, size, license_id, name, db, line, diff=False, chunk_rows=None, db_url=None, shard=0, shards=1):
+    if chunk_rows is None:
+        chunk_rows = MEMORY_LIMIT * 1024 * 1024 // ROW_SIZE
+    label = shard_label(name, shard, shards)
+    import_start = time()
+
+    print("\033[{line};0H\033[KPreparing data for {name}, 0%...".format(line=line, name=label))
+
+    # projection setup, we need WebMercator
+    mercProj = Proj(init='epsg:3857')
+
+    # Wrap the byte stream into a TextIOWrapper, we have subclassed it to count
+    # the consumed bytes for progress display
+    wrapped = CountingTextIOWrapper(csv_stream, encoding='utf8')
+    reader = csv.reader(wrapped)
+
+    # skip header
+    reader.__next__()
+
+    # sorting by content keys groups the rows by city and street, so only the
+    # current city and street have to be kept in memory while inserting
+    total, spilled, rows = sort_rows(read_rows(reader, wrapped, size, name, line, shard, shards), chunk_rows)
+
     # force cleaning up to avoid memory bloat
     del reader
     del wrapped
     del csv_stream
 
-    # create a new temporary file for the house data as we use the postgres COPY command with that
-    # for speed reasons
-    city_file   = TemporaryFile(mode='w+', buffering=16*1024*1024)
-    street_file = TemporaryFile(mode='w+', buffering=16*1024*1024)
-    house_file  = TemporaryFile(mode='w+', buffering=16*1024*1024)
+    # rows are streamed straight into the database with binary COPY, full imports
+    # run one COPY per table on its own connection, diff imports stage all rows
+    # in one temporary table on the worker connection
+    if diff:
+        create_diff_staging(db)
+        staging = CopyStream(db, 'oa_new', DIFF_COLUMNS)
+        streams = [staging]
+    else:
+        copy_dbs = [open_db(db_url) for _ in range(3)]
+        city_stream = CopyStream(copy_dbs[0], 'public.oa_city', CITY_COLUMNS)
+        street_stream = CopyStream(copy_dbs[1], 'public.oa_street', STREET_COLUMNS)
+        house_stream = CopyStream(copy_dbs[2], 'public.oa_house', HOUSE_COLUMNS)
+        streams = [city_stream, street_stream, house_stream]
 
     # start insertion cycle
-    print("\033[{line};0H\033[KInserting data for {name}...".format(line=line, name=name))
+    print("\033[{line};0H\033[KInserting data for {name}{spilled}...".format(
+        line=line,
+        name=label,
+        spilled=', merging {} chunks'.format(spilled) if spilled > 0 else ''
+    ))
 
-    city_count = 0
+    if not diff:
+        # ids are reserved in blocks while inserting, the number of distinct cities and
+        # streets is only known at the end. The row count caps the block size so small
+        # files do not leave big gaps.
+        city_ids = IdBlocks(db, 'public.oa_city_id_seq', min(ID_BLOCK_SIZE, total))
+        street_ids = IdBlocks(db, 'public.oa_street_id_seq', min(ID_BLOCK_SIZE, total))
+        house_ids = IdBlocks(db, 'public.oa_house_id_seq', min(ID_BLOCK_SIZE, total))
+
+    houses = []
+    def write_houses():
+        # project into 3857 (mercator) from 4326 (WGS84) and encode the whole
+        # batch at once, per point python calls are the bottleneck here
+        lon = np.array([row[3] for row, _ in houses], dtype=np.float64)
+        lat = np.array([row[4] for row, _ in houses], dtype=np.float64)
+        wkbs, hashes = encode_houses(mercProj, lon, lat)
+
+        counts[2] += len(houses)
+        for (row, street_id), wkb, hsh in zip(houses, wkbs, hashes):
+            if diff:
+                staging.write(('h', row[2], row[1], row[5], None, None, None, wkb, hsh))
+            else:
+                house_stream.write((house_ids.next(), row[2], wkb, row[5], hsh, 'openaddresses.io', street_id))
+        houses.clear()
+
+    city_key = None
+    street_key = None
+    street_id = None
+    pending = None # last row of the current house, duplicate house numbers keep the last location
+    counts = [0, 0, 0] # cities, streets, houses
+    processed = 0
     row_count = 0
     timeout = time()
     start = timeout
-    for key, item in cities.items():
-        city_count += 1
-
-        # save city to temp file and fetch the id
-        row_count += 1
-        city_file.write(item[key_id])
-        for value in item[key_city]:
-            city_file.write('\t')
-            if value is not None and value != '':
-                city_file.write(value.replace('\\', '\\x5c'))
-            else:
-                city_file.write(' ')
-        city_file.write('\t')
-        city_file.write(license_id)
-        city_file.write('\n')
-
-        city_id = item[key_id]
-
-        # save street to temp file and fetch ids
-        for street in item[key_streets].values():
-            row_count += 1
-
-            # we need the id
-            street_file.write(street[key_id])
-            for value in street[key_street]:
-                street_file.write('\t')
-                if value is not None and value != '':
-                    street_file.write(value.replace('\\', '\\x5c'))
-                else:
-                    street_file.write(' ')
-            street_file.write('\t')
-            street_file.write(city_id)
-            street_file.write('\n')
+    try:
+        for row in rows:
+            processed += 1
 
-            street_id = street[key_id]
-
-            # houses will not be inserted right away but saved to the temp file
-            for nr, location in street[key_houses].items():
+            # houses are encoded in batches
+            if pending is not None and pending[0][2] != row[2]:
                 row_count += 1
+                houses.append(pending)
+                if len(houses) >= HOUSE_BATCH:
+                    write_houses()
 
-                # project into 3857 (mercator) from 4326 (WGS84)
-                x, y = mercProj(*location)
-
-                # id
-                house_file.write(str(uuid.uuid4()))
-                house_file.write('\t')
-
-                # create wkb representation, theoretically we could use shapely
-                # but we try to not spam newly created objects here
-
-                # ewkb header + srid
-                house_file.write('0101000020110F0000')
-
-                # coordinate
-                house_file.write((hexlify(struct.pack('<d', x)) + hexlify(struct.pack('<d', y))).decode('ascii'))
-
-                # house number field
-                house_file.write('\t')
-                if nr != '':
-                    house_file.write(nr.replace('\\', '\\x5c'))
+            # diff imports match rows by key and get their ids from the DB
+            if row[0] != city_key:
+                city_key = row[0]
+                row_count += 1
+                counts[0] += 1
+                if diff:
+                    staging.write(('c', city_key, None) + row[8:12] + (None, None))
                 else:
-                    house_file.write(' ')
+                    city_id = city_ids.next()
+                    city_stream.write((city_id, city_key) + row[8:12] + (license_id,))
 
-                # geohash
-                house_file.write('\t')
-                house_file.write(geohash.encode(float(location[0]), float(location[1])))
-
-                # source
-                house_file.write('\t')
-                house_file.write('openaddresses.io')
-
-                # street_id field
-                house_file.write('\t')
-                house_file.write(str(street_id))
+            if row[1] != street_key:
+                street_key = row[1]
+                row_count += 1
+                counts[1] += 1
+                if diff:
+                    staging.write(('s', street_key, city_key) + row[6:8] + (None, None, None, None))
+                else:
+                    street_id = street_ids.next()
+                    street_stream.write((street_id, street_key) + row[6:8] + (city_id,))
 
-                # next record
-                house_file.write('\n')
+            pending = (row, street_id)
 
             # status update
             if time() - timeout > 1.0:
-                eta = round((len(cities) / city_count * (time() - start)) - (time() - start))
-                percentage = round((city_count / len(cities) * 100), 2)
+                eta = round((total / processed * (time() - start)) - (time() - start))
+                percentage = round((processed / total * 100), 2)
                 print("\033[{line};0H\033[K - {name:40}, {percentage:>6}%, {row_count:>6} rows/second, eta: {eta:>5} seconds".format(
                     line=line,
-                    name=name,
+                    name=label,
                     percentage=percentage,
                     row_count=row_count,
                     eta=eta
                 ))
+                telemetry(
+                    'insert', file=name, shard=shard, rows=processed, total=total, percentage=percentage,
+                    rows_per_second=round(row_count / (time() - timeout)), eta=eta, peak_memory=peak_memory()
+                )
                 row_count = 0
                 timeout = time()
 
-    del cities
-
-    # now COPY the contents of the temp file into the DB
-    print("\033[{line};0H\033[K -> Running copy from tempfile for city ({size} MB)...".format(
-        line=line,
-        size=round(city_file.tell() / 1024 / 1024, 2)
-    ))
-    city_file.seek(0)
-    db.copy_from(city_file, 'public.oa_city', columns=('id', 'city', 'district', 'region', 'postcode', 'license_id'))
-
-    print("\033[{line};0H\033[K -> Running copy from tempfile for street ({size} MB)...".format(
-        line=line,
-        size=round(street_file.tell() / 1024 / 1024, 2)
-    ))
-    street_file.seek(0)
-    db.copy_from(street_file, 'public.oa_street', columns=('id', 'street', 'unit', 'city_id'))
+        if pending is not None:
+            houses.append(pending)
+        if len(houses) > 0:
+            write_houses()
+        del rows
+
+        print("\033[{line};0H\033[K -> Finishing copy for {name}...".format(line=line, name=label))
+        for stream in streams:
+            telemetry('copy', file=name, shard=shard, **stream.close())
+    except BaseException:
+        for stream in streams:
+            stream.abort()
+        if not diff:
+            for copy_db in copy_dbs:
+                copy_db.connection.rollback()
+                close_db(copy_db)
+        raise
+
+    if diff:
+        print("\033[{line};0H\033[K -> Applying changes for {name} ({rows} rows)...".format(
+            line=line,
+            name=label,
+            rows=staging.rows
+        ))
+        apply_start = time()
+        changes = apply_diff(db, license_id, shard, shards)
+        telemetry(
+            'import', file=name, shard=shard, diff=True, cities=counts[0], streets=counts[1], houses=counts[2],
+            spilled_chunks=spilled, changes=dict((log, count) for log, count in changes),
+            apply_seconds=round(time() - apply_start, 3), seconds=round(time() - import_start, 3), peak_memory=peak_memory()
+        )
+        print("\033[{line};0H\033[K -> {name}: {changes}, took {elapsed} seconds, peak memory {rss} MB.".format(
+            line=line,
+            name=label,
+            changes=', '.join('{} {}'.format(count, log) for log, count in changes),
+            elapsed=round(time() - start),
+            rss=peak_memory()
+        ))
+        return counts
+
+    # all rows are in, commit the copies. The three commits are not atomic, a crash in between
+    # leaves the file 'running' in oa_import_state and the next run deletes its rows with
+    # remove_shard(). That finds houses only through their street and city, so the copies are
+    # committed in the order cities, streets, houses.
+    for copy_db in copy_dbs:
+        close_db(copy_db)
+    telemetry(
+        'import', file=name, shard=shard, diff=False, cities=counts[0], streets=counts[1], houses=counts[2],
+        spilled_chunks=spilled, seconds=round(time() - import_start, 3), peak_memory=peak_memory()
+    )
 
-    print("\033[{line};0H\033[K -> Running copy from tempfile for house ({size} MB)...".format(
+    print("\033[{line};0H\033[K -> Inserting for {name} took {elapsed} seconds ({cities} cities, {streets} streets, {houses} houses), peak memory {rss} MB.".format(
         line=line,
-        size=round(house_file.tell() / 1024 / 1024, 2)
+        name=label,
+        elapsed=round(time() - start),
+        cities=counts[0],
+        streets=counts[1],
+        houses=counts[2],
+        rss=peak_memory()
     ))
-    house_file.seek(0)
-    db.copy_from(house_file, 'public.oa_house', columns=('id', 'location', 'housenumber', 'geohash', 'source', 'street_id'))
+    return counts
 
-    # cleanup
-    print("\033[{line};0H\033[K -> Inserting for {name} took {elapsed} seconds.".format(
-        line=line,
-        name=name,
-        elapsed=round(time() - start)
-    ))
-    house_file.close()
-    street_file.close()
-    city_file.close()
 
+def import_data(filename, threads, db_url, optimize, fast, partitions, balanced, diff=False, memory=MEMORY_LIMIT, shard_size=SHARD_SIZE):
+    z = zipfile.ZipFile(filename)
+    files = [f for f in z.namelist() if not f.startswith('summary/') and f.endswith('.csv')]
+    files.sort()
 
-def import_data(filename, threads, db_url, optimize, fast):
     # prepare database (drop indices and constraints for speed)
-    db = open_db(args.db_url)
-    prepare_db(db)
+    db = open_db(db_url)
+    bounds = None
+    if balanced and not partitions_exist(db):
+        print('Sampling coordinates for shard bounds...')
+        bounds = partition_bounds(sample_x_coordinates(z, files), partitions)
+    prepare_db(db, partitions, bounds, drop_indices=not diff)
+    if diff:
+        prepare_diff(db)
 
     # insert license data
-    z = zipfile.ZipFile(filename)
-    files = [f for f in z.namelist() if not f.startswith('summary/') and f.endswith('.csv')]
-    files.sort()
     if 'LICENSE.txt' in z.namelist():
         licenses = import_licenses(z.read('LICENSE.txt'), db)
     elif 'README.txt' in z.namelist() and len(files) == 1:
         licenses = import_license_from_readme(z.read('README.txt'), files[0], db)
     else:
         raise ValueError("Data file does not contain LICENSE.txt or README.txt which is required for licensing information")
+    sizes = dict((f, z.getinfo(f).file_size) for f in files)
+    checksums = dict((f, '{:08x}-{}'.format(z.getinfo(f).CRC, z.getinfo(f).file_size)) for f in files)
     z.close()
 
-    close_db(db)
-    sleep(1)
-
     # prepare the work queue
     manager = Manager()
     status_object = manager.dict()
 
+    state = load_import_state(db)
     import_queue = []
     for f in files:
         if f not in licenses.keys():
             print('Skipping {}, no license data'.format(f))
             continue
-        status_object[f] = -1
-        import_queue.append((filename, f, licenses[f], db_url, status_object))
+
+        # split big files into shards that are imported in parallel, there is no
+        # point in having more shards than threads
+        shards = 1
+        if threads > 1 and shard_size > 0:
+            shards = max(1, min(threads, math.ceil(sizes[f] / (shard_size * 1024 * 1024))))
+        todo = list(range(shards))
+
+        previous = state.get(f, [])
+        if len(previous) > 0:
+            done = [shard for shard, _, checksum, status in previous if status == 'done' and checksum == checksums[f]]
+            layout = previous[0][1]
+            same_layout = all(item[1] == layout for item in previous)
+            if same_layout and len(done) == layout:
+                print('Skipping {}, already imported'.format(f))
+                telemetry('skip', file=f, checksum=checksums[f])
+                continue
+
+            if diff:
+                # diff imports are atomic, an unfinished one did not change anything
+                db.execute('DELETE FROM public.oa_import_state WHERE file = %s;', (f,))
+            elif same_layout and len(done) > 0:
+                # continue an interrupted import, only the unfinished shards are imported again
+                shards = layout
+                todo = [shard for shard in range(shards) if shard not in done]
+                print('Continuing {}, re-importing {} of {} shards'.format(f, len(todo), shards))
+                for shard in todo:
+                    remove_shard(db, f, licenses[f], shard, shards)
+            else:
+                print('Replacing {}, previous import is incomplete or from another release'.format(f))
+                remove_shard(db, f, licenses[f])
+
+        for shard in todo:
+            status_object[shard_label(f, shard, shards)] = -1
+            import_queue.append((filename, f, licenses[f], db_url, status_object, diff, memory, shard, shards, checksums[f]))
+
+    close_db(db)
+    sleep(1)
+
+    # biggest jobs first, so no big file is left running alone at the end
+    import_queue.sort(key=lambda item: sizes[item[1]] / item[8], reverse=True)
 
     print("\033[2J")
     status_object['__dummy__'] = 0
@@ -602,20 +1426,21 @@ def import_data(filename, threads, db_url, optimize, fast):
         for f in import_queue:
             worker(*f)
     else:
-        with Pool(threads, maxtasksperchild=1) as p:
+        with Pool(threads, maxtasksperchild=1, initializer=set_telemetry, initargs=(get_telemetry(),)) as p:
             p.starmap(worker, import_queue, 1)
 
     # clear screen, finalize db (re-create constraints and associated indices)
     print("\033[2J\033[1;0H\033[K")
     db = open_db(args.db_url)
-    if not fast:
+    if not fast and not diff:
         finalize_db(db, optimize)
     close_db(db)
 
 
-def worker(filename, name, license_id, db_url, status):
+def worker(filename, name, license_id, db_url, status, diff=False, memory=MEMORY_LIMIT, shard=0, shards=1, checksum=None):
     # wait a random time to make the status line selection robust
     sleep(random.random() * 1.0 + 0.5)
+    label = shard_label(name, shard, shards)
 
     # select which line we want to use to send our status output to
     seen_lines = []
@@ -625,10 +1450,10 @@ def worker(filename, name, license_id, db_url, status):
     seen_lines.sort()
     for idx, l in enumerate(seen_lines):
         if idx != l:
-            status[name] = idx
+            status[label] = idx
             break
-    if status[name] == -1:
-        status[name] = max(seen_lines) + 1
+    if status[label] == -1:
+        status[label] = max(seen_lines) + 1
 
     # open all connections and inputs
     z = zipfile.ZipFile(filename)
@@ -636,14 +1461,17 @@ def worker(filename, name, license_id, db_url, status):
 
     # start the import
     zip_info = z.getinfo(name)
-    import_csv(z.open(name, 'r'), zip_info.file_size, license_id, name, db, status[name])
+    chunk_rows = memory * 1024 * 1024 // ROW_SIZE
+    start_import(db, name, shard, shards, checksum)
+    counts = import_csv(z.open(name, 'r'), zip_info.file_size, license_id, name, db, status[label], diff, chunk_rows, db_url, shard, shards)
 
-    # clean up afterwards
+    # clean up afterwards, diff imports commit the state with the data
+    finish_import(db, name, shard, counts)
     close_db(db)
     z.close()
 
     # free the status line
-    status[name] = -1
+    status[label] = -1
 
 
 #
@@ -694,6 +1522,55 @@ def parse_cmdline():
         action='store_true',
         help='Skip finalizing the Database as this is a multi part import'
     )
+    parser.add_argument(
+        '--diff',
+        dest='diff',
+        default=False,
+        action='store_true',
+        help='Only apply inserted, changed and deleted rows of the files in the data file, indices and constraints are kept'
+    )
+    parser.add_argument(
+        '--memory',
+        type=int,
+        dest='memory',
+        default=MEMORY_LIMIT,
+        help='Memory in MB each import thread may use for sorting rows, larger files are sorted on disk (default: {})'.format(MEMORY_LIMIT)
+    )
+    parser.add_argument(
+        '--shard-size',
+        type=int,
+        dest='shard_size',
+        default=SHARD_SIZE,
+        help='Split CSV files bigger than this many MB into shards that are imported by several threads, 0 disables splitting. Every shard reads and decompresses the whole file, so N shards cost N decompressions (default: {})'.format(SHARD_SIZE)
+    )
+    parser.add_argument(
+        '--partitions',
+        type=int,
+        dest='partitions',
+        default=None,
+        help='Number of shards for the house table, only used when creating the table (default: {} or 4 per thread with --balanced-partitions)'.format(PARTITION_SIZE)
+    )
+    parser.add_argument(
+        '--balanced-partitions',
+        dest='balanced',
+        default=False,
+        action='store_true',
+        help='Calculate shard bounds from the data to be imported, so all shards are about the same size'
+    )
+    parser.add_argument(
+        '--index-memory',
+        type=int,
+        dest='index_memory',
+        default=None,
+        help='Memory in MB shared by the concurrent index builds and clustering jobs of --optimize (default: maintenance_work_mem of the server per thread)'
+    )
+    parser.add_argument(
+        '--telemetry',
+        type=str,
+        dest='telemetry',
+        default=None,
+        help='Append progress and timing events as JSON lines to this file'
+    )
     parser.add_argument(
         'datafile',
         type=str,
@@ -707,15 +1584,19 @@ def parse_cmdline():
 
 if __name__ == '__main__':
     args = parse_cmdline()
+    set_telemetry(args.telemetry)
     if args.clean:
         db = open_db(args.db_url)
         clear_db(db)
         close_db(db)
+    partitions = args.partitions
+    if partitions is None:
+        partitions = max(8, args.threads * 4) if args.balanced else PARTITION_SIZE
     if args.datafile is not None:
-        import_data(args.datafile, args.threads, args.db_url, args.optimize, args.fast)
+        import_data(args.datafile, args.threads, args.db_url, args.optimize, args.fast, partitions, args.balanced, args.diff, args.memory, args.shard_size)
     if args.optimize:
         db = open_db(args.db_url, transaction=False)
-        optimize_db(db, args.threads, args.db_url)
+        optimize_db(db, args.threads, args.db_url, args.index_memory)
         close_db(db)
     if args.finalize:
         db = open_db(args.db_url, transaction=False)
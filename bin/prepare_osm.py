@@ -10,6 +10,8 @@ import subprocess
 import tempfile
 
 from time import time, sleep
+from threading import BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
 try:
     from urllib.parse import urlparse
 except (ImportError, ModuleNotFoundError):
@@ -20,6 +22,32 @@ from pkg_resources import resource_exists, resource_listdir, resource_string
 import psycopg2
 from psycopg2.extras import DictCursor
 
+try:
+    from osmgeocoder.prediction import build_prediction_index
+    from osmgeocoder.maintenance import maintenance_budget, write_index, set_telemetry, telemetry
+except (ImportError, ModuleNotFoundError):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from osmgeocoder.prediction import build_prediction_index
+    from osmgeocoder.maintenance import maintenance_budget, write_index, set_telemetry, telemetry
+
+# tiled optimize steps: default grid size, retries per tile and the
+# coordinate used for the open ends of the outer tiles
+TILE_GRID = 16
+TILE_RETRIES = 3
+TILE_OUTER_BOUND = 1.0e10
+
+# derived tables that are built in the `osm_build` schema and published together
+OPTIMIZE_TABLES = ['osm_struct_house', 'osm_struct_streets', 'osm_struct_cities', 'osm_struct_house_number']
+SEARCH_TABLES = ['osm_struct_search']
+WORDLIST_TABLES = ['wordlist', 'wordlist_region']
+ADDRESS_COMPLETION_TABLES = ['address_completion']
+PUBLISHED_TABLES = OPTIMIZE_TABLES + SEARCH_TABLES + WORDLIST_TABLES + ADDRESS_COMPLETION_TABLES
+
+# publishing waits at most this long for running queries, then tries again
+PUBLISH_LOCK_TIMEOUT = '5s'
+PUBLISH_RETRIES = 20
+LOCK_NOT_AVAILABLE = '55P03'
+
 #
 # DB-Utility functions
 #
@@ -32,42 +60,572 @@ def open_db(url, cursor_name=None):
         cursor = conn.cursor(name=cursor_name)
     return cursor
 
-def load_sql(db, path):
+def open_limited(url, connections):
+    """
+    Open a connection once the ``connections`` semaphore allows another one, all
+    steps, tiles and jobs of ``run_steps`` share it. Close with ``close_limited``.
+    """
+    if connections is not None:
+        connections.acquire()
+    try:
+        return open_db(url)
+    except Exception:
+        if connections is not None:
+            connections.release()
+        raise
+
+def close_limited(db, connections):
+    try:
+        close_db(db)
+    finally:
+        if connections is not None:
+            connections.release()
+
+def sql_files(path):
+    """
+    Return a sorted list of ``(name, sql)`` tuples for all SQL files in ``path``
+    """
     try:
         # assume we are in a virtualenv first
         if resource_exists('osmgeocoder', path):
-            sql_files = list(resource_listdir('osmgeocoder', path))
-            sql_files.sort()
-            for f in sql_files:
-                print('Executing {}... '.format(os.path.basename(f)), end='', flush=True)
-                start = time()
-                db.execute(resource_string('osmgeocoder', os.path.join(path, f)))
-                end = time()
-                print('{} s'.format(round(end-start, 2)), flush=True)
+            files = sorted(f for f in resource_listdir('osmgeocoder', path) if f.endswith('.sql'))
+            return [
+                (os.path.basename(f), resource_string('osmgeocoder', os.path.join(path, f)).decode('utf-8'))
+                for f in files
+            ]
     except (ImportError, ModuleNotFoundError):
-        # if not found, assume we have been started from a source checkout
-        my_dir = os.path.dirname(os.path.abspath(__file__))
-        sql_path = os.path.abspath(os.path.join(my_dir, '../osmgeocoder/', path))
-        sql_files = [os.path.join(sql_path, f) for f in os.listdir(sql_path) if os.path.isfile(os.path.join(sql_path, f))]
-        sql_files.sort()
+        pass
+
+    # if not found, assume we have been started from a source checkout
+    my_dir = os.path.dirname(os.path.abspath(__file__))
+    sql_path = os.path.abspath(os.path.join(my_dir, '../osmgeocoder/', path))
+    files = sorted(f for f in os.listdir(sql_path) if f.endswith('.sql') and os.path.isfile(os.path.join(sql_path, f)))
+
+    result = []
+    for f in files:
+        with open(os.path.join(sql_path, f), 'r') as fp:
+            result.append((f, fp.read()))
+    return result
+
+def load_sql(db, path):
+    for name, sql in sql_files(path):
+        print('Executing {}... '.format(name), end='', flush=True)
+        start = time()
+        db.execute(sql)
+        end = time()
+        print('{} s'.format(round(end-start, 2)), flush=True)
+        telemetry('sql_file', path=path, name=name, seconds=round(end - start, 3))
+
+#
+# Optimize step runner
+#
+
+def parse_dependencies(steps):
+    """
+    Read the ``-- depends: 001, 002`` header of the optimize steps.
+
+    Dependencies are referenced by the numeric prefix of the file name, a step
+    without a header depends on the step before it.
+    """
+    names = dict((name.split('-', 1)[0], name) for name, _ in steps)
+
+    dependencies = {}
+    previous = None
+    for name, sql in steps:
+        header = [line for line in sql.splitlines() if line.startswith('-- depends:')]
+        if header:
+            prefixes = [p.strip() for p in header[0][len('-- depends:'):].split(',') if p.strip()]
+            for prefix in prefixes:
+                if prefix not in names:
+                    raise ValueError('{} depends on unknown step {}'.format(name, prefix))
+            dependencies[name] = set(names[prefix] for prefix in prefixes)
+        else:
+            dependencies[name] = set() if previous is None else set([previous])
+        previous = name
+    return dependencies
+
+def parse_tiles(sql):
+    """
+    Split a tiled optimize step into its parts, returns ``None`` for normal steps.
+
+    A tiled step declares the table and geometry column the tile grid is computed
+    from with a ``-- tiles: public.table.column`` header. Everything after the
+    ``-- per tile:`` line is run once per tile with the tile bounds as the
+    ``xmin``, ``ymin``, ``xmax`` and ``ymax`` query parameters (so a literal ``%``
+    has to be written as ``%%`` there), everything before it once before the tiles.
+    """
+    header = [line for line in sql.splitlines() if line.startswith('-- tiles:')]
+    if not header:
+        return None
+    schema, table, column = header[0][len('-- tiles:'):].strip().split('.')
+    preamble, tile_sql = sql.split('-- per tile:', 1)
+    return schema, table, column, preamble, tile_sql
+
+def has_statements(sql):
+    """True if ``sql`` is more than comments and whitespace, executing only comments is an error"""
+    return any(line.strip() and not line.strip().startswith('--') for line in sql.splitlines())
+
+def parse_jobs(sql):
+    """
+    Split a step into concurrent jobs, returns ``None`` for normal steps.
+
+    Every ``-- job: name`` line starts a job, the jobs run on their own connections
+    (up to ``--optimize-threads`` at a time) and should not lock each other out,
+    e.g. index builds. Everything before the first job runs before the jobs,
+    everything after a ``-- finally:`` line after all jobs finished.
+    """
+    if not any(line.startswith('-- job:') for line in sql.splitlines()):
+        return None
+
+    preamble = []
+    jobs = []
+    final = []
+    current = preamble
+    for line in sql.splitlines():
+        if line.startswith('-- job:'):
+            current = []
+            jobs.append((line[len('-- job:'):].strip(), current))
+        elif line.startswith('-- finally:'):
+            current = final
+        else:
+            current.append(line)
+    return '\n'.join(preamble), [(name, '\n'.join(lines)) for name, lines in jobs], '\n'.join(final)
+
+def make_tiles(db, schema, table, column, grid):
+    """
+    Split the extent of ``schema.table.column`` into ``grid`` x ``grid`` tiles,
+    the outer tiles are open ended so the grid covers everything even if the
+    estimated extent is a bit too small
+    """
+    db.execute('''
+        SELECT gis.ST_XMin(e), gis.ST_YMin(e), gis.ST_XMax(e), gis.ST_YMax(e)
+        FROM (SELECT coalesce(gis.ST_EstimatedExtent(%s, %s, %s), gis.ST_MakeEnvelope(0, 0, 0, 0)) AS e) x;
+    ''', (schema, table, column))
+    xmin, ymin, xmax, ymax = db.fetchone()
+
+    def split(lower, upper):
+        bounds = [lower + (upper - lower) * i / grid for i in range(grid + 1)]
+        bounds[0] = -TILE_OUTER_BOUND
+        bounds[-1] = TILE_OUTER_BOUND
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    tiles = []
+    for x0, x1 in split(xmin, xmax):
+        for y0, y1 in split(ymin, ymax):
+            tiles.append(dict(tile=len(tiles), xmin=x0, ymin=y0, xmax=x1, ymax=y1))
+    return tiles
+
+def run_tile(db_url, name, sql, tile, connections=None):
+    """
+    Run the per tile SQL of a tiled step for one tile and mark the tile as done
+    in the same transaction, failed tiles are rolled back and retried
+    """
+    for attempt in range(TILE_RETRIES):
+        if attempt > 0:
+            sleep(1)
+        db = open_limited(db_url, connections)
+        try:
+            db.execute(sql, tile)
+            db.execute(
+                'UPDATE public.optimize_tile_state SET done = true WHERE step = %s AND tile = %s;',
+                (name, tile['tile'])
+            )
+            return
+        except Exception as e:
+            db.connection.rollback()
+            if attempt == TILE_RETRIES - 1:
+                raise
+            print('{}: tile {} failed, retrying: {}'.format(name, tile['tile'], e), flush=True)
+        finally:
+            close_limited(db, connections)
+
+def run_tiled_step(db_url, name, sql, threads, grid, connections=None):
+    """
+    Run a tiled step: the preamble once, then the per tile SQL on up to ``threads``
+    connections (fewer if other steps hold some of the shared ``connections``). The
+    tile grid and the finished tiles are stored in ``public.optimize_tile_state`` so
+    an interrupted step continues where it stopped.
+    """
+    schema, table, column, preamble, tile_sql = parse_tiles(sql)
+
+    db = open_limited(db_url, connections)
+    try:
+        if has_statements(preamble):
+            db.execute(preamble)
+        db.execute('SELECT tile, xmin, ymin, xmax, ymax, done FROM public.optimize_tile_state WHERE step = %s;', (name,))
+        rows = db.fetchall()
+        if not rows:
+            tiles = make_tiles(db, schema, table, column, grid)
+            for tile in tiles:
+                db.execute('''
+                    INSERT INTO public.optimize_tile_state (step, tile, xmin, ymin, xmax, ymax)
+                    VALUES (%(step)s, %(tile)s, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s);
+                ''', dict(tile, step=name))
+        else:
+            tiles = [dict(tile=t, xmin=x0, ymin=y0, xmax=x1, ymax=y1) for t, x0, y0, x1, y1, done in rows if not done]
+    except Exception:
+        db.connection.rollback()
+        raise
+    finally:
+        close_limited(db, connections)
 
-        for f in sql_files:
-            print('Executing {}... '.format(os.path.basename(f)), end='', flush=True)
+    count = len(tiles)
+    finished = 0
+    reported = 0
+    start = time()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(run_tile, db_url, name, tile_sql, tile, connections) for tile in tiles]
+        for future in as_completed(futures):
+            future.result()
+            finished += 1
+            percent = finished * 100 // count
+            if percent >= reported + 10 or finished == count:
+                reported = percent
+                elapsed = time() - start
+                eta = round(elapsed / finished * (count - finished))
+                print('{}: {}/{} tiles, {} %, ETA {} s'.format(
+                    name, finished, count, percent, eta
+                ), flush=True)
+                telemetry('tiles', step=name, tiles=finished, total=count, percentage=percent, eta=eta)
+
+def use_budget(db, memory, workers):
+    db.execute('SET maintenance_work_mem = %s;', ('{}MB'.format(memory),))
+    if workers is not None:
+        db.execute('SET max_parallel_maintenance_workers = %s;', (workers,))
+
+def run_job(db_url, step, name, sql, budget, connections=None):
+    """Run one job of a step on its own connection, returns the runtime in seconds"""
+    # take the budget before the connection, nothing waits for a budget while holding one
+    memory, workers = budget.acquire() if budget is not None else (None, None)
+    try:
+        db = open_limited(db_url, connections)
+        try:
+            if memory is not None:
+                use_budget(db, memory, workers)
             start = time()
-            with open(f, 'r') as fp:
-                db.execute(fp.read())
-            end = time()
-            print('{} s'.format(round(end-start, 2)), flush=True)
+            db.execute(sql)
+            duration = time() - start
+        except Exception:
+            db.connection.rollback()
+            raise
+        finally:
+            close_limited(db, connections)
+    finally:
+        if budget is not None:
+            budget.release(memory, workers)
+
+    print('{}: {} took {} s'.format(step, name, round(duration, 2)), flush=True)
+    telemetry('job', step=step, job=name, seconds=round(duration, 3), memory=memory, workers=workers)
+    return duration
+
+def is_plain_step(sql):
+    """Steps without tiles and jobs run as one statement"""
+    return parse_tiles(sql) is None and parse_jobs(sql) is None
+
+def run_step(db_url, name, sql, threads=1, grid=TILE_GRID, budget=None, connections=None):
+    """
+    Run one optimize step on its own connection (tiled steps and steps with jobs on
+    up to ``threads`` connections) and record it as done, returns the runtime in seconds.
+
+    All connections are taken from the shared ``connections`` semaphore, a step does
+    not hold one while its tiles or jobs wait for theirs.
+    """
+    db = None
+    memory = None
+    try:
+        start = time()
+        jobs = parse_jobs(sql)
+        if parse_tiles(sql) is not None:
+            run_tiled_step(db_url, name, sql, threads, grid, connections)
+            db = open_limited(db_url, connections)
+        elif jobs is not None:
+            preamble, jobs, final = jobs
+            if has_statements(preamble):
+                db = open_limited(db_url, connections)
+                try:
+                    db.execute(preamble)
+                except Exception:
+                    db.connection.rollback()
+                    raise
+                finally:
+                    close_limited(db, connections)
+                    db = None
+            if budget is not None:
+                budget.reserve(len(jobs))
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                for future in [executor.submit(run_job, db_url, name, job, job_sql, budget, connections) for job, job_sql in jobs]:
+                    future.result()
+            db = open_limited(db_url, connections)
+            if has_statements(final):
+                db.execute(final)
+        else:
+            # plain steps hold a share of the budget too, they may cluster or build indices
+            if budget is not None:
+                memory, workers = budget.acquire()
+            db = open_limited(db_url, connections)
+            if memory is not None:
+                use_budget(db, memory, workers)
+            db.execute(sql)
+        duration = time() - start
+        db.execute('''
+            INSERT INTO public.optimize_state (step, duration) VALUES (%s, %s)
+            ON CONFLICT (step) DO UPDATE SET duration = EXCLUDED.duration, finished = now();
+        ''', (name, duration))
+        db.execute('DELETE FROM public.optimize_tile_state WHERE step = %s;', (name,))
+    except Exception:
+        if db is not None:
+            db.connection.rollback()
+        raise
+    finally:
+        if db is not None:
+            close_limited(db, connections)
+        if memory is not None:
+            budget.release(memory, workers)
+    return duration
+
+def run_steps(db_url, path, threads=1, resume=False, grid=TILE_GRID, memory=None):
+    """
+    Run the SQL files in ``path`` in dependency order, steps that do not depend
+    on each other run concurrently on up to ``threads`` connections.
+
+    Finished steps are recorded in ``public.optimize_state``, with ``resume`` set
+    these are skipped. Returns True if all steps succeeded.
+
+    Tiled steps (see ``parse_tiles``) are split into ``grid`` x ``grid`` tiles, steps
+    may have jobs (see ``parse_jobs``). Steps, tiles and jobs share the ``threads``
+    connections, so at most that many run at any time.
+
+    Plain steps and jobs share ``memory`` MB of maintenance_work_mem (see
+    ``maintenance_budget``).
+    """
+    steps = sql_files(path)
+    dependencies = parse_dependencies(steps)
+    sql = dict(steps)
+
+    db = open_db(db_url)
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS public.optimize_state (
+            step text PRIMARY KEY,
+            duration float,
+            finished timestamptz DEFAULT now()
+        );
+        CREATE TABLE IF NOT EXISTS public.optimize_tile_state (
+            step text,
+            tile int,
+            xmin float,
+            ymin float,
+            xmax float,
+            ymax float,
+            done boolean DEFAULT false,
+            PRIMARY KEY (step, tile)
+        );
+    ''')
+    if resume:
+        db.execute('SELECT step, duration FROM public.optimize_state;')
+        done = dict((step, duration) for step, duration in db.fetchall() if step in sql)
+    else:
+        # only forget the steps of this path, the optimize and wordlist steps share the state tables
+        db.execute('DELETE FROM public.optimize_state WHERE step = ANY(%s);', (list(sql.keys()),))
+        db.execute('DELETE FROM public.optimize_tile_state WHERE step = ANY(%s);', (list(sql.keys()),))
+        done = {}
+    budget = maintenance_budget(db, memory, threads)
+    close_db(db)
+    connections = BoundedSemaphore(threads)
+
+    timings = {}
+    pending = [name for name, _ in steps if name not in done]
+    running = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while pending or running:
+            # start everything that is runnable, stop scheduling after a failure
+            if not failed:
+                ready = [
+                    name for name in pending
+                    if dependencies[name] <= set(done.keys()) | set(timings.keys())
+                ][:threads - len(running)]
+                # plain steps take a share of the budget, reserve before starting any of them
+                budget.reserve(len([name for name in ready if is_plain_step(sql[name])]))
+                for name in ready:
+                    pending.remove(name)
+                    print('Starting {}...'.format(name), flush=True)
+                    running[executor.submit(run_step, db_url, name, sql[name], threads, grid, budget, connections)] = name
+            if not running:
+                break
+
+            finished, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    timings[name] = future.result()
+                    print('Finished {} in {} s'.format(name, round(timings[name], 2)), flush=True)
+                    telemetry('step', step=name, status='done', seconds=round(timings[name], 3))
+                except Exception as e:
+                    print('Failed {}: {}'.format(name, e), flush=True)
+                    telemetry('step', step=name, status='failed', error=str(e))
+                    failed.append(name)
+
+    print('Step timings:')
+    for name, _ in steps:
+        if name in timings:
+            print(' - {:50} {:>10} s'.format(name, round(timings[name], 2)))
+        elif name in done:
+            print(' - {:50} {:>10} s (previous run)'.format(name, round(done[name], 2)))
+        elif name in failed:
+            print(' - {:50} {:>10}'.format(name, 'failed'))
+        else:
+            print(' - {:50} {:>10}'.format(name, 'not run'))
 
+    if failed or pending:
+        print('Not all steps finished, fix the problem and run again with --resume')
+        return False
+    return True
 
 def prepare_db(db):
     load_sql(db, 'data/sql/prepare')
 
-def optimize_db(db):
+def optimize_db(db_url, threads=1, resume=False, grid=TILE_GRID, memory=None):
     start = time()
-    load_sql(db, 'data/sql/optimize')
+    success = run_steps(db_url, 'data/sql/optimize', threads=threads, resume=resume, grid=grid, memory=memory)
     end = time()
     print('Optimizing took {} s'.format(round(end - start, 2)))
+    telemetry('optimize', success=success, seconds=round(end - start, 3))
+    return success
+
+def build_wordlist(db_url, threads=1, resume=False, grid=TILE_GRID, memory=None):
+    start = time()
+    success = run_steps(db_url, 'data/sql/wordlist', threads=threads, resume=resume, grid=grid, memory=memory)
+    end = time()
+    print('Building the wordlist took {} s'.format(round(end - start, 2)))
+    telemetry('wordlist', success=success, seconds=round(end - start, 3))
+    return success
+
+def build_address_completion(db_url, threads=1, resume=False, grid=TILE_GRID, memory=None):
+    start = time()
+    success = run_steps(db_url, 'data/sql/address_completion', threads=threads, resume=resume, grid=grid, memory=memory)
+    end = time()
+    print('Building the address completion table took {} s'.format(round(end - start, 2)))
+    telemetry('address_completion', success=success, seconds=round(end - start, 3))
+    return success
+
+def build_search_table(db):
+    start = time()
+    load_sql(db, 'data/sql/optimize_search_table')
+    end = time()
+    print('Building search table took {} s'.format(round(end - start, 2)))
+    telemetry('search_table', seconds=round(end - start, 3))
+
+def warm_build(db, tables):
+    """
+    Analyze the tables built in ``osm_build`` and load them and their indices into
+    the buffer cache (if the ``pg_prewarm`` extension is installed)
+    """
+    db.execute("SELECT to_regproc('pg_prewarm') IS NOT NULL;")
+    prewarm = db.fetchone()[0]
+    for table in tables:
+        start = time()
+        db.execute('ANALYZE osm_build.{};'.format(table))
+        if prewarm:
+            db.execute('''
+                SELECT sum(pg_prewarm(x.relation)) FROM (
+                    SELECT %(table)s::regclass AS relation
+                    UNION ALL
+                    SELECT i.indexrelid::regclass FROM pg_index i WHERE i.indrelid = %(table)s::regclass
+                ) x;
+            ''', dict(table='osm_build.' + table))
+        end = time()
+        print('Warmed up {} in {} s'.format(table, round(end - start, 2)), flush=True)
+        telemetry('warm', table=table, prewarm=prewarm, seconds=round(end - start, 3))
+
+def publish(db, tables):
+    """
+    Swap the tables built in ``osm_build`` with the published ones, the previous
+    generation is kept in ``osm_previous``. Gives way to running queries by
+    retrying if the locks are not available in time.
+    """
+    warm_build(db, tables)
+    db.connection.commit()
+
+    for attempt in range(PUBLISH_RETRIES):
+        start = time()
+        try:
+            db.execute('SET LOCAL lock_timeout = %s;', (PUBLISH_LOCK_TIMEOUT,))
+            db.execute('SELECT public.publish_build(%s);', (tables,))
+            db.connection.commit()
+        except psycopg2.OperationalError as e:
+            db.connection.rollback()
+            if e.pgcode != LOCK_NOT_AVAILABLE or attempt == PUBLISH_RETRIES - 1:
+                raise
+            print('Tables are busy, retrying to publish...', flush=True)
+            sleep(1)
+            continue
+        end = time()
+        print('Published {} in {} s'.format(', '.join(tables), round(end - start, 2)), flush=True)
+        telemetry('publish', tables=tables, attempts=attempt + 1, seconds=round(end - start, 3))
+        return
+
+def rollback(db):
+    """
+    Swap the published tables that have a previous generation with it
+    """
+    tables = []
+    for table in PUBLISHED_TABLES:
+        db.execute('SELECT to_regclass(%s);', ('osm_previous.' + table,))
+        if db.fetchone()[0] is not None:
+            tables.append(table)
+    if not tables:
+        print('No previous generation to roll back to')
+        return
+    db.execute('SELECT public.rollback_build(%s);', (tables,))
+    db.connection.commit()
+    print('Rolled back {}'.format(', '.join(tables)))
+
+def report_statistics(db):
+    print('Table and index sizes:')
+    db.execute('''
+        SELECT
+            c.relname,
+            pg_size_pretty(sum(pg_table_size(p.oid))),
+            pg_size_pretty(sum(pg_indexes_size(p.oid)))
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_inherits i ON i.inhparent = c.oid
+        JOIN pg_class p ON p.oid = coalesce(i.inhrelid, c.oid)
+        WHERE
+            n.nspname = 'public'
+            AND c.relkind IN ('r', 'p')
+            AND NOT c.relispartition
+            AND (c.relname LIKE 'osm_struct_%' OR c.relname LIKE 'oa_%')
+        GROUP BY c.relname
+        ORDER BY c.relname;
+    ''')
+    for name, table_size, index_size in db.fetchall():
+        print(' - {:30} table: {:>10}, indices: {:>10}'.format(name, table_size, index_size))
+
+    print('Join speed (house -> street -> city):')
+    joins = [
+        ('public.osm_struct_house', '''
+            SELECT count(*)
+            FROM public.osm_struct_house h
+            JOIN public.osm_struct_streets s ON h.street_id = s.id
+            JOIN public.osm_struct_cities c ON s.city_id = c.id;
+        '''),
+        ('public.oa_house', '''
+            SELECT count(*)
+            FROM public.oa_house h
+            JOIN public.oa_street s ON h.street_id = s.id
+            JOIN public.oa_city c ON s.city_id = c.id;
+        '''),
+    ]
+    for table, query in joins:
+        db.execute('SELECT to_regclass(%s);', (table,))
+        if db.fetchone()[0] is None:
+            continue
+        start = time()
+        db.execute(query)
+        count = db.fetchone()[0]
+        end = time()
+        print(' - {:30} {} rows in {} s'.format(table, count, round(end - start, 2)))
 
 def close_db(db):
     conn = db.connection
@@ -98,7 +656,7 @@ def get_mapping_file():
         mapping_file = os.path.abspath(os.path.join(my_dir, '../osmgeocoder/data/imposm_mapping.yml'))
     return mapping_file, temp
 
-def imposm_read(data_files, tmp_dir):
+def imposm_read(data_files, tmp_dir, diff=False):
     mapping_file, temp = get_mapping_file()
 
     first = True
@@ -114,6 +672,8 @@ def imposm_read(data_files, tmp_dir):
             os.path.join(tmp_dir, 'imposm3'),
             '-appendcache' if not first else '-overwritecache',
         ]
+        if diff:
+            args.append('-diff')
         print(args)
         subprocess.run(args)
         first = False
@@ -122,7 +682,7 @@ def imposm_read(data_files, tmp_dir):
         temp.close()
 
 
-def imposm_write(db_url, tmp_dir, optimize):
+def imposm_write(db_url, tmp_dir, optimize, diff=False):
     mapping_file, temp = get_mapping_file()
 
     args = [
@@ -138,6 +698,8 @@ def imposm_write(db_url, tmp_dir, optimize):
     ]
     if optimize:
         args.append('-optimize')
+    if diff:
+        args.append('-diff')
     args.append('-deployproduction')
     print(args)
     subprocess.run(args)
@@ -145,6 +707,42 @@ def imposm_write(db_url, tmp_dir, optimize):
     if temp is not None:
         temp.close()
 
+def imposm_diff(db_url, tmp_dir, diff_files):
+    mapping_file, temp = get_mapping_file()
+
+    args = [
+        'imposm',
+        'diff',
+        '-connection',
+        db_url.replace('postgres', 'postgis'),
+        '-mapping',
+        mapping_file,
+        '-cachedir',
+        os.path.join(tmp_dir, 'imposm3'),
+    ] + diff_files
+    print(args)
+    subprocess.run(args)
+
+    if temp is not None:
+        temp.close()
+
+#
+# Incremental updates
+#
+
+def track_changes(db):
+    print('Installing change tracking triggers... ', end='', flush=True)
+    db.execute('SELECT public.track_osm_changes();')
+    print('done', flush=True)
+
+def apply_changes(db):
+    start = time()
+    db.execute('SELECT public.apply_osm_changes();')
+    count = db.fetchone()[0]
+    end = time()
+    print('Applied {} changes in {} s'.format(count, round(end - start, 2)))
+    telemetry('apply_changes', changes=count, seconds=round(end - start, 3))
+
 #
 # Cmdline interface
 #
@@ -172,6 +770,104 @@ def parse_cmdline():
         default=False,
         help='Optimize DB Tables and create indices'
     )
+    parser.add_argument(
+        '--track-changes',
+        dest='track_changes',
+        action='store_true',
+        default=False,
+        help='Import with diff support and record changes to the OpenStreetMap tables for incremental updates'
+    )
+    parser.add_argument(
+        '--apply-diff',
+        type=str,
+        dest='diff_files',
+        action='append',
+        help='OpenStreetMap change file (.osc.gz) to import and apply incrementally (can be used multiple times)'
+    )
+    parser.add_argument(
+        '--update',
+        dest='update',
+        action='store_true',
+        default=False,
+        help='Apply recorded changes to the structure tables (e.g. when running `imposm run` separately)'
+    )
+    parser.add_argument(
+        '--optimize-threads',
+        type=int,
+        dest='optimize_threads',
+        default=1,
+        help='Number of DB connections shared by the concurrent optimize steps, their tiles and jobs'
+    )
+    parser.add_argument(
+        '--index-memory',
+        type=int,
+        dest='index_memory',
+        default=None,
+        help='Memory in MB shared by the concurrent index builds and clustering of the optimize steps (default: maintenance_work_mem of the server per optimize thread)'
+    )
+    parser.add_argument(
+        '--tile-grid',
+        type=int,
+        dest='tile_grid',
+        default=TILE_GRID,
+        help='Split the spatial optimize steps into a grid of N x N tiles that run on the optimize threads (default: {})'.format(TILE_GRID)
+    )
+    parser.add_argument(
+        '--resume',
+        dest='resume',
+        action='store_true',
+        default=False,
+        help='Skip optimize steps that finished in a previous run'
+    )
+    parser.add_argument(
+        '--search-table',
+        dest='search_table',
+        action='store_true',
+        default=False,
+        help='Build the denormalized search table (needs more disk space, but avoids joins when geocoding)'
+    )
+    parser.add_argument(
+        '--wordlist',
+        dest='wordlist',
+        action='store_true',
+        default=False,
+        help='Rebuild the text prediction wordlist in tiles on up to --optimize-threads connections and publish it'
+    )
+    parser.add_argument(
+        '--address-completion',
+        dest='address_completion',
+        action='store_true',
+        default=False,
+        help='Build the address type-ahead table in tiles on up to --optimize-threads connections and publish it (rebuild after importing openaddresses.io data)'
+    )
+    parser.add_argument(
+        '--rollback',
+        dest='rollback',
+        action='store_true',
+        default=False,
+        help='Swap the published structure, search, wordlist and address completion tables with the previous generation (run again to undo)'
+    )
+    parser.add_argument(
+        '--prediction-index',
+        type=str,
+        dest='prediction_index',
+        default=None,
+        help='After applying changes or rebuilding the wordlist write it into this file for in-process text prediction'
+    )
+    parser.add_argument(
+        '--statistics',
+        dest='statistics',
+        action='store_true',
+        default=False,
+        help='Print table and index sizes and time a full join of the house, street and city tables'
+    )
+    parser.add_argument(
+        '--telemetry',
+        type=str,
+        dest='telemetry',
+        default=None,
+        help='Append progress and timing events as JSON lines to this file'
+    )
     parser.add_argument(
         '--tmpdir',
         type=str,
@@ -185,11 +881,43 @@ def parse_cmdline():
 
 if __name__ == '__main__':
     args = parse_cmdline()
+    set_telemetry(args.telemetry)
     db = open_db(args.db_url)
     prepare_db(db)
+    db.connection.commit()  # optimize steps run on their own connections
     if args.data_files:
-        imposm_read(args.data_files, args.tmp)
-        imposm_write(args.db_url, args.tmp, args.optimize)
+        imposm_read(args.data_files, args.tmp, diff=args.track_changes)
+        imposm_write(args.db_url, args.tmp, args.optimize, diff=args.track_changes)
     if args.optimize:
-        optimize_db(db)
+        if not optimize_db(args.db_url, threads=args.optimize_threads, resume=args.resume, grid=args.tile_grid, memory=args.index_memory):
+            close_db(db)
+            sys.exit(1)
+        publish(db, OPTIMIZE_TABLES)
+    if args.search_table:
+        build_search_table(db)
+        publish(db, SEARCH_TABLES)
+    if args.wordlist:
+        if not build_wordlist(args.db_url, threads=args.optimize_threads, resume=args.resume, grid=args.tile_grid, memory=args.index_memory):
+            close_db(db)
+            sys.exit(1)
+        publish(db, WORDLIST_TABLES)
+    if args.address_completion:
+        if not build_address_completion(args.db_url, threads=args.optimize_threads, resume=args.resume, grid=args.tile_grid, memory=args.index_memory):
+            close_db(db)
+            sys.exit(1)
+        publish(db, ADDRESS_COMPLETION_TABLES)
+    if args.rollback:
+        rollback(db)
+    if args.track_changes:
+        track_changes(db)
+        db.connection.commit()
+    if args.diff_files:
+        imposm_diff(args.db_url, args.tmp, args.diff_files)
+    if args.diff_files or args.update:
+        apply_changes(db)
+    if args.prediction_index and (args.wordlist or args.diff_files or args.update):
+        db.connection.commit()
+        write_index(db, args.prediction_index, build_prediction_index, 'prediction_index', 'words', telemetry)
+    if args.statistics:
+        report_statistics(db)
     close_db(db)
\ No newline at end of file
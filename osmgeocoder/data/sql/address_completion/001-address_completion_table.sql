@@ -0,0 +1,56 @@
+-- depends:
+-- tiles: public.osm_struct_house.geometry
+--
+-- Address type-ahead with `prepare_osm.py --address-completion`, one row per key of every
+-- house (see `address_keys()`) sorted by bytes so a prefix is one range of the key index.
+--
+-- The region is the geohash cell of the house like in `wordlist_region`, searches
+-- around a center only scan the cells near it.
+--
+-- Houses of openaddresses.io data outside of the OpenStreetMap extent end up in the
+-- open ended outer tiles.
+--
+DROP TABLE IF EXISTS osm_build.address_completion;
+
+CREATE TABLE osm_build.address_completion (
+	"key" text COLLATE "C",
+	region text COLLATE "C",
+	source "char", -- 'o' = osm_struct_house, 'a' = oa_house
+	id bigint,
+	road text,
+	house_number text,
+	postcode text,
+	city text,
+	geometry gis.geometry(point, 3857)
+);
+
+-- per tile:
+DO
+$$
+BEGIN
+	INSERT INTO osm_build.address_completion (key, region, source, id, road, house_number, postcode, city, geometry)
+	SELECT k.key, public._word_region(h.geometry), 'o', h.id, s.name, h.house_number, NULLIF(c.postcode, ''), NULLIF(c.name, ''), h.geometry
+		FROM public.osm_struct_house h
+		JOIN public.osm_struct_streets s ON h.street_id = s.id
+		JOIN public.osm_struct_cities c ON s.city_id = c.id
+		CROSS JOIN LATERAL public.address_keys(s.name, h.house_number, c.postcode, c.name) k(key)
+		WHERE
+			s.name <> ''
+			AND h.geometry && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+			AND public._in_tile(h.geometry, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s);
+
+	-- older imports stored empty values as a space
+	IF to_regclass('public.oa_house') IS NOT NULL THEN
+		INSERT INTO osm_build.address_completion (key, region, source, id, road, house_number, postcode, city, geometry)
+		SELECT k.key, public._word_region(h.location), 'a', h.id, trim(s.street), trim(h.housenumber), NULLIF(trim(c.postcode), ''), NULLIF(trim(c.city), ''), h.location
+			FROM public.oa_house h
+			JOIN public.oa_street s ON h.street_id = s.id
+			JOIN public.oa_city c ON s.city_id = c.id
+			CROSS JOIN LATERAL public.address_keys(trim(s.street), trim(h.housenumber), trim(c.postcode), trim(c.city)) k(key)
+			WHERE
+				trim(s.street) <> ''
+				AND h.location && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+				AND public._in_tile(h.location, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s);
+	END IF;
+END;
+$$ LANGUAGE 'plpgsql';
@@ -0,0 +1,9 @@
+-- depends: 001
+-- job: address key index
+CREATE INDEX IF NOT EXISTS address_completion_key_idx ON osm_build.address_completion USING BTREE(key);
+-- job: regional address key index
+CREATE INDEX IF NOT EXISTS address_completion_region_key_idx ON osm_build.address_completion USING BTREE(region, key);
+-- job: address id index
+CREATE INDEX IF NOT EXISTS address_completion_id_idx ON osm_build.address_completion USING BTREE(id) WHERE source = 'o';
+-- job: openaddresses.io id index
+CREATE INDEX IF NOT EXISTS address_completion_oa_id_idx ON osm_build.address_completion USING BTREE(id) WHERE source = 'a';
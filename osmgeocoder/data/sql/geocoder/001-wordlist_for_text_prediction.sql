@@ -1,6 +1,13 @@
 --
 -- Run this function after updating the OSM data
 -- Runtime for "Europe" on SSD with Intel(R) Core(TM) i7-7700K CPU @ 4.20GHz: ca. 600 Seconds
+-- `prepare_osm.py --wordlist` builds the same tables on multiple connections (see `sql/wordlist`)
+--
+-- The list is built in the `osm_build` schema and published when it is complete,
+-- text prediction keeps using the old list while building
+--
+-- Words are counted per region first, `wordlist_region` keeps these counts and
+-- `wordlist` the sums over all regions. Words of streets without extent have no region.
 --
 CREATE OR REPLACE FUNCTION public.build_wordlist() RETURNS void AS
 $$
@@ -25,46 +32,56 @@ BEGIN
 
     -- clean state
     DROP TABLE IF EXISTS public.wordlist_temp;
-    DROP TABLE IF EXISTS public.wordlist;
+    DROP TABLE IF EXISTS osm_build.wordlist;
+    DROP TABLE IF EXISTS osm_build.wordlist_region;
 
     -- temporary collection table
     CREATE TEMPORARY TABLE wordlist_temp (
+        region TEXT COLLATE "C",
         word TEXT,
         ct INT
     );
 
     -- final wordlist table
-    CREATE TABLE public.wordlist (
+    CREATE TABLE osm_build.wordlist (
         word TEXT PRIMARY KEY,
         ct INT DEFAULT 1
     );
 
+    -- regional wordlist, regions sort bytewise so a geohash prefix is a range of regions
+    CREATE TABLE osm_build.wordlist_region (
+        region TEXT COLLATE "C",
+        word TEXT,
+        ct INT DEFAULT 1,
+        PRIMARY KEY (region, word)
+    );
+
     -- create word list
     IF osm_exists THEN
-        INSERT INTO wordlist_temp (word, ct) SELECT word, ct FROM (
-            SELECT unnest(regexp_split_to_array(c.name, '\W')) as word, count(s.*) as ct
+        INSERT INTO wordlist_temp (region, word, ct) SELECT region, word, ct FROM (
+            SELECT public._word_region(s.extent) as region, unnest(regexp_split_to_array(c.name, '\W')) as word, count(s.*) as ct
                 FROM public.osm_struct_cities c
                 JOIN public.osm_struct_streets s ON c.id = s.city_id
-            GROUP BY c.name
+            GROUP BY c.name, public._word_region(s.extent)
             UNION ALL
-            SELECT unnest(regexp_split_to_array(s.name, '\W')) as word, count(h.*) as ct
+            SELECT public._word_region(s.extent) as region, unnest(regexp_split_to_array(s.name, '\W')) as word, count(h.*) as ct
                 FROM public.osm_struct_streets s
                 JOIN public.osm_struct_house h ON s.id = h.street_id
-            GROUP BY s.name
+            GROUP BY s.name, public._word_region(s.extent)
         ) x;
     END IF;
 
     IF oa_exists THEN 
-        INSERT INTO wordlist_temp (word, ct) SELECT word, ct FROM (
-            SELECT unnest(regexp_split_to_array(c.city, '\W')) as word, count(s.*) as ct
+        INSERT INTO wordlist_temp (region, word, ct) SELECT region, word, ct FROM (
+            SELECT public._word_region(s.extent) as region, unnest(regexp_split_to_array(c.city, '\W')) as word, count(s.*) as ct
                 FROM public.oa_city c
                 JOIN public.oa_street s ON c.id = s.city_id
-            GROUP BY c.city
+            GROUP BY c.city, public._word_region(s.extent)
             UNION ALL
-            SELECT unnest(regexp_split_to_array(s.street, '\W')) as word, count(h.*) as ct
+            SELECT public._word_region(s.extent) as region, unnest(regexp_split_to_array(s.street, '\W')) as word, count(h.*) as ct
                 FROM public.oa_street s
                 JOIN public.oa_house h ON s.id = h.street_id
-            GROUP BY s.street
+            GROUP BY s.street, public._word_region(s.extent)
         ) x;
     END IF;
 
@@ -72,26 +89,35 @@ BEGIN
     CREATE INDEX wordlist_word_idx ON wordlist_temp USING BTREE(word);
 
     -- reduce table by grouping by word (using the index just created)
-    INSERT INTO public.wordlist (word, ct) SELECT word, sum(ct) FROM wordlist_temp GROUP BY word;
+    INSERT INTO osm_build.wordlist (word, ct) SELECT word, sum(ct) FROM wordlist_temp GROUP BY word;
+    INSERT INTO osm_build.wordlist_region (region, word, ct)
+        SELECT region, word, sum(ct) FROM wordlist_temp WHERE region <> '' AND word <> '' GROUP BY region, word;
 
     -- drop temporary table
     DROP TABLE wordlist_temp;
 
     -- create new index on words
-    CREATE INDEX wordlist_word_idx ON public.wordlist USING BTREE(word);
+    CREATE INDEX wordlist_word_idx ON osm_build.wordlist USING BTREE(word);
 
     -- create trigram index, just in case you want to search with a trigram search
-    CREATE INDEX wordlist_word_trgm_idx ON public.wordlist USING GIN(word gin_trgm_ops);
+    CREATE INDEX wordlist_word_trgm_idx ON osm_build.wordlist USING GIN(word gin_trgm_ops);
 
     -- create metaphone trigram index, sounds complicated but really isn't
     -- this index allows to search with the '%' operator in the metaphone index
     -- so we can find words that sound the same or just a bit different than the one the
     -- user searches for. This also allows to find incomplete words (to be used while typing)
-    CREATE INDEX wordlist_word_dmetaphone_idx ON public.wordlist USING GIN(str.dmetaphone(word) gin_trgm_ops);
-    CREATE INDEX wordlist_word_dmetaphone_alt_idx ON public.wordlist USING GIN(str.dmetaphone_alt(word) gin_trgm_ops);
+    CREATE INDEX wordlist_word_dmetaphone_idx ON osm_build.wordlist USING GIN(str.dmetaphone(word) gin_trgm_ops);
+    CREATE INDEX wordlist_word_dmetaphone_alt_idx ON osm_build.wordlist USING GIN(str.dmetaphone_alt(word) gin_trgm_ops);
+
+    -- words of a region by prefix for the regional text prediction, sorted bytewise
+    CREATE INDEX wordlist_region_word_idx ON osm_build.wordlist_region USING BTREE(region, word COLLATE "C");
 
     -- tell postgres to update the query planner for the newly created indices
-    ANALYZE public.wordlist;
+    ANALYZE osm_build.wordlist;
+    ANALYZE osm_build.wordlist_region;
+
+    -- swap with the current lists
+    PERFORM public.publish_build(ARRAY['wordlist', 'wordlist_region']);
 END
 $$ LANGUAGE 'plpgsql';
 
@@ -30,3 +30,94 @@ $$ LANGUAGE 'sql';
 
 -- use like this
 -- SELECT * FROM predict_text('Dickenr');
+
+--
+-- Regions around a center (EPSG 3857), the cell of the center and its eight neighbours
+-- (geohash cells of 3 characters like the regions of `_word_region()`)
+--
+CREATE OR REPLACE FUNCTION public.word_regions(center gis.geometry) RETURNS text[] AS
+$$
+    SELECT array_agg(DISTINCT gis.ST_GeoHash(gis.ST_SetSRID(gis.ST_MakePoint(
+        greatest(-180.0, least(180.0, gis.ST_X(p) + dx * 1.40625)),
+        greatest(-90.0, least(90.0, gis.ST_Y(p) + dy * 1.40625))
+    ), 4326), 3))
+    FROM
+        gis.ST_Transform(center, 4326) p,
+        generate_series(-1, 1) dx,
+        generate_series(-1, 1) dy;
+$$ LANGUAGE 'sql' IMMUTABLE;
+
+--
+-- Predict text from user input, only searching the words of some regions
+--
+-- Regions are geohash cells (or prefixes of them), see `word_regions()` to get the regions
+-- around a center. Word counts are summed over the regions. Only words starting with the
+-- first letter of the input (in either case) are searched, through the `(region, word)`
+-- index of `wordlist_region`, so the cost depends on the words of the regions and not on
+-- the whole wordlist. If no word in the regions matches the whole wordlist is searched.
+--
+CREATE OR REPLACE FUNCTION public.predict_text(user_input text, regions text[]) RETURNS TABLE (word text, ct int, dist int) AS
+$$
+#variable_conflict use_column
+BEGIN
+    FOR word, ct, dist IN
+        WITH alphabet AS (
+            SELECT substr('0123456789bcdefghjkmnpqrstuvwxyz', i, 1) AS c FROM generate_series(1, 32) i
+        ), suffixes AS (
+            SELECT '' AS suffix
+            UNION ALL SELECT a.c FROM alphabet a
+            UNION ALL SELECT a.c || b.c FROM alphabet a, alphabet b
+        ), cells AS (
+            -- cells of 3 characters, shorter prefixes are expanded to all of their cells
+            SELECT DISTINCT left(r, 3) || s.suffix AS cell
+            FROM unnest(regions) r
+            JOIN suffixes s ON length(left(r, 3)) + length(s.suffix) = 3
+        ), initials AS (
+            SELECT DISTINCT i AS initial
+            FROM unnest(ARRAY[upper(left(user_input, 1)), lower(left(user_input, 1))]) i
+        )
+        SELECT
+            w.word,
+            sum(w.ct)::int AS ct,
+            -- levenshtein that stops counting above the maximum distance
+            str.levenshtein_less_equal(substr(w.word, 0, length(user_input) + 1), user_input, 2) AS dist
+        FROM cells c
+        CROSS JOIN initials i
+        CROSS JOIN LATERAL (
+            -- one range of the `wordlist_region_word_idx` index per cell and initial, words
+            -- sort bytewise there so the words starting with a letter end before the next
+            -- code point
+            SELECT x.word, x.ct FROM public.wordlist_region x
+            WHERE
+                x.region = c.cell
+                AND x.word >= i.initial COLLATE "C"
+                AND x.word < chr(ascii(i.initial) + 1) COLLATE "C"
+            OFFSET 0 -- keeps the planner from flattening the lookup into a join with a filter
+        ) w
+        WHERE
+            str.levenshtein_less_equal(substr(w.word, 0, length(user_input) + 1), user_input, 2) < 3
+            AND (
+               str.dmetaphone_alt(w.word) % str.dmetaphone_alt(user_input)
+            OR str.dmetaphone(w.word) % str.dmetaphone_alt(user_input)
+            OR str.dmetaphone_alt(w.word) % str.dmetaphone(user_input)
+            OR str.dmetaphone(w.word) % str.dmetaphone(user_input)
+            )
+        GROUP BY w.word
+        ORDER BY
+            dist ASC,
+            ct DESC,
+            length(w.word) ASC,
+            w.word ASC
+        LIMIT 10
+    LOOP
+        RETURN NEXT;
+    END LOOP;
+
+    -- nothing used around here, predict from the whole wordlist
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT p.word, p.ct, p.dist FROM public.predict_text(user_input) p;
+    END IF;
+END;
+$$ LANGUAGE 'plpgsql';
+
+-- SELECT * FROM predict_text('Marienpl', word_regions(ST_Transform(ST_SetSRID(ST_MakePoint(11.575, 48.137), 4326), 3857)));
@@ -15,220 +15,118 @@ $$ LANGUAGE 'sql' IMMUTABLE;
 
 
 --
--- geocode by searching road-names only
---
--- optionally only search in an area around `center` (with the `radius` specified)
--- this function is used when no country search term is supplied
---
--- This query is quicker than matching against the country polygon additionally, but can be
--- imprecise when the address is near a country border
---
-DROP FUNCTION IF EXISTS public._geocode_by_road_without_country_osm(
-    search_term TEXT, search_housenumber TEXT, max_results int,
-    center gis.geometry(point), radius int);
-CREATE OR REPLACE FUNCTION public._geocode_by_road_without_country_osm(
-	search_term TEXT,
-    search_housenumber TEXT,
-	max_results int,
-	center gis.geometry(point),
-	radius int
-)
-RETURNS SETOF public.address_and_distance
-AS $$
-    SELECT
-        NULL::text AS house,
-        s.name::text as road,
-        h.house_number::text,
-        c.postcode::text,
-        NULLIF(c.name, '')::text as city,
-        NULLIF(a6.name, '')::text as county,
-        NULLIF(a4.name, '')::text as "state",
-        h.geometry::gis.geometry(point, 3857),
-        gis.ST_Distance(h.geometry, center) as distance,
-        '00000000-0000-0000-0000-000000000000'::uuid as license_id
-    FROM
-        public.osm_struct_streets s
-    JOIN public.osm_struct_cities c ON s.city_id = c.id
-    JOIN public.osm_struct_house h ON h.street_id = s.id
-    LEFT JOIN public.osm_admin a4 ON gis.ST_Contains(a4.geometry, h.geometry::gis.geometry(point, 3857)) and a4.admin_level = 4
-    LEFT JOIN public.osm_admin a6 ON gis.ST_Contains(a6.geometry, h.geometry::gis.geometry(point, 3857)) and a6.admin_level = 6
-    WHERE
-        (center IS NULL OR gis.ST_DWithin(h.geometry, center, radius)) -- only search around center if center is not null
-        AND s.name % search_term
-        AND (search_housenumber IS NULL OR h.house_number % search_housenumber)
-    ORDER BY
-        distance ASC,
-        (s.name <-> search_term) ASC
-    LIMIT max_results;
-$$ LANGUAGE 'sql';
-
---
--- geocode by searching road-names only
---
--- optionally only search in an area around `center` (with the `radius` specified)
--- this function is used when a country search term is supplied (e.g. country may not be NULL)
+-- Find the houses of a street that match the house number searched for
 --
--- This query is a bit slower than just searching by center and radius as there will be a costly
--- intersection with the country polygon which can be rather large (5MB for germany for example)
+-- Uses the parsed house numbers from `osm_struct_house_number`, if there is no exact match
+-- the houses with the nearest number are returned. If no house number was supplied all
+-- houses of the street are returned.
 --
-DROP FUNCTION IF EXISTS public._geocode_by_road_with_country_osm(
-    search_term TEXT, search_housenumber TEXT, max_results int,
-    center gis.geometry(point), radius int, country TEXT);
-CREATE OR REPLACE FUNCTION _geocode_by_road_with_country_osm(
-	search_term TEXT,
-    search_housenumber TEXT,
-	max_results int,
-	center gis.geometry(point),
-	radius int,
-	country TEXT
-)
-RETURNS SETOF public.address_and_distance AS
+DROP FUNCTION IF EXISTS public._geocode_house_number_osm(street uuid, search_housenumber TEXT);
+DROP FUNCTION IF EXISTS public._geocode_house_number_osm(street integer, search_housenumber TEXT);
+CREATE OR REPLACE FUNCTION public._geocode_house_number_osm(street integer, search_housenumber TEXT)
+RETURNS SETOF integer AS
 $$
-DECLARE
-	country_poly gis.geometry;
-BEGIN
-    -- prefetch the country polyon to avoid doing a join in the query
-	SELECT public._geocode_get_country_polygon(country) INTO country_poly;
-	
-    RETURN QUERY SELECT
-        NULL::text AS house,
-        s.name::text as road,
-        h.house_number::text,
-        c.postcode::text,
-        NULLIF(c.name, '')::text as city,
-        NULLIF(a6.name, '')::text as county,
-        NULLIF(a4.name, '')::text as "state",
-        h.geometry::gis.geometry(point, 3857),
-        gis.ST_Distance(h.geometry, center) as distance,
-        '00000000-0000-0000-0000-000000000000'::uuid as license_id
-    FROM
-        public.osm_struct_streets s
-    JOIN public.osm_struct_cities c ON s.city_id = c.id
-    JOIN public.osm_struct_house h ON h.street_id = s.id
-    LEFT JOIN public.osm_admin a4 ON gis.ST_Contains(a4.geometry, h.geometry::gis.geometry(point, 3857)) and a4.admin_level = 4
-    LEFT JOIN public.osm_admin a6 ON gis.ST_Contains(a6.geometry, h.geometry::gis.geometry(point, 3857)) and a6.admin_level = 6
+    -- no house number, return the complete street
+    SELECT h.id
+    FROM public.osm_struct_house h
     WHERE
-        (center IS NULL OR gis.ST_DWithin(h.geometry, center, radius)) -- only search around center if center is not null
-        AND gis.ST_Within(gis.ST_Centroid(h.geometry), country_poly) -- intersect with country polygon
-        AND s.name % search_term
-        AND (search_housenumber IS NULL OR h.house_number % search_housenumber)
-    ORDER BY
-        distance ASC,
-        (s.name <-> search_term) ASC
-    LIMIT max_results; -- limit here to avoid performing the joins on all rows
-END;
-$$ LANGUAGE 'plpgsql';
-
---
--- Convenience switching function that calls the correct detail function
---
--- This is the external interface to the forward geocoder
---
-DROP FUNCTION IF EXISTS public.geocode_by_road_osm(
-    search_term TEXT, search_housenumber TEXT, max_results int,
-    center gis.geometry(point), radius int, country TEXT
-);
-CREATE OR REPLACE FUNCTION public.geocode_by_road_osm(
-	search_term TEXT,
-    search_housenumber TEXT,
-	max_results int,
-	center gis.geometry(point),
-	radius int,
-	country TEXT
-)
-RETURNS SETOF public.address_and_distance
-AS $$
-DECLARE
-BEGIN
-	IF country IS NULL THEN
-        -- no country, use the simplified and fast functions
-		RETURN QUERY SELECT * FROM public._geocode_by_road_without_country_osm(
-            search_term, search_housenumber, max_results, center, radius
-        );
-	ELSE
-        -- have a country, use the more precise but slower functions
-		RETURN QUERY SELECT * FROM public._geocode_by_road_with_country_osm(
-            search_term, search_housenumber, max_results, center, radius,
-            country
-        );
-	END IF;
-END;
-$$ LANGUAGE 'plpgsql';
+        search_housenumber IS NULL
+        AND h.street_id = street
+    UNION ALL
+    -- exact or nearest house number (and suffix) on that street
+    SELECT hn.house_id
+    FROM (
+        SELECT number, suffix FROM public.parse_house_number(search_housenumber) LIMIT 1
+    ) q
+    JOIN LATERAL (
+        SELECT n.number, n.suffix
+        FROM public.osm_struct_house_number n
+        WHERE n.street_id = street
+        ORDER BY abs(n.number - q.number) ASC, (n.suffix <> q.suffix) ASC, n.number ASC, n.suffix ASC
+        LIMIT 1
+    ) best ON true
+    JOIN public.osm_struct_house_number hn ON
+        hn.street_id = street
+        AND hn.number = best.number
+        AND hn.suffix = best.suffix
+    UNION ALL
+    -- house number without a number (e.g. a name), compare the text
+    SELECT h.id
+    FROM public.osm_struct_house h
+    WHERE
+        search_housenumber IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM public.parse_house_number(search_housenumber))
+        AND h.street_id = street
+        AND lower(h.house_number) = lower(search_housenumber)
+$$ LANGUAGE 'sql' STABLE;
 
 
 --
--- geocode by searching road-names in combination with a city
---
--- optionally only search in an area around `center` (with the `radius` specified)
--- this function is used when no country search term is supplied
+-- Phase one of the forward geocoder: find candidate streets
 --
--- This query is quicker than matching against the country polygon additionally, but can be
--- imprecise when the address is near a country border
+-- Only searches the small streets and cities tables (trigram and spatial indices), the house
+-- table is not touched here. Returns at most `max_streets` streets, best trigram match first.
 --
-DROP FUNCTION IF EXISTS public._geocode_by_city_without_country_osm(
-    search_term TEXT, search_housenumber TEXT, search_city TEXT,
-    max_results int, center gis.geometry(point), radius int
+DROP FUNCTION IF EXISTS public._geocode_streets_osm(
+    search_term TEXT, search_postcode TEXT, search_city TEXT,
+    center gis.geometry(point), radius int, country_poly gis.geometry, max_streets int
 );
-CREATE OR REPLACE FUNCTION public._geocode_by_city_without_country_osm(
-	search_term TEXT,
-    search_housenumber TEXT,
-	search_city TEXT,
-	max_results int,
-	center gis.geometry(point),
-	radius int
+CREATE OR REPLACE FUNCTION public._geocode_streets_osm(
+    search_term TEXT,
+    search_postcode TEXT,
+    search_city TEXT,
+    center gis.geometry(point),
+    radius int,
+    country_poly gis.geometry,
+    max_streets int
 )
-RETURNS SETOF public.address_and_distance AS
+RETURNS TABLE (id integer, road text, postcode text, city text) AS
 $$
     SELECT
-        NULL::text AS house,
-        s.name::text as road,
-        h.house_number::text,
+        s.id,
+        s.name::text AS road,
         c.postcode::text,
-        NULLIF(c.name, '')::text as city,
-        NULLIF(a6.name, '')::text as county,
-        NULLIF(a4.name, '')::text as "state",
-        h.geometry::gis.geometry(point, 3857),
-        gis.ST_Distance(h.geometry, center) as distance,
-        '00000000-0000-0000-0000-000000000000'::uuid as license_id
-    FROM
-        public.osm_struct_streets s
+        c.name::text AS city
+    FROM public.osm_struct_streets s
     JOIN public.osm_struct_cities c ON s.city_id = c.id
-    JOIN public.osm_struct_house h ON h.street_id = s.id
-    LEFT JOIN public.osm_admin a4 ON gis.ST_Contains(a4.geometry, h.geometry::gis.geometry(point, 3857)) and a4.admin_level = 4
-    LEFT JOIN public.osm_admin a6 ON gis.ST_Contains(a6.geometry, h.geometry::gis.geometry(point, 3857)) and a6.admin_level = 6
     WHERE
-        (center IS NULL OR gis.ST_DWithin(h.geometry, center, radius)) -- only search around center if center is not null
-        AND c.name % search_city
-        AND s.name % search_term
-        AND (search_housenumber IS NULL OR h.house_number % search_housenumber)
+        s.name % search_term
+        AND (search_postcode IS NULL OR c.postcode % search_postcode)
+        AND (search_city IS NULL OR c.name % search_city)
+        AND (center IS NULL OR gis.ST_DWithin(s.extent, center, radius)) -- only search around center if center is not null
+        AND (country_poly IS NULL OR gis.ST_Intersects(s.extent, country_poly)) -- rough country filter on the street extent
     ORDER BY
-        distance ASC,
-        (s.name <-> search_term) ASC
-    LIMIT max_results;
-$$ LANGUAGE 'sql';
+        (s.name <-> search_term) ASC,
+        gis.ST_Distance(s.extent, center) ASC
+    LIMIT max_streets;
+$$ LANGUAGE 'sql' STABLE;
 
 
 --
--- geocode by searching road-names in combination with a city
+-- Phase two of the forward geocoder: fetch houses of the candidate streets
 --
--- optionally only search in an area around `center` (with the `radius` specified)
--- this function is used when a country search term is supplied (e.g. country may not be NULL)
+-- This is the single query plan used by all forward geocoding variants, so runtime depends on
+-- the number of matching streets and not on the size of the house table. Filters that are not
+-- used by a variant are passed as NULL.
 --
--- This query is a bit slower than just searching by center and radius as there will be a costly
--- intersection with the country polygon which can be rather large (5MB for germany for example)
+-- If a country is supplied, results are additionally intersected with the country polygon
+-- which is precise at country borders but a bit slower.
 --
-DROP FUNCTION IF EXISTS public._geocode_by_city_with_country_osm(
-    search_term TEXT, search_housenumber TEXT, search_city TEXT,
-    max_results int, center gis.geometry(point), radius int, country TEXT
+DROP FUNCTION IF EXISTS public._geocode_osm(
+    search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+    search_city TEXT, max_results int, center gis.geometry(point),
+    radius int, country TEXT, max_streets int
 );
-CREATE OR REPLACE FUNCTION public._geocode_by_city_with_country_osm(
-	search_term TEXT,
+CREATE OR REPLACE FUNCTION public._geocode_osm(
+    search_term TEXT,
     search_housenumber TEXT,
+    search_postcode TEXT,
     search_city TEXT,
-	max_results int,
-	center gis.geometry(point),
-	radius int,
-	country TEXT
+    max_results int,
+    center gis.geometry(point),
+    radius int,
+    country TEXT,
+    max_streets int
 )
 RETURNS SETOF public.address_and_distance AS
 $$
@@ -236,193 +134,162 @@ DECLARE
     country_poly gis.geometry;
 BEGIN
     -- prefetch the country polyon to avoid doing a join in the query
-	SELECT public._geocode_get_country_polygon(country) INTO country_poly;
+    IF country IS NOT NULL THEN
+        SELECT public._geocode_get_country_polygon(country) INTO country_poly;
+        -- unknown country, nothing can be inside of it
+        IF country_poly IS NULL THEN
+            RETURN;
+        END IF;
+    END IF;
 
     RETURN QUERY SELECT
         NULL::text AS house,
-        s.name::text as road,
-        h.house_number::text,
-        c.postcode::text,
-        NULLIF(c.name, '')::text as city,
+        x.road,
+        x.house_number,
+        x.postcode,
+        NULLIF(x.city, '')::text as city,
         NULLIF(a6.name, '')::text as county,
         NULLIF(a4.name, '')::text as "state",
-        h.geometry::gis.geometry(point, 3857),
-        gis.ST_Distance(h.geometry, center) as distance,
+        x.geometry,
+        x.distance,
         '00000000-0000-0000-0000-000000000000'::uuid as license_id
-    FROM
-        public.osm_struct_streets s
-    JOIN public.osm_struct_cities c ON s.city_id = c.id
-    JOIN public.osm_struct_house h ON h.street_id = s.id
-    LEFT JOIN public.osm_admin a4 ON gis.ST_Contains(a4.geometry, h.geometry::gis.geometry(point, 3857)) and a4.admin_level = 4
-    LEFT JOIN public.osm_admin a6 ON gis.ST_Contains(a6.geometry, h.geometry::gis.geometry(point, 3857)) and a6.admin_level = 6
-    WHERE
-        (center IS NULL OR gis.ST_DWithin(h.geometry, center, radius)) -- only search around center if center is not null
-        AND gis.ST_Within(gis.ST_Centroid(h.geometry), country_poly) -- intersect with country polygon
-        AND c.name % search_city
-        AND s.name % search_term
-        AND (search_housenumber IS NULL OR h.house_number % search_housenumber)
+    FROM (
+        SELECT
+            s.road,
+            h.house_number::text,
+            s.postcode,
+            s.city,
+            h.geometry::gis.geometry(point, 3857),
+            gis.ST_Distance(h.geometry, center) as distance,
+            (s.road <-> search_term) as trgm_dist
+        FROM public._geocode_streets_osm(
+            search_term, search_postcode, search_city, center, radius, country_poly, max_streets
+        ) s
+        JOIN LATERAL public._geocode_house_number_osm(s.id, search_housenumber) m(house_id) ON true
+        JOIN public.osm_struct_house h ON h.id = m.house_id
+        WHERE
+            (center IS NULL OR gis.ST_DWithin(h.geometry, center, radius)) -- only search around center if center is not null
+            AND (country_poly IS NULL OR gis.ST_Within(h.geometry, country_poly)) -- intersect with country polygon
+        ORDER BY
+            distance ASC,
+            trgm_dist ASC
+        LIMIT max_results -- limit here to avoid performing the admin joins on all rows
+    ) x
+    LEFT JOIN public.osm_admin a4 ON gis.ST_Contains(a4.geometry, x.geometry) and a4.admin_level = 4
+    LEFT JOIN public.osm_admin a6 ON gis.ST_Contains(a6.geometry, x.geometry) and a6.admin_level = 6
     ORDER BY
-        distance ASC,
-        (s.name <-> search_term) ASC
-    LIMIT max_results;
-END
-$$ LANGUAGE 'plpgsql';
+        x.distance ASC,
+        x.trgm_dist ASC;
+END;
+$$ LANGUAGE 'plpgsql' STABLE;
 
---
--- Convenience switching function that calls the correct detail function
---
--- This is the external interface to the forward geocoder
---
-DROP FUNCTION IF EXISTS public.geocode_by_city_osm(
+
+-- the search by road, city and postcode used to have a query for each variant,
+-- they all share the query plan of `_geocode_osm` now
+DROP FUNCTION IF EXISTS public._geocode_by_road_without_country_osm(
+    search_term TEXT, search_housenumber TEXT, max_results int,
+    center gis.geometry(point), radius int);
+DROP FUNCTION IF EXISTS public._geocode_by_road_with_country_osm(
+    search_term TEXT, search_housenumber TEXT, max_results int,
+    center gis.geometry(point), radius int, country TEXT);
+DROP FUNCTION IF EXISTS public._geocode_by_city_without_country_osm(
     search_term TEXT, search_housenumber TEXT, search_city TEXT,
-    max_results int, center gis.geometry(point), radius int, country TEXT
-);
-CREATE OR REPLACE FUNCTION public.geocode_by_city_osm(
-	search_term TEXT,
-    search_housenumber TEXT,
-    search_city TEXT,
-	max_results int,
-	center gis.geometry(point),
-	radius int,
-	country TEXT
-)
-RETURNS SETOF public.address_and_distance AS
-$$
-DECLARE
-BEGIN
-	IF country IS NULL THEN
-        -- no country, use the simplified and fast functions
-		RETURN QUERY SELECT * FROM public._geocode_by_city_without_country_osm(search_term, search_housenumber, search_city, max_results, center, radius);
-	ELSE
-        -- have a country, use the more precise but slower functions
-		RETURN QUERY SELECT * FROM public._geocode_by_city_with_country_osm(search_term, search_housenumber, search_city, max_results, center, radius, country);
-	END IF;
-END;
-$$ LANGUAGE 'plpgsql';
+    max_results int, center gis.geometry(point), radius int);
+DROP FUNCTION IF EXISTS public._geocode_by_city_with_country_osm(
+    search_term TEXT, search_housenumber TEXT, search_city TEXT,
+    max_results int, center gis.geometry(point), radius int, country TEXT);
+DROP FUNCTION IF EXISTS public._geocode_by_postcode_without_country_osm(
+    search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+    max_results int, center gis.geometry(point), radius int);
+DROP FUNCTION IF EXISTS public._geocode_by_postcode_with_country_osm(
+    search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+    max_results int, center gis.geometry(point), radius int, country TEXT);
 
 
 --
--- geocode by searching road-names in combination with a postcode
+-- geocode by searching road-names only
 --
 -- optionally only search in an area around `center` (with the `radius` specified)
--- this function is used when no country search term is supplied
+-- and in the `country` (if not NULL). `max_streets` is the number of candidate streets
+-- that will be searched for houses.
 --
--- This query is quicker than matching against the country polygon additionally, but can be
--- imprecise when the address is near a country border
---
-DROP FUNCTION IF EXISTS public._geocode_by_postcode_without_country_osm(
-    search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
-    max_results int, center gis.geometry(point), radius int
+DROP FUNCTION IF EXISTS public.geocode_by_road_osm(
+    search_term TEXT, search_housenumber TEXT, max_results int,
+    center gis.geometry(point), radius int, country TEXT
 );
-CREATE OR REPLACE FUNCTION public._geocode_by_postcode_without_country_osm(
+DROP FUNCTION IF EXISTS public.geocode_by_road_osm(
+    search_term TEXT, search_housenumber TEXT, max_results int,
+    center gis.geometry(point), radius int, country TEXT, max_streets int
+);
+CREATE OR REPLACE FUNCTION public.geocode_by_road_osm(
 	search_term TEXT,
     search_housenumber TEXT,
-	search_postcode TEXT,
 	max_results int,
 	center gis.geometry(point),
-	radius int
+	radius int,
+	country TEXT,
+    max_streets int DEFAULT 100
 )
 RETURNS SETOF public.address_and_distance AS
 $$
-    SELECT
-        NULL::text AS house,
-        s.name::text as road,
-        h.house_number::text,
-        c.postcode::text,
-        NULLIF(c.name, '')::text as city,
-        NULLIF(a6.name, '')::text as county,
-        NULLIF(a4.name, '')::text as "state",
-        h.geometry::gis.geometry(point, 3857),
-        gis.ST_Distance(h.geometry, center) as distance,
-        '00000000-0000-0000-0000-000000000000'::uuid as license_id
-    FROM
-        public.osm_struct_streets s
-    JOIN public.osm_struct_cities c ON s.city_id = c.id
-    JOIN public.osm_struct_house h ON h.street_id = s.id
-    LEFT JOIN public.osm_admin a4 ON gis.ST_Contains(a4.geometry, h.geometry::gis.geometry(point, 3857)) and a4.admin_level = 4
-    LEFT JOIN public.osm_admin a6 ON gis.ST_Contains(a6.geometry, h.geometry::gis.geometry(point, 3857)) and a6.admin_level = 6
-    WHERE
-        (center IS NULL OR gis.ST_DWithin(h.geometry, center, radius)) -- only search around center if center is not null
-        AND s.name % search_term
-        AND c.postcode % search_postcode
-        AND (search_housenumber IS NULL OR h.house_number % search_housenumber)
-    ORDER BY
-        distance ASC,
-        (s.name <-> search_term) ASC
-    LIMIT max_results;
-$$ LANGUAGE 'sql';
+    SELECT * FROM public._geocode_osm(
+        search_term, search_housenumber, NULL, NULL, max_results,
+        center, radius, country, max_streets
+    );
+$$ LANGUAGE 'sql' STABLE;
 
 
 --
--- geocode by searching road-names in combination with a postcode
+-- geocode by searching road-names in combination with a city
 --
 -- optionally only search in an area around `center` (with the `radius` specified)
--- this function is used when no country search term is supplied
+-- and in the `country` (if not NULL). `max_streets` is the number of candidate streets
+-- that will be searched for houses.
 --
--- This query is a bit slower than just searching by center and radius as there will be a costly
--- intersection with the country polygon which can be rather large (5MB for germany for example)
---
-DROP FUNCTION IF EXISTS public._geocode_by_postcode_with_country_osm(
-    search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+DROP FUNCTION IF EXISTS public.geocode_by_city_osm(
+    search_term TEXT, search_housenumber TEXT, search_city TEXT,
     max_results int, center gis.geometry(point), radius int, country TEXT
 );
-CREATE OR REPLACE FUNCTION public._geocode_by_postcode_with_country_osm(
+DROP FUNCTION IF EXISTS public.geocode_by_city_osm(
+    search_term TEXT, search_housenumber TEXT, search_city TEXT,
+    max_results int, center gis.geometry(point), radius int, country TEXT,
+    max_streets int
+);
+CREATE OR REPLACE FUNCTION public.geocode_by_city_osm(
 	search_term TEXT,
     search_housenumber TEXT,
-	search_postcode TEXT,
+    search_city TEXT,
 	max_results int,
 	center gis.geometry(point),
 	radius int,
-    country TEXT
+	country TEXT,
+    max_streets int DEFAULT 100
 )
 RETURNS SETOF public.address_and_distance AS
 $$
-DECLARE
-    country_poly geometry;
-BEGIN
-    -- prefetch the country polyon to avoid doing a join in the query
-	SELECT public._geocode_get_country_polygon(country) INTO country_poly;
-
-    RETURN QUERY SELECT
-        NULL::text AS house,
-        s.name::text as road,
-        h.house_number::text,
-        c.postcode::text,
-        NULLIF(c.name, '')::text as city,
-        NULLIF(a6.name, '')::text as county,
-        NULLIF(a4.name, '')::text as "state",
-        h.geometry::gis.geometry(point, 3857),
-        gis.ST_Distance(h.geometry, center) as distance,
-        '00000000-0000-0000-0000-000000000000'::uuid as license_id
-    FROM
-        public.osm_struct_streets s
-    JOIN public.osm_struct_cities c ON s.city_id = c.id
-    JOIN public.osm_struct_house h ON h.street_id = s.id
-    LEFT JOIN public.osm_admin a4 ON gis.ST_Contains(a4.geometry, h.geometry::gis.geometry(point, 3857)) and a4.admin_level = 4
-    LEFT JOIN public.osm_admin a6 ON gis.ST_Contains(a6.geometry, h.geometry::gis.geometry(point, 3857)) and a6.admin_level = 6
-    WHERE
-        (center IS NULL OR gis.ST_DWithin(h.geometry, center, radius)) -- only search around center if center is not null
-        AND gis.ST_Within(gis.ST_Centroid(h.geometry), country_poly) -- intersect with country polygon
-        AND s.name % search_term
-        AND c.postcode % search_postcode
-        AND (search_housenumber IS NULL OR h.house_number % search_housenumber)
-    ORDER BY
-        distance ASC,
-        (s.name <-> search_term) ASC
-    LIMIT max_results;
-END;
-$$ LANGUAGE 'plpgsql';
+    SELECT * FROM public._geocode_osm(
+        search_term, search_housenumber, NULL, search_city, max_results,
+        center, radius, country, max_streets
+    );
+$$ LANGUAGE 'sql' STABLE;
 
 
 --
--- Convenience switching function that calls the correct detail function
+-- geocode by searching road-names in combination with a postcode
 --
--- This is the external interface to the forward geocoder
+-- optionally only search in an area around `center` (with the `radius` specified)
+-- and in the `country` (if not NULL). `max_streets` is the number of candidate streets
+-- that will be searched for houses.
 --
 DROP FUNCTION IF EXISTS public.geocode_by_postcode_osm(
     search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
     max_results int, center gis.geometry(point), radius int, country TEXT
 );
+DROP FUNCTION IF EXISTS public.geocode_by_postcode_osm(
+    search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+    max_results int, center gis.geometry(point), radius int, country TEXT,
+    max_streets int
+);
 CREATE OR REPLACE FUNCTION public.geocode_by_postcode_osm(
 	search_term TEXT,
     search_housenumber TEXT,
@@ -430,21 +297,16 @@ CREATE OR REPLACE FUNCTION public.geocode_by_postcode_osm(
 	max_results int,
 	center gis.geometry(point),
 	radius int,
-	country TEXT
+	country TEXT,
+    max_streets int DEFAULT 100
 )
 RETURNS SETOF public.address_and_distance AS
 $$
-DECLARE
-BEGIN
-	IF country IS NULL THEN
-        -- no country, use the simplified and fast functions
-		RETURN QUERY SELECT * FROM public._geocode_by_postcode_without_country_osm(search_term, search_housenumber, search_postcode, max_results, center, radius);
-	ELSE
-        -- have a country, use the more precise but slower functions
-		RETURN QUERY SELECT * FROM public._geocode_by_postcode_with_country_osm(search_term, search_housenumber, search_postcode, max_results, center, radius, country);
-	END IF;
-END;
-$$ LANGUAGE 'plpgsql';
+    SELECT * FROM public._geocode_osm(
+        search_term, search_housenumber, search_postcode, NULL, max_results,
+        center, radius, country, max_streets
+    );
+$$ LANGUAGE 'sql' STABLE;
 
 
 --
@@ -457,6 +319,11 @@ DROP FUNCTION IF EXISTS public.geocode_osm(
     search_city TEXT, max_results int, center gis.geometry(point),
     radius int, country TEXT
 );
+DROP FUNCTION IF EXISTS public.geocode_osm(
+    search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+    search_city TEXT, max_results int, center gis.geometry(point),
+    radius int, country TEXT, max_streets int
+);
 CREATE OR REPLACE FUNCTION public.geocode_osm(
 	search_term TEXT,
     search_housenumber TEXT,
@@ -465,7 +332,8 @@ CREATE OR REPLACE FUNCTION public.geocode_osm(
 	max_results int,
 	center gis.geometry(point),
 	radius int,
-	country TEXT
+	country TEXT,
+    max_streets int DEFAULT 100
 )
 RETURNS SETOF public.address_and_distance AS
 $$
@@ -474,23 +342,23 @@ BEGIN
     IF search_postcode IS NOT NULL THEN
         RETURN QUERY SELECT * FROM public.geocode_by_postcode_osm(
             search_term, search_housenumber, search_postcode, max_results,
-            center, radius, country
+            center, radius, country, max_streets
         );
         RETURN;
     END IF;
     IF search_city IS NOT NULL THEN
         RETURN QUERY SELECT * FROM public.geocode_by_city_osm(
             search_term, search_housenumber, search_city, max_results,
-            center, radius, country
+            center, radius, country, max_streets
         );
         RETURN;
     END IF;
 
     RETURN QUERY SELECT * FROM public.geocode_by_road_osm(
         search_term, search_housenumber, max_results, center, radius,
-        country
+        country, max_streets
     );
 END;
 $$ LANGUAGE 'plpgsql';
 
--- SELECT * FROM geocode_osm('Georgenstr', '34', NULL, 'Amberg', 10, NULL, NULL, NULL);
\ No newline at end of file
+-- SELECT * FROM geocode_osm('Georgenstr', '34', NULL, 'Amberg', 10, NULL, NULL, NULL);
@@ -98,4 +98,42 @@ BEGIN
 END;
 $$ LANGUAGE 'plpgsql';
 
+--
+-- Geocode a point to the nearest addresses from all sources in one query
+--
+-- By default openaddresses.io data is only searched if there is no OpenStreetMap address
+-- within the radius, set `merge_sources` to get the nearest addresses of both sources.
+--
+-- This is the external interface to the reverse geocoder
+--
+DROP FUNCTION IF EXISTS public.point_to_address(point gis.geometry(point), radius float, max_results int, merge_sources boolean);
+CREATE OR REPLACE FUNCTION public.point_to_address(
+	point gis.geometry(point),
+	radius float,
+	max_results int,
+	merge_sources boolean DEFAULT false
+)
+RETURNS SETOF public.address_and_distance AS
+$$
+BEGIN
+	IF merge_sources THEN
+		RETURN QUERY SELECT * FROM (
+			(SELECT * FROM public.point_to_address_osm(point, radius) LIMIT max_results)
+			UNION ALL
+			(SELECT * FROM public.point_to_address_oa(point, radius) LIMIT max_results)
+		) x
+		ORDER BY x.distance
+		LIMIT max_results;
+		RETURN;
+	END IF;
+
+	RETURN QUERY SELECT * FROM public.point_to_address_osm(point, radius) LIMIT max_results;
+	IF NOT FOUND THEN
+		-- try openaddresses.io
+		RETURN QUERY SELECT * FROM public.point_to_address_oa(point, radius) LIMIT max_results;
+	END IF;
+END;
+$$ LANGUAGE 'plpgsql' STABLE;
+
 -- SELECT * FROM point_to_address_osm(ST_Transform(ST_SetSRID(ST_MakePoint(9.738889, 47.550535), 4326), 3857), 250) LIMIT 10;
+-- SELECT * FROM point_to_address(ST_Transform(ST_SetSRID(ST_MakePoint(9.738889, 47.550535), 4326), 3857), 250, 10);
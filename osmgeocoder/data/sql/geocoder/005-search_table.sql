@@ -0,0 +1,248 @@
+DO
+$$
+DECLARE
+	search_exists boolean;
+BEGIN
+    SELECT EXISTS (
+        SELECT 1
+        FROM   information_schema.tables 
+        WHERE  table_schema = 'public'
+        AND    table_name = 'osm_struct_search'
+    ) INTO search_exists;
+
+	DROP FUNCTION IF EXISTS public.geocode_osm_search(
+		search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+		search_city TEXT, max_results int, center gis.geometry(point),
+		radius int, country TEXT
+	);
+	DROP FUNCTION IF EXISTS public.geocode_osm_search(
+		search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+		search_city TEXT, max_results int, center gis.geometry(point),
+		radius int, country TEXT, max_streets int
+	);
+	DROP FUNCTION IF EXISTS public.geocode_search(
+		search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+		search_city TEXT, max_results int, center gis.geometry(point),
+		radius int, country TEXT, max_streets int
+	);
+	DROP FUNCTION IF EXISTS public.point_to_address_osm_search(point gis.geometry(point), radius float);
+	DROP FUNCTION IF EXISTS public.point_to_address_search(
+		point gis.geometry(point), radius float, max_results int, merge_sources boolean
+	);
+
+	IF search_exists THEN
+		--
+		-- Forward geocoding on the denormalized search table
+		--
+		-- Same semantics and plan as `_geocode_osm`: at most `max_streets` candidate streets
+		-- from the small streets table first, then the exact or nearest house number per
+		-- street from the search table (by its street id index), but without the joins for
+		-- the address parts. Country is matched against the precomputed country name.
+		--
+		CREATE OR REPLACE FUNCTION public.geocode_osm_search(
+			search_term TEXT,
+			search_housenumber TEXT,
+			search_postcode TEXT,
+			search_city TEXT,
+			max_results int,
+			center gis.geometry(point),
+			radius int,
+			country TEXT,
+			max_streets int DEFAULT 100
+		)
+		RETURNS SETOF public.address_and_distance_wgs84 AS
+		$func$
+		DECLARE
+			country_poly gis.geometry;
+		BEGIN
+			-- rough country filter for the candidate streets, like `_geocode_osm`
+			IF geocode_osm_search.country IS NOT NULL THEN
+				SELECT public._geocode_get_country_polygon(geocode_osm_search.country) INTO country_poly;
+				-- unknown country, nothing can be inside of it
+				IF country_poly IS NULL THEN
+					RETURN;
+				END IF;
+			END IF;
+
+			RETURN QUERY SELECT
+				NULL::text AS house,
+				x.road,
+				x.house_number,
+				x.postcode,
+				x.city,
+				x.county,
+				x."state",
+				x.country,
+				x.geometry,
+				x.distance,
+				'00000000-0000-0000-0000-000000000000'::uuid as license_id,
+				x.lat,
+				x.lon
+			FROM (
+				SELECT
+					t.*,
+					gis.ST_Distance(t.geometry, center) AS distance,
+					(t.road <-> search_term) AS trgm_dist,
+					q.number AS search_number,
+					-- rank house numbers per street, 1 is the exact or nearest number
+					rank() OVER (
+						PARTITION BY t.street_id
+						ORDER BY
+							CASE
+								WHEN t.number_min IS NULL THEN NULL
+								ELSE greatest(t.number_min - q.number, q.number - t.number_max, 0)
+							END ASC,
+							(t.suffix <> q.suffix) ASC
+					) AS number_rank
+				FROM public._geocode_streets_osm(
+					search_term, search_postcode, search_city, center, radius, country_poly, max_streets
+				) s
+				JOIN public.osm_struct_search t ON t.street_id = s.id
+				LEFT JOIN (
+					SELECT number, suffix FROM public.parse_house_number(search_housenumber) LIMIT 1
+				) q ON true
+				WHERE
+					(geocode_osm_search.country IS NULL OR t.country % geocode_osm_search.country)
+					AND (center IS NULL OR gis.ST_DWithin(t.geometry, center, radius)) -- only search around center if center is not null
+			) x
+			WHERE
+				search_housenumber IS NULL
+				-- exact or nearest house number, like `_geocode_house_number_osm`
+				OR (x.search_number IS NOT NULL AND x.number_min IS NOT NULL AND x.number_rank = 1)
+				-- house number without a number (e.g. a name), compare the text
+				OR (x.search_number IS NULL AND lower(x.house_number) = lower(search_housenumber))
+			ORDER BY
+				x.distance ASC,
+				x.trgm_dist ASC
+			LIMIT max_results;
+		END;
+		$func$ LANGUAGE 'plpgsql' STABLE;
+
+		--
+		-- Forward geocoding on the search table and the openaddresses.io data in one query,
+		-- merged like `geocode` (the OpenStreetMap entry wins if an address is in both sources)
+		--
+		CREATE OR REPLACE FUNCTION public.geocode_search(
+			search_term TEXT,
+			search_housenumber TEXT,
+			search_postcode TEXT,
+			search_city TEXT,
+			max_results int,
+			center gis.geometry(point),
+			radius int,
+			country TEXT,
+			max_streets int DEFAULT 100
+		)
+		RETURNS SETOF public.address_and_distance_wgs84 AS
+		$func$
+		BEGIN
+			-- plpgsql, `geocode_oa` is created after this file
+			RETURN QUERY SELECT
+				x.house, x.road, x.house_number, x.postcode, x.city, x.county, x."state", x.country,
+				x.location, x.distance, x.license_id, x.lat, x.lon
+			FROM (
+				SELECT DISTINCT ON (lower(m.road), coalesce(lower(m.house_number), m.location::text), m.postcode)
+					m.*
+				FROM (
+					SELECT o.*, 0 AS source_rank
+					FROM public.geocode_osm_search(
+						search_term, search_housenumber, search_postcode, search_city,
+						max_results, center, radius, geocode_search.country, max_streets
+					) o
+					UNION ALL
+					SELECT
+						a.house, a.road, a.house_number, a.postcode, a.city, a.county, a."state",
+						NULL::text AS country,
+						a.location, a.distance, a.license_id,
+						gis.ST_Y(gis.ST_Transform(a.location, 4326)) AS lat,
+						gis.ST_X(gis.ST_Transform(a.location, 4326)) AS lon,
+						1 AS source_rank
+					FROM public.geocode_oa(
+						search_term, search_housenumber, search_postcode, search_city,
+						max_results, center, radius, geocode_search.country, max_streets
+					) a
+				) m
+				ORDER BY
+					lower(m.road),
+					coalesce(lower(m.house_number), m.location::text),
+					m.postcode,
+					m.source_rank
+			) x
+			ORDER BY
+				x.distance ASC,
+				(x.road <-> search_term) ASC
+			LIMIT max_results;
+		END;
+		$func$ LANGUAGE 'plpgsql' STABLE;
+
+		--
+		-- Reverse geocoding on the denormalized search table
+		--
+		CREATE OR REPLACE FUNCTION public.point_to_address_osm_search(point gis.geometry(point), radius float)
+		RETURNS SETOF public.address_and_distance_wgs84 AS
+		$func$
+			SELECT
+				NULL::text AS house,
+				t.road,
+				t.house_number,
+				t.postcode,
+				t.city,
+				t.county,
+				t."state",
+				t.country,
+				t.geometry as location,
+				gis.ST_Distance(t.geometry, point) as distance,
+				'00000000-0000-0000-0000-000000000000'::uuid as license_id,
+				t.lat,
+				t.lon
+			FROM public.osm_struct_search t
+			WHERE
+				gis.ST_DWithin(t.geometry, point, radius) -- only search within radius
+			ORDER BY gis.ST_Distance(t.geometry, point) -- order by distance to point
+		$func$ LANGUAGE 'sql' STABLE;
+
+		--
+		-- Reverse geocoding on the search table with openaddresses.io fallback in one query,
+		-- see `point_to_address`
+		--
+		CREATE OR REPLACE FUNCTION public.point_to_address_search(
+			point gis.geometry(point),
+			radius float,
+			max_results int,
+			merge_sources boolean DEFAULT false
+		)
+		RETURNS SETOF public.address_and_distance_wgs84 AS
+		$func$
+		BEGIN
+			IF NOT merge_sources THEN
+				RETURN QUERY SELECT * FROM public.point_to_address_osm_search(point, radius) LIMIT max_results;
+				IF FOUND THEN
+					RETURN;
+				END IF;
+			END IF;
+
+			RETURN QUERY SELECT * FROM (
+				(SELECT * FROM public.point_to_address_osm_search(point, radius) WHERE merge_sources LIMIT max_results)
+				UNION ALL
+				(
+					SELECT
+						a.house, a.road, a.house_number, a.postcode, a.city, a.county, a."state",
+						NULL::text AS country,
+						a.location, a.distance, a.license_id,
+						gis.ST_Y(gis.ST_Transform(a.location, 4326)) AS lat,
+						gis.ST_X(gis.ST_Transform(a.location, 4326)) AS lon
+					FROM public.point_to_address_oa(point, radius) a
+					LIMIT max_results
+				)
+			) x
+			ORDER BY x.distance
+			LIMIT max_results;
+		END;
+		$func$ LANGUAGE 'plpgsql' STABLE;
+	END IF;
+END;
+$$ LANGUAGE 'plpgsql';
+
+-- SELECT * FROM geocode_osm_search('Georgenstr', '34', NULL, 'Amberg', 10, NULL, NULL, NULL);
+-- SELECT * FROM geocode_search('Georgenstr', '34', NULL, 'Amberg', 10, NULL, NULL, NULL);
+-- SELECT * FROM point_to_address_osm_search(ST_Transform(ST_SetSRID(ST_MakePoint(9.738889, 47.550535), 4326), 3857), 250) LIMIT 10;
@@ -0,0 +1,242 @@
+DO
+$$
+DECLARE
+	oa_exists boolean;
+BEGIN
+    SELECT EXISTS (
+        SELECT 1
+        FROM   information_schema.tables
+        WHERE  table_schema = 'public'
+        AND    table_name = 'oa_city'
+    ) INTO oa_exists;
+
+	DROP FUNCTION IF EXISTS public._geocode_streets_oa(
+		search_term TEXT, search_postcode TEXT, search_city TEXT,
+		center gis.geometry(point), radius int, country_poly gis.geometry, max_streets int
+	);
+	DROP FUNCTION IF EXISTS public._geocode_house_number_oa(street integer, search_housenumber TEXT);
+	DROP FUNCTION IF EXISTS public._geocode_house_number_oa(street integer, extent gis.geometry, search_housenumber TEXT);
+	DROP FUNCTION IF EXISTS public.geocode_oa(
+		search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+		search_city TEXT, max_results int, center gis.geometry(point),
+		radius int, country TEXT, max_streets int
+	);
+
+	IF oa_exists THEN
+		--
+		-- Phase one of the openaddresses.io forward geocoder: find candidate streets
+		-- (uses the trigram indices on `oa_street` and `oa_city` and the street extent)
+		--
+		CREATE OR REPLACE FUNCTION public._geocode_streets_oa(
+			search_term TEXT,
+			search_postcode TEXT,
+			search_city TEXT,
+			center gis.geometry(point),
+			radius int,
+			country_poly gis.geometry,
+			max_streets int
+		)
+		RETURNS TABLE (id integer, extent gis.geometry, road text, postcode text, city text, license_id uuid) AS
+		$func$
+			SELECT
+				s.id,
+				s.extent,
+				s.street AS road,
+				c.postcode,
+				c.city,
+				c.license_id
+			FROM public.oa_street s
+			JOIN public.oa_city c ON s.city_id = c.id
+			WHERE
+				s.street % search_term
+				AND (search_postcode IS NULL OR c.postcode % search_postcode)
+				AND (search_city IS NULL OR c.city % search_city)
+				AND (center IS NULL OR gis.ST_DWithin(s.extent, center, radius)) -- only search around center if center is not null
+				AND (country_poly IS NULL OR gis.ST_Intersects(s.extent, country_poly)) -- rough country filter on the street extent
+			ORDER BY
+				(s.street <-> search_term) ASC,
+				gis.ST_Distance(s.extent, center) ASC
+			LIMIT max_streets;
+		$func$ LANGUAGE 'sql' STABLE;
+
+		--
+		-- Houses of a street that match the house number searched for, the exact or
+		-- nearest number, or all houses if no number was supplied.
+		--
+		-- House numbers are parsed on the fly, streets are small and the houses are
+		-- fetched by the street id index of the `oa_house` partitions. The street extent
+		-- bounds the partition key, so only the partitions covering the street are searched
+		--
+		CREATE OR REPLACE FUNCTION public._geocode_house_number_oa(street integer, extent gis.geometry, search_housenumber TEXT)
+		RETURNS TABLE ("name" text, housenumber text, location gis.geometry(point, 3857)) AS
+		$func$
+			WITH houses AS (
+				SELECT h."name", h.housenumber, h.location
+				FROM public.oa_house h
+				WHERE
+					h.street_id = street
+					-- same expression as the partition key of `oa_house`
+					AND gis.ST_X(h.location) BETWEEN gis.ST_XMin(extent) AND gis.ST_XMax(extent)
+			), numbers AS (
+				SELECT h.*, p.number, p.suffix
+				FROM houses h
+				CROSS JOIN LATERAL public.parse_house_number(h.housenumber) p
+			), q AS (
+				SELECT number, suffix FROM public.parse_house_number(search_housenumber) LIMIT 1
+			), best AS (
+				SELECT n.number, n.suffix
+				FROM numbers n, q
+				ORDER BY abs(n.number - q.number) ASC, (n.suffix <> q.suffix) ASC, n.number ASC, n.suffix ASC
+				LIMIT 1
+			)
+			-- no house number, return the complete street
+			SELECT h."name", h.housenumber, h.location
+			FROM houses h
+			WHERE search_housenumber IS NULL
+			UNION ALL
+			-- exact or nearest house number (and suffix) on that street
+			SELECT n."name", n.housenumber, n.location
+			FROM numbers n
+			JOIN best b ON n.number = b.number AND n.suffix = b.suffix
+			UNION ALL
+			-- house number without a number (e.g. a name), compare the text
+			SELECT h."name", h.housenumber, h.location
+			FROM houses h
+			WHERE
+				search_housenumber IS NOT NULL
+				AND NOT EXISTS (SELECT 1 FROM q)
+				AND lower(h.housenumber) = lower(search_housenumber)
+		$func$ LANGUAGE 'sql' STABLE;
+
+		--
+		-- Forward geocoding on the openaddresses.io data, same two phase plan and
+		-- parameters as `geocode_osm`
+		--
+		CREATE OR REPLACE FUNCTION public.geocode_oa(
+			search_term TEXT,
+			search_housenumber TEXT,
+			search_postcode TEXT,
+			search_city TEXT,
+			max_results int,
+			center gis.geometry(point),
+			radius int,
+			country TEXT,
+			max_streets int DEFAULT 100
+		)
+		RETURNS SETOF public.address_and_distance AS
+		$func$
+		DECLARE
+			country_poly gis.geometry;
+		BEGIN
+			-- prefetch the country polyon to avoid doing a join in the query
+			IF country IS NOT NULL THEN
+				SELECT public._geocode_get_country_polygon(country) INTO country_poly;
+				-- unknown country, nothing can be inside of it
+				IF country_poly IS NULL THEN
+					RETURN;
+				END IF;
+			END IF;
+
+			RETURN QUERY SELECT
+				NULLIF(trim(h."name"), '')::text AS house,
+				s.road,
+				NULLIF(trim(h.housenumber), '')::text AS house_number,
+				NULLIF(trim(s.postcode), '')::text AS postcode,
+				NULLIF(trim(s.city), '')::text AS city,
+				NULL::text AS county,
+				NULL::text AS "state",
+				h.location,
+				gis.ST_Distance(h.location, center) AS distance,
+				s.license_id
+			FROM public._geocode_streets_oa(
+				search_term, search_postcode, search_city, center, radius, country_poly, max_streets
+			) s
+			JOIN LATERAL public._geocode_house_number_oa(s.id, s.extent, search_housenumber) h ON true
+			WHERE
+				(center IS NULL OR gis.ST_DWithin(h.location, center, radius)) -- only search around center if center is not null
+				AND (country_poly IS NULL OR gis.ST_Within(h.location, country_poly)) -- intersect with country polygon
+			ORDER BY
+				distance ASC,
+				(s.road <-> search_term) ASC
+			LIMIT max_results;
+		END;
+		$func$ LANGUAGE 'plpgsql' STABLE;
+	ELSE
+		CREATE OR REPLACE FUNCTION public.geocode_oa(
+			search_term TEXT,
+			search_housenumber TEXT,
+			search_postcode TEXT,
+			search_city TEXT,
+			max_results int,
+			center gis.geometry(point),
+			radius int,
+			country TEXT,
+			max_streets int DEFAULT 100
+		)
+		RETURNS SETOF public.address_and_distance AS
+		$func$
+			SELECT NULL::public.address_and_distance LIMIT 0; -- return an empty set
+		$func$ LANGUAGE 'sql';
+	END IF;
+END;
+$$ LANGUAGE 'plpgsql';
+
+
+--
+-- Forward geocoding on OpenStreetMap and openaddresses.io data in one query
+--
+-- Both sources are searched and merged by distance and trigram similarity, if an address
+-- is found in both sources the OpenStreetMap entry wins.
+--
+-- This is the external interface to the forward geocoder
+--
+DROP FUNCTION IF EXISTS public.geocode(
+    search_term TEXT, search_housenumber TEXT, search_postcode TEXT,
+    search_city TEXT, max_results int, center gis.geometry(point),
+    radius int, country TEXT, max_streets int
+);
+CREATE OR REPLACE FUNCTION public.geocode(
+	search_term TEXT,
+    search_housenumber TEXT,
+    search_postcode TEXT,
+    search_city TEXT,
+	max_results int,
+	center gis.geometry(point),
+	radius int,
+	country TEXT,
+    max_streets int DEFAULT 100
+)
+RETURNS SETOF public.address_and_distance AS
+$$
+    SELECT
+        x.house, x.road, x.house_number, x.postcode, x.city, x.county, x."state",
+        x.location, x.distance, x.license_id
+    FROM (
+        SELECT DISTINCT ON (lower(m.road), coalesce(lower(m.house_number), m.location::text), m.postcode)
+            m.*
+        FROM (
+            SELECT o.*, 0 AS source_rank
+            FROM public.geocode_osm(
+                search_term, search_housenumber, search_postcode, search_city,
+                max_results, center, radius, country, max_streets
+            ) o
+            UNION ALL
+            SELECT a.*, 1 AS source_rank
+            FROM public.geocode_oa(
+                search_term, search_housenumber, search_postcode, search_city,
+                max_results, center, radius, country, max_streets
+            ) a
+        ) m
+        ORDER BY
+            lower(m.road),
+            coalesce(lower(m.house_number), m.location::text),
+            m.postcode,
+            m.source_rank
+    ) x
+    ORDER BY
+        x.distance ASC,
+        (x.road <-> search_term) ASC
+    LIMIT max_results;
+$$ LANGUAGE 'sql' STABLE;
+
+-- SELECT * FROM geocode('Georgenstr', '34', NULL, 'Amberg', 10, NULL, NULL, NULL);
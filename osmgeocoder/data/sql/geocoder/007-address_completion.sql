@@ -0,0 +1,83 @@
+--
+-- Complete a partially typed address (`street number, postcode city`) for type-ahead
+--
+-- The input is normalized like the keys of `address_completion` and searched as a prefix,
+-- so every call is a few short range scans of the key indices. With a center the
+-- first candidates of the geohash cells around it (see `word_regions()`) are sorted
+-- by distance, the list is then filled up with candidates of the whole table in key
+-- order. An address is returned once, even if it is in OpenStreetMap and
+-- openaddresses.io data or matches both of its keys.
+--
+CREATE OR REPLACE FUNCTION public.complete_address(search text, center gis.geometry, max_results int)
+RETURNS TABLE (road text, house_number text, postcode text, city text, distance float, lat float, lon float) AS
+$$
+#variable_conflict use_column
+DECLARE
+    prefix text := public.normalize_address(search);
+    -- sorts after every key starting with the prefix
+    prefix_end text := public.normalize_address(search) || chr(1114111);
+    -- rows read per region and from the whole table, a few keys per address
+    candidates int := greatest(200, max_results * 4);
+    found_addresses text[] := '{}';
+BEGIN
+    IF prefix = '' OR max_results < 1 OR to_regclass('public.address_completion') IS NULL THEN
+        RETURN;
+    END IF;
+
+    IF center IS NOT NULL THEN
+        FOR road, house_number, postcode, city, distance, lat, lon IN
+            SELECT x.road, x.house_number, x.postcode, x.city, x.distance,
+                gis.ST_Y(gis.ST_Transform(x.geometry, 4326)), gis.ST_X(gis.ST_Transform(x.geometry, 4326))
+            FROM (
+                SELECT DISTINCT ON (a.road, a.house_number, a.postcode, a.city)
+                    a.road, a.house_number, a.postcode, a.city, a.geometry,
+                    gis.ST_Distance(a.geometry, center) AS distance
+                FROM unnest(public.word_regions(center)) r
+                CROSS JOIN LATERAL (
+                    SELECT * FROM public.address_completion c
+                    WHERE
+                        c.region = r COLLATE "C"
+                        AND c.key >= prefix COLLATE "C"
+                        AND c.key < prefix_end COLLATE "C"
+                    ORDER BY c.key COLLATE "C"
+                    LIMIT candidates
+                ) a
+                ORDER BY a.road, a.house_number, a.postcode, a.city, distance
+            ) x
+            ORDER BY x.distance
+            LIMIT max_results
+        LOOP
+            found_addresses := found_addresses || concat_ws('|', road, house_number, postcode, city);
+            RETURN NEXT;
+        END LOOP;
+    END IF;
+
+    IF coalesce(array_length(found_addresses, 1), 0) >= max_results THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+        SELECT x.road, x.house_number, x.postcode, x.city, x.distance,
+            gis.ST_Y(gis.ST_Transform(x.geometry, 4326)), gis.ST_X(gis.ST_Transform(x.geometry, 4326))
+        FROM (
+            SELECT DISTINCT ON (a.road, a.house_number, a.postcode, a.city)
+                a.key, a.road, a.house_number, a.postcode, a.city, a.geometry,
+                gis.ST_Distance(a.geometry, center) AS distance
+            FROM (
+                SELECT * FROM public.address_completion c
+                WHERE
+                    c.key >= prefix COLLATE "C"
+                    AND c.key < prefix_end COLLATE "C"
+                ORDER BY c.key COLLATE "C"
+                LIMIT candidates
+            ) a
+            WHERE NOT concat_ws('|', a.road, a.house_number, a.postcode, a.city) = ANY(found_addresses)
+            ORDER BY a.road, a.house_number, a.postcode, a.city, a.key
+        ) x
+        ORDER BY x.key, x.distance
+        LIMIT max_results - coalesce(array_length(found_addresses, 1), 0);
+END;
+$$ LANGUAGE 'plpgsql' STABLE;
+
+-- SELECT * FROM complete_address('Hauptstr 1', NULL, 10);
+-- SELECT * FROM complete_address('Hauptstr 1', ST_Transform(ST_SetSRID(ST_MakePoint(10.9, 48.37), 4326), 3857), 10);
@@ -1,6 +1,18 @@
+-- depends:
 -- copy table
-DROP TABLE IF EXISTS public.osm_struct_house;
-SELECT crypto.gen_random_uuid() AS id, osm_id, city, postcode, street, house_number, geometry INTO public.osm_struct_house FROM public.osm_house_number;
+DROP TABLE IF EXISTS osm_build.osm_struct_house;
+CREATE TABLE osm_build.osm_struct_house (
+	id serial,
+	source "char", -- 'h' = osm_house_number, 'b' = osm_buildings (node and way ids may collide)
+	osm_id bigint,
+	city text,
+	postcode text,
+	street text,
+	house_number text,
+	geometry gis.geometry(point, 3857)
+);
+INSERT INTO osm_build.osm_struct_house (source, osm_id, city, postcode, street, house_number, geometry)
+SELECT 'h', osm_id, city, postcode, street, house_number, geometry FROM public.osm_house_number;
 
 CREATE INDEX IF NOT EXISTS osm_buildings_house_number_idx ON public.osm_buildings USING BTREE(house_number);
-ANALYZE public.osm_buildings;
\ No newline at end of file
+ANALYZE public.osm_buildings;
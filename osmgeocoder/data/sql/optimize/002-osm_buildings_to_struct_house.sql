@@ -1,9 +1,12 @@
+-- depends: 001
+-- tiles: public.osm_buildings.geometry
 CREATE INDEX IF NOT EXISTS osm_buildings_empty_house_number_idx ON public.osm_buildings((house_number <> '')) WHERE house_number <> '';
 ANALYZE osm_buildings;
 
-INSERT INTO public.osm_struct_house (id, osm_id, city, postcode, street, house_number, geometry)
+-- per tile:
+INSERT INTO osm_build.osm_struct_house (source, osm_id, city, postcode, street, house_number, geometry)
 SELECT 
-	crypto.gen_random_uuid() AS id,
+	'b' AS source,
 	b.osm_id,
 	'' AS city,
 	p.postcode,
@@ -12,4 +15,7 @@ SELECT
 	gis.ST_Centroid(b.geometry) AS geometry
 FROM public.osm_buildings b 
 JOIN public.osm_postal_code p ON gis.ST_Within(gis.ST_Centroid(b.geometry), p.geometry)
-WHERE b.house_number <> '';
\ No newline at end of file
+WHERE
+	b.house_number <> ''
+	AND b.geometry && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+	AND public._in_tile(gis.ST_Centroid(b.geometry), %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s);
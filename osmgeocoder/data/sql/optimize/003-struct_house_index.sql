@@ -1,5 +1,7 @@
-CREATE INDEX osm_struct_house_city_idx ON public.osm_struct_house USING BTREE(city);
-CREATE INDEX osm_struct_house_postcode_idx ON public.osm_struct_house USING BTREE(postcode);
-CREATE INDEX osm_struct_house_street_idx ON public.osm_struct_house USING BTREE(street);
+-- depends: 002
+CREATE INDEX osm_struct_house_city_idx ON osm_build.osm_struct_house USING BTREE(city);
+CREATE INDEX osm_struct_house_postcode_idx ON osm_build.osm_struct_house USING BTREE(postcode);
+CREATE INDEX osm_struct_house_street_idx ON osm_build.osm_struct_house USING BTREE(street);
+CREATE INDEX osm_struct_house_geometry ON osm_build.osm_struct_house USING GIST(geometry);
 
-ANALYZE public.osm_struct_house;
\ No newline at end of file
+ANALYZE osm_build.osm_struct_house;
\ No newline at end of file
@@ -1,7 +1,12 @@
+-- depends: 003
+-- tiles: osm_build.osm_struct_house.geometry
+-- per tile:
 -- update street only entries
-UPDATE public.osm_struct_house h SET postcode = p.postcode
+UPDATE osm_build.osm_struct_house h SET postcode = p.postcode
 FROM public.osm_postal_code p
 WHERE
 	h.city = ''
 	AND h.postcode = ''
-	AND gis.ST_Within(h.geometry, p.geometry);
\ No newline at end of file
+	AND h.geometry && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+	AND public._in_tile(h.geometry, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
+	AND gis.ST_Within(h.geometry, p.geometry);
@@ -1,16 +1,23 @@
+-- depends: 004
+-- tiles: osm_build.osm_struct_house.geometry
+-- per tile:
 -- update postcode only entries
-UPDATE public.osm_struct_house h SET city = a.name
+UPDATE osm_build.osm_struct_house h SET city = a.name
 FROM public.osm_admin a
 WHERE
 	h.city = ''
 	AND h.postcode <> ''
+	AND h.geometry && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+	AND public._in_tile(h.geometry, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
 	AND a.admin_level = 8
 	AND gis.ST_Within(h.geometry, a.geometry);
 
-UPDATE public.osm_struct_house h SET city = a.name
+UPDATE osm_build.osm_struct_house h SET city = a.name
 FROM public.osm_admin a
 WHERE
 	h.city = ''
 	AND h.postcode <> ''
+	AND h.geometry && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+	AND public._in_tile(h.geometry, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
 	AND a.admin_level = 6
-	AND gis.ST_Within(h.geometry, a.geometry);
\ No newline at end of file
+	AND gis.ST_Within(h.geometry, a.geometry);
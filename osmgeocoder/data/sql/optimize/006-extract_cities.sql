@@ -1,14 +1,15 @@
+-- depends: 005
 -- drop calculated tables
-DROP TABLE IF EXISTS public.osm_struct_streets;
-DROP TABLE IF EXISTS public.osm_struct_cities;
+DROP TABLE IF EXISTS osm_build.osm_struct_streets;
+DROP TABLE IF EXISTS osm_build.osm_struct_cities;
 
 -- extract cities
 SELECT
-	crypto.gen_random_uuid() AS id,
+	(row_number() OVER (ORDER BY city, postcode))::int AS id,
 	city AS name,
 	postcode,
 	gis.ST_SetSRID(gis.ST_Extent(geometry), 3857) AS extent
-INTO public.osm_struct_cities
-FROM public.osm_struct_house
+INTO osm_build.osm_struct_cities
+FROM osm_build.osm_struct_house
 WHERE city <> '' OR postcode <> ''
 GROUP BY city, postcode;
\ No newline at end of file
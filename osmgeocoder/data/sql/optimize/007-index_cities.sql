@@ -1,8 +1,14 @@
-ALTER TABLE public.osm_struct_cities ADD PRIMARY KEY (id);
+-- depends: 006
+ALTER TABLE osm_build.osm_struct_cities ADD PRIMARY KEY (id);
 
-CREATE INDEX osm_struct_cities_name_idx ON public.osm_struct_cities USING BTREE(name);
-CREATE INDEX osm_struct_cities_postcode_idx ON public.osm_struct_cities USING BTREE(postcode);
-CREATE INDEX osm_struct_cities_extent_idx ON public.osm_struct_cities USING GIST(extent);
+-- filled later, added here so the update does not need to lock the table
+ALTER TABLE osm_build.osm_struct_cities ADD COLUMN geometry gis.geometry(geometry, 3857);
 
-ANALYZE public.osm_struct_cities;
+CREATE INDEX osm_struct_cities_name_idx ON osm_build.osm_struct_cities USING BTREE(name);
+CREATE INDEX osm_struct_cities_postcode_idx ON osm_build.osm_struct_cities USING BTREE(postcode);
+CREATE INDEX osm_struct_cities_name_trgm_idx ON osm_build.osm_struct_cities USING GIN(name gin_trgm_ops);
+CREATE INDEX osm_struct_cities_postcode_trgm_idx ON osm_build.osm_struct_cities USING GIN(postcode gin_trgm_ops);
+CREATE INDEX osm_struct_cities_extent_idx ON osm_build.osm_struct_cities USING GIST(extent);
+
+ANALYZE osm_build.osm_struct_cities;
 
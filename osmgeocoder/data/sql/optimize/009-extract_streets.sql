@@ -1,9 +1,10 @@
+-- depends: 008
 -- extract streets
 SELECT
-	crypto.gen_random_uuid() AS id,
+	(row_number() OVER (ORDER BY city_id, street))::int AS id,
 	street AS name,
 	city_id,
 	gis.ST_SetSRID(gis.ST_Extent(geometry), 3857) AS extent
-INTO public.osm_struct_streets
-FROM public.osm_struct_house
+INTO osm_build.osm_struct_streets
+FROM osm_build.osm_struct_house
 GROUP BY city_id, street;
\ No newline at end of file
@@ -1,7 +1,14 @@
-ALTER TABLE public.osm_struct_streets ADD PRIMARY KEY (id);
+-- depends: 009
+ALTER TABLE osm_build.osm_struct_streets ADD PRIMARY KEY (id);
 
-CREATE INDEX osm_struct_streets_name_idx ON public.osm_struct_streets USING BTREE(name);
-CREATE INDEX osm_struct_streets_city_idx ON public.osm_struct_streets USING BTREE(city_id);
-CREATE INDEX osm_struct_streets_extent_idx ON public.osm_struct_streets USING GIST(extent);
+-- filled later, added here so the update does not need to lock the table
+ALTER TABLE osm_build.osm_struct_streets ADD COLUMN geometry gis.geometry(linestring, 3857);
 
-ALTER TABLE public.osm_struct_house ADD COLUMN street_id uuid REFERENCES public.osm_struct_streets (id);
+CREATE INDEX osm_struct_streets_name_idx ON osm_build.osm_struct_streets USING BTREE(name);
+CREATE INDEX osm_struct_streets_name_trgm_idx ON osm_build.osm_struct_streets USING GIN(name gin_trgm_ops);
+CREATE INDEX osm_struct_streets_city_idx ON osm_build.osm_struct_streets USING BTREE(city_id);
+CREATE INDEX osm_struct_streets_extent_idx ON osm_build.osm_struct_streets USING GIST(extent);
+
+ALTER TABLE osm_build.osm_struct_house ADD COLUMN street_id integer REFERENCES osm_build.osm_struct_streets (id);
+
+ANALYZE osm_build.osm_struct_streets;
@@ -1,8 +1,9 @@
-UPDATE public.osm_struct_house h
+-- depends: 010
+UPDATE osm_build.osm_struct_house h
 	SET street_id = s.id
-	FROM public.osm_struct_streets s
+	FROM osm_build.osm_struct_streets s
 	WHERE
 		s.city_id = h.city_id
 		AND s.name = h.street;
 
-CREATE INDEX osm_struct_house_street_id_idx ON public.osm_struct_house USING BTREE(street_id);
\ No newline at end of file
+CREATE INDEX osm_struct_house_street_id_idx ON osm_build.osm_struct_house USING BTREE(street_id);
\ No newline at end of file
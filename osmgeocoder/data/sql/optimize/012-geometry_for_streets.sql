@@ -1,8 +1,11 @@
+-- depends: 010
+-- tiles: osm_build.osm_struct_streets.extent
+-- per tile:
 -- fetch geometry for street from osm_roads
-ALTER TABLE public.osm_struct_streets ADD COLUMN geometry gis.geometry(linestring, 3857);
-
-UPDATE public.osm_struct_streets s SET geometry = r.geometry
+UPDATE osm_build.osm_struct_streets s SET geometry = r.geometry
 	FROM public.osm_roads r
 	WHERE
 		r.street = s.name
+		AND s.extent && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+		AND public._in_tile(gis.ST_Centroid(s.extent), %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
 		AND gis.ST_Intersects(s.extent, gis.ST_SetSRID(gis.Box2D(r.geometry), 3857));
@@ -1,17 +1,22 @@
+-- depends: 008
+-- tiles: osm_build.osm_struct_cities.extent
+-- per tile:
 -- fetch geometry for city from osm_admin
-ALTER TABLE public.osm_struct_cities ADD COLUMN geometry gis.geometry(geometry, 3857);
-
-UPDATE public.osm_struct_cities c SET geometry = p.geometry
+UPDATE osm_build.osm_struct_cities c SET geometry = p.geometry
 	FROM public.osm_postal_code p
 	WHERE
 		c.geometry IS NULL
 		AND p.postcode = c.postcode
+		AND c.extent && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+		AND public._in_tile(gis.ST_Centroid(c.extent), %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
 		AND gis.ST_Intersects(c.extent, gis.ST_SetSRID(gis.Box2D(p.geometry), 3857));
 
-UPDATE public.osm_struct_cities c SET geometry = a.geometry
+UPDATE osm_build.osm_struct_cities c SET geometry = a.geometry
 	FROM public.osm_admin a
 	WHERE
 		c.geometry IS NULL
 		AND a.name = c.name
 		AND a.admin_level = 8
-		AND gis.ST_Intersects(c.extent, gis.ST_SetSRID(gis.Box2D(a.geometry), 3857));
\ No newline at end of file
+		AND c.extent && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+		AND public._in_tile(gis.ST_Centroid(c.extent), %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
+		AND gis.ST_Intersects(c.extent, gis.ST_SetSRID(gis.Box2D(a.geometry), 3857));
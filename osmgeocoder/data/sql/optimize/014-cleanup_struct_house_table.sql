@@ -1,5 +1,6 @@
+-- depends: 011, 012, 013
 -- clean up
-ALTER TABLE public.osm_struct_house DROP COLUMN city, DROP COLUMN postcode, DROP COLUMN street, DROP COLUMN city_id;
-ANALYZE public.osm_struct_cities;
-ANALYZE public.osm_struct_house;
-ANALYZE public.osm_struct_streets;
\ No newline at end of file
+ALTER TABLE osm_build.osm_struct_house DROP COLUMN city, DROP COLUMN postcode, DROP COLUMN street, DROP COLUMN city_id;
+ANALYZE osm_build.osm_struct_cities;
+ANALYZE osm_build.osm_struct_house;
+ANALYZE osm_build.osm_struct_streets;
\ No newline at end of file
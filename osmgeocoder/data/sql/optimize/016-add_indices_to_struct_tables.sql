@@ -1,9 +1,19 @@
-CREATE INDEX osm_struct_house_street_id_idx ON public.osm_struct_house USING BTREE(street_id);
+-- depends: 015
+-- the indices are built concurrently, the primary key is attached to its index
+-- afterwards as adding it directly would lock the table for the other index builds
+-- job: house primary key index
+CREATE UNIQUE INDEX IF NOT EXISTS osm_struct_house_pkey ON osm_build.osm_struct_house USING BTREE(id);
+-- job: house street index
+CREATE INDEX IF NOT EXISTS osm_struct_house_street_id_idx ON osm_build.osm_struct_house USING BTREE(street_id);
+-- job: house geometry index
+CREATE INDEX IF NOT EXISTS osm_struct_house_geometry ON osm_build.osm_struct_house USING GIST(geometry);
+-- job: street geometry index
+CREATE INDEX IF NOT EXISTS osm_struct_street_geometry ON osm_build.osm_struct_streets USING GIST(geometry);
+-- job: city geometry index
+CREATE INDEX IF NOT EXISTS osm_struct_city_geometry ON osm_build.osm_struct_cities USING GIST(geometry);
+-- finally:
+ALTER TABLE osm_build.osm_struct_house ADD CONSTRAINT osm_struct_house_pkey PRIMARY KEY USING INDEX osm_struct_house_pkey;
 
-CREATE INDEX osm_struct_house_geometry ON public.osm_struct_house USING GIST(geometry);
-CREATE INDEX osm_struct_street_geometry ON public.osm_struct_streets USING GIST(geometry);
-CREATE INDEX osm_struct_city_geometry ON public.osm_struct_cities USING GIST(geometry);
-
-ANALYZE public.osm_struct_house;
-ANALYZE public.osm_struct_streets;
-ANALYZE public.osm_struct_cities;
\ No newline at end of file
+ANALYZE osm_build.osm_struct_house;
+ANALYZE osm_build.osm_struct_streets;
+ANALYZE osm_build.osm_struct_cities;
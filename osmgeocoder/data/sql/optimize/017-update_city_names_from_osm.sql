@@ -1,34 +1,63 @@
+-- depends:
+-- tiles: public.oa_city_centroid.centroid
+--
+-- Fill in empty openaddresses.io city names from the OpenStreetMap admin_level 8
+-- boundary containing the centroid of the houses of the city.
+--
+-- The centroids are calculated once, the lookup and update then run per tile.
+-- Older imports stored empty values as a space, so names are trimmed.
+--
+DROP TABLE IF EXISTS public.oa_city_centroid;
+
 DO
 $$
 DECLARE
-	r record;
 	oa_exists boolean;
 BEGIN
     SELECT EXISTS (
         SELECT 1
-        FROM   information_schema.tables 
+        FROM   information_schema.tables
         WHERE  table_schema = 'public'
         AND    table_name = 'oa_city'
     ) INTO oa_exists;
 
-	IF oa_exists THEN 
-		FOR r IN
-			SELECT x.id, a."name" AS city
-			FROM (
-				SELECT
-					c.id,
-					c.city,
-					gis.ST_Centroid(gis.ST_Collect(array_agg(h.location))) AS centroid
-				FROM public.oa_city c
-				JOIN public.oa_street s ON c.id = s.city_id
-				JOIN public.oa_house h ON s.id = h.street_id
-				WHERE c.city = ''
-				GROUP BY c.id
-			) x
-			JOIN public.osm_admin a ON (a.admin_level = 8 AND gis.ST_Contains(a.geometry, x.centroid))
-		LOOP
-			UPDATE public.oa_city SET city = r.city WHERE id = r.id;
-		END LOOP;
+	IF oa_exists THEN
+		CREATE UNLOGGED TABLE public.oa_city_centroid AS
+			SELECT
+				s.city_id AS id,
+				gis.ST_Centroid(gis.ST_Collect(h.location)) AS centroid
+			FROM public.oa_city c
+			JOIN public.oa_street s ON c.id = s.city_id
+			JOIN public.oa_house h ON s.id = h.street_id
+			WHERE trim(c.city) = ''
+			GROUP BY s.city_id;
+	ELSE
+		CREATE UNLOGGED TABLE public.oa_city_centroid (id integer, centroid gis.geometry);
+	END IF;
+END;
+$$ LANGUAGE 'plpgsql';
+
+CREATE INDEX oa_city_centroid_idx ON public.oa_city_centroid USING GIST(centroid);
+CREATE INDEX IF NOT EXISTS osm_admin_level_8_geometry_idx ON public.osm_admin USING GIST(geometry) WHERE admin_level = 8;
+ANALYZE public.oa_city_centroid;
+
+-- per tile:
+DO
+$$
+BEGIN
+	IF to_regclass('public.oa_city') IS NOT NULL THEN
+		-- the smallest boundary wins where boundaries overlap
+		UPDATE public.oa_city c SET city = x.city
+		FROM (
+			SELECT DISTINCT ON (cc.id) cc.id, a."name" AS city
+			FROM public.oa_city_centroid cc
+			JOIN public.osm_admin a ON (a.admin_level = 8 AND gis.ST_Contains(a.geometry, cc.centroid))
+			WHERE
+				cc.centroid && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+				AND public._in_tile(cc.centroid, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
+			ORDER BY cc.id, gis.ST_Area(a.geometry)
+		) x
+		WHERE c.id = x.id;
 	END IF;
 END;
 $$ LANGUAGE 'plpgsql';
@@ -1,3 +1,7 @@
+-- depends: 017
+-- centroids of the cities without a name, only needed by 017
+DROP TABLE IF EXISTS public.oa_city_centroid;
+
 DO
 $$
 DECLARE
@@ -0,0 +1,16 @@
+-- depends: 016
+-- parse house numbers into number and suffix, ranges get one row per number
+DROP TABLE IF EXISTS osm_build.osm_struct_house_number;
+
+SELECT
+	h.id AS house_id,
+	h.street_id,
+	p.number,
+	p.suffix
+INTO osm_build.osm_struct_house_number
+FROM osm_build.osm_struct_house h
+CROSS JOIN LATERAL public.parse_house_number(h.house_number) p
+WHERE h.street_id IS NOT NULL;
+
+CREATE INDEX osm_struct_house_number_idx ON osm_build.osm_struct_house_number USING BTREE(street_id, number, suffix);
+ANALYZE osm_build.osm_struct_house_number;
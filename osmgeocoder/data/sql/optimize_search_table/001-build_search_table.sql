@@ -0,0 +1,61 @@
+-- one row per addressable house with all address parts resolved, read only and
+-- used by the `_search` variants of the geocoding functions to avoid joins
+--
+-- built from the published structure tables into the `osm_build` schema and then
+-- published by `prepare_osm.py`
+DROP TABLE IF EXISTS osm_build.osm_struct_search;
+
+SELECT
+	h.id,
+	s.id AS street_id,
+	s.name AS road,
+	h.house_number,
+	p.number_min,
+	p.number_max,
+	p.suffix,
+	c.postcode,
+	NULLIF(c.name, '') AS city,
+	NULLIF(a6.name, '') AS county,
+	NULLIF(a4.name, '') AS "state",
+	NULLIF(a2.name, '') AS country,
+	h.geometry::gis.geometry(point, 3857) AS geometry,
+	gis.ST_Y(gis.ST_Transform(h.geometry, 4326)) AS lat,
+	gis.ST_X(gis.ST_Transform(h.geometry, 4326)) AS lon
+INTO osm_build.osm_struct_search
+FROM public.osm_struct_house h
+JOIN public.osm_struct_streets s ON h.street_id = s.id
+JOIN public.osm_struct_cities c ON s.city_id = c.id
+CROSS JOIN LATERAL (
+	SELECT min(number) AS number_min, max(number) AS number_max, min(suffix) AS suffix
+	FROM public.parse_house_number(h.house_number)
+) p
+LEFT JOIN LATERAL (
+	SELECT a.name FROM public.osm_admin a
+	WHERE a.admin_level = 2 AND gis.ST_Contains(a.geometry, h.geometry)
+	LIMIT 1
+) a2 ON true
+LEFT JOIN LATERAL (
+	SELECT a.name FROM public.osm_admin a
+	WHERE a.admin_level = 4 AND gis.ST_Contains(a.geometry, h.geometry)
+	LIMIT 1
+) a4 ON true
+LEFT JOIN LATERAL (
+	SELECT a.name FROM public.osm_admin a
+	WHERE a.admin_level = 6 AND gis.ST_Contains(a.geometry, h.geometry)
+	LIMIT 1
+) a6 ON true
+-- insert in geohash order, this clusters the table spatially
+ORDER BY gis.ST_Geohash(gis.ST_Transform(h.geometry, 4326));
+
+ALTER TABLE osm_build.osm_struct_search ADD PRIMARY KEY (id);
+
+-- reverse geocoding
+CREATE INDEX osm_struct_search_geometry_idx ON osm_build.osm_struct_search USING GIST(geometry);
+
+-- forward geocoding
+CREATE INDEX osm_struct_search_road_trgm_idx ON osm_build.osm_struct_search USING GIN(road gin_trgm_ops);
+CREATE INDEX osm_struct_search_city_trgm_idx ON osm_build.osm_struct_search USING GIN(city gin_trgm_ops);
+CREATE INDEX osm_struct_search_postcode_trgm_idx ON osm_build.osm_struct_search USING GIN(postcode gin_trgm_ops);
+CREATE INDEX osm_struct_search_street_number_idx ON osm_build.osm_struct_search USING BTREE(street_id, number_min);
+
+ANALYZE osm_build.osm_struct_search;
@@ -33,3 +33,30 @@ BEGIN
     END IF;
 END
 $$;
+
+--
+-- Address type for the denormalized search table, contains the country and
+-- the precomputed WGS84 coordinate
+--
+DO
+$$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'address_and_distance_wgs84') THEN
+		CREATE TYPE public.address_and_distance_wgs84 AS (
+			house text,
+			road text,
+			house_number text,
+			postcode text,
+			city text,
+			county text,
+			"state" text,
+			country text,
+			location gis.geometry(point, 3857),
+			distance float,
+			license_id uuid,
+			lat float,
+			lon float
+		);
+    END IF;
+END
+$$;
@@ -0,0 +1,25 @@
+--
+-- Split a house number into its numeric part and a lower case suffix
+--
+-- '12a' -> (12, 'a'), ranges like '3-5' are expanded to one row per number
+-- (3, ''), (4, ''), (5, ''). Returns an empty set if the string does not start
+-- with a number.
+--
+CREATE OR REPLACE FUNCTION public.parse_house_number(house_number TEXT)
+RETURNS TABLE (number int, suffix text) AS
+$$
+    SELECT
+        n::int AS number,
+        CASE WHEN m[3] IS NULL THEN lower(m[2]) ELSE '' END AS suffix
+    FROM regexp_matches(house_number, '^\s*(\d{1,9})\s*([[:alpha:]]?)\s*(?:[-–]\s*(\d{1,9}))?') AS m
+    CROSS JOIN LATERAL generate_series(
+        m[1]::int,
+        CASE
+            -- only expand sane ranges, everything else is probably a typo
+            WHEN m[3] IS NOT NULL AND m[3]::int > m[1]::int AND m[3]::int - m[1]::int <= 20 THEN m[3]::int
+            ELSE m[1]::int
+        END
+    ) AS n
+$$ LANGUAGE 'sql' IMMUTABLE;
+
+-- SELECT * FROM parse_house_number('3-5');
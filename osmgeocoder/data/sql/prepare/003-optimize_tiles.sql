@@ -0,0 +1,16 @@
+--
+-- Tile membership test for the tiled optimize steps
+--
+-- Tiles are half open boxes (the lower bound is included, the upper is not), so every
+-- point is assigned to exactly one tile of the grid. Combine with a bounding box test
+-- (`geometry && gis.ST_MakeEnvelope(...)`) to use the spatial indices.
+--
+CREATE OR REPLACE FUNCTION public._in_tile(point gis.geometry, xmin float, ymin float, xmax float, ymax float)
+RETURNS boolean AS
+$$
+    SELECT
+        gis.ST_X(point) >= xmin AND gis.ST_X(point) < xmax
+        AND gis.ST_Y(point) >= ymin AND gis.ST_Y(point) < ymax;
+$$ LANGUAGE 'sql' IMMUTABLE;
+
+-- SELECT _in_tile(ST_SetSRID(ST_MakePoint(1, 1), 3857), 0, 0, 10, 10);
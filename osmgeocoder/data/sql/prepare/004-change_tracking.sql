@@ -0,0 +1,455 @@
+--
+-- Change tracking for incremental OpenStreetMap updates
+--
+-- Triggers on the imposm tables record the id and bounding box of every changed row,
+-- `apply_osm_changes()` then re-derives only the affected houses, streets, cities and
+-- wordlist entries instead of rebuilding the structure tables.
+--
+CREATE TABLE IF NOT EXISTS public.osm_changes (
+    id bigserial PRIMARY KEY,
+    source text,        -- name of the changed imposm table
+    osm_id bigint,
+    bbox gis.geometry   -- bounding box of the old or new geometry
+);
+
+--
+-- Statement level trigger, records old and new rows of a change
+--
+CREATE OR REPLACE FUNCTION public._track_osm_changes() RETURNS trigger AS
+$$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO public.osm_changes (source, osm_id, bbox)
+        SELECT TG_TABLE_NAME, o.osm_id, gis.ST_Envelope(o.geometry) FROM old_rows o;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO public.osm_changes (source, osm_id, bbox)
+        SELECT TG_TABLE_NAME, n.osm_id, gis.ST_Envelope(n.geometry) FROM new_rows n;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE 'plpgsql';
+
+--
+-- Same for the admin boundaries, only the levels used to fill in missing city names
+-- are of interest (counties and states are resolved while geocoding)
+--
+CREATE OR REPLACE FUNCTION public._track_osm_admin_changes() RETURNS trigger AS
+$$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO public.osm_changes (source, osm_id, bbox)
+        SELECT TG_TABLE_NAME, o.osm_id, gis.ST_Envelope(o.geometry) FROM old_rows o WHERE o.admin_level IN (6, 8);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO public.osm_changes (source, osm_id, bbox)
+        SELECT TG_TABLE_NAME, n.osm_id, gis.ST_Envelope(n.geometry) FROM new_rows n WHERE n.admin_level IN (6, 8);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE 'plpgsql';
+
+--
+-- Install the change tracking triggers, run this after the optimize step (a full
+-- import replaces the imposm tables and with them the triggers)
+--
+CREATE OR REPLACE FUNCTION public.track_osm_changes() RETURNS void AS
+$$
+DECLARE
+    t text;
+    op text;
+    func text;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['osm_house_number', 'osm_buildings', 'osm_roads', 'osm_postal_code', 'osm_admin'] LOOP
+        func := CASE WHEN t = 'osm_admin' THEN '_track_osm_admin_changes' ELSE '_track_osm_changes' END;
+        FOREACH op IN ARRAY ARRAY['insert', 'update', 'delete'] LOOP
+            EXECUTE format('DROP TRIGGER IF EXISTS %I ON public.%I;', t || '_' || op || '_changes', t);
+            EXECUTE format(
+                'CREATE TRIGGER %I AFTER %s ON public.%I %s FOR EACH STATEMENT EXECUTE PROCEDURE public.%I();',
+                t || '_' || op || '_changes',
+                upper(op),
+                t,
+                CASE op
+                    WHEN 'insert' THEN 'REFERENCING NEW TABLE AS new_rows'
+                    WHEN 'update' THEN 'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows'
+                    ELSE 'REFERENCING OLD TABLE AS old_rows'
+                END,
+                func
+            );
+        END LOOP;
+    END LOOP;
+
+    -- lookup indices for the update, not needed for a static database
+    CREATE INDEX IF NOT EXISTS osm_struct_house_osm_id_idx ON public.osm_struct_house USING BTREE(osm_id, source);
+    CREATE INDEX IF NOT EXISTS osm_struct_house_number_house_id_idx ON public.osm_struct_house_number USING BTREE(house_id);
+
+    -- the structure tables are up to date now
+    TRUNCATE public.osm_changes;
+END;
+$$ LANGUAGE 'plpgsql';
+
+--
+-- Region of a word for regional text prediction: the geohash cell (3 characters, 1.40625
+-- degrees wide and high) of the center of a street extent, `word_regions()` uses the same cells
+--
+CREATE OR REPLACE FUNCTION public._word_region(extent gis.geometry) RETURNS text AS
+$$
+    SELECT coalesce(gis.ST_GeoHash(gis.ST_Transform(gis.ST_Centroid(extent), 4326), 3), '');
+$$ LANGUAGE 'sql' IMMUTABLE;
+
+--
+-- Word counts of the OpenStreetMap data per region like in `build_wordlist()`, restricted
+-- to some street and city names
+--
+DROP FUNCTION IF EXISTS public._osm_word_counts(street_names text[], city_names text[]);
+CREATE OR REPLACE FUNCTION public._osm_word_counts(street_names text[], city_names text[])
+RETURNS TABLE (region text, word text, ct bigint) AS
+$$
+BEGIN
+    RETURN QUERY SELECT x.region, x.word, x.ct FROM (
+        SELECT public._word_region(s.extent) as region, unnest(regexp_split_to_array(c.name, '\W')) as word, count(s.*) as ct
+            FROM public.osm_struct_cities c
+            JOIN public.osm_struct_streets s ON c.id = s.city_id
+            WHERE c.name = ANY(city_names)
+        GROUP BY c.name, public._word_region(s.extent)
+        UNION ALL
+        SELECT public._word_region(s.extent) as region, unnest(regexp_split_to_array(s.name, '\W')) as word, count(h.*) as ct
+            FROM public.osm_struct_streets s
+            JOIN public.osm_struct_house h ON s.id = h.street_id
+            WHERE s.name = ANY(street_names)
+        GROUP BY s.name, public._word_region(s.extent)
+    ) x;
+END;
+$$ LANGUAGE 'plpgsql' STABLE;
+
+--
+-- Add the word counts in the temporary `_word_delta` table (region, word, ct) to the
+-- wordlists and drop words that are not used anymore
+--
+-- Rows are locked in word order, so concurrent updates (e.g. openaddresses.io diff imports)
+-- wait for each other instead of deadlocking.
+--
+CREATE OR REPLACE FUNCTION public._apply_word_delta() RETURNS void AS
+$$
+BEGIN
+    INSERT INTO public.wordlist AS w (word, ct)
+    SELECT d.word, sum(d.ct) FROM _word_delta d GROUP BY d.word HAVING sum(d.ct) <> 0 ORDER BY d.word
+    ON CONFLICT (word) DO UPDATE SET ct = w.ct + EXCLUDED.ct;
+
+    DELETE FROM public.wordlist w
+    WHERE w.ct <= 0 AND w.word IN (SELECT d.word FROM _word_delta d GROUP BY d.word HAVING sum(d.ct) <> 0);
+
+    -- same for the regional counts, streets may have moved to another region
+    IF to_regclass('public.wordlist_region') IS NOT NULL THEN
+        INSERT INTO public.wordlist_region AS w (region, word, ct)
+        SELECT d.region, d.word, sum(d.ct) FROM _word_delta d
+        WHERE d.region <> '' AND d.word <> ''
+        GROUP BY d.region, d.word HAVING sum(d.ct) <> 0
+        ORDER BY d.region, d.word
+        ON CONFLICT (region, word) DO UPDATE SET ct = w.ct + EXCLUDED.ct;
+
+        DELETE FROM public.wordlist_region w
+        WHERE w.ct <= 0 AND (w.region, w.word) IN (
+            SELECT d.region, d.word FROM _word_delta d GROUP BY d.region, d.word HAVING sum(d.ct) <> 0
+        );
+    END IF;
+END;
+$$ LANGUAGE 'plpgsql';
+
+--
+-- Apply the recorded changes to the structure tables, returns the number of changes
+--
+-- Re-derives the houses of changed house numbers and buildings and of houses that got
+-- their postcode or city from a changed boundary (same rules as the optimize steps),
+-- then updates extents and geometries of the affected streets and cities, the house
+-- number index, the search table and the wordlist. Geocoding queries can run while
+-- the update is in progress.
+--
+CREATE OR REPLACE FUNCTION public.apply_osm_changes() RETURNS int AS
+$$
+DECLARE
+    change_count int;
+    street_names text[];
+    city_names text[];
+    wordlist_exists boolean;
+    search_exists boolean;
+    completion_exists boolean;
+BEGIN
+    -- one update at a time, readers are not blocked
+    LOCK TABLE public.osm_struct_house, public.osm_struct_streets, public.osm_struct_cities IN SHARE ROW EXCLUSIVE MODE;
+
+    wordlist_exists := to_regclass('public.wordlist') IS NOT NULL;
+    search_exists := to_regclass('public.osm_struct_search') IS NOT NULL;
+    completion_exists := to_regclass('public.address_completion') IS NOT NULL;
+
+    -- take the changes, changes recorded while updating are left for the next run
+    CREATE TEMPORARY TABLE _changes (source text, osm_id bigint, bbox gis.geometry) ON COMMIT DROP;
+    WITH d AS (
+        DELETE FROM public.osm_changes RETURNING source, osm_id, bbox
+    )
+    INSERT INTO _changes SELECT * FROM d;
+    GET DIAGNOSTICS change_count = ROW_COUNT;
+    IF change_count = 0 THEN
+        RETURN 0;
+    END IF;
+
+    -- source rows to re-derive
+    CREATE TEMPORARY TABLE _affected ON COMMIT DROP AS
+        SELECT 'h'::"char" AS source, c.osm_id FROM _changes c WHERE c.source = 'osm_house_number'
+        UNION
+        SELECT 'b'::"char", c.osm_id FROM _changes c WHERE c.source = 'osm_buildings'
+        UNION
+        -- house numbers without a city tag get postcode and city from the boundaries
+        SELECT 'h'::"char", n.osm_id
+        FROM _changes c
+        JOIN public.osm_house_number n ON n.geometry && c.bbox
+        WHERE c.source IN ('osm_postal_code', 'osm_admin') AND n.city = ''
+        UNION
+        -- buildings always do
+        SELECT 'b'::"char", b.osm_id
+        FROM _changes c
+        JOIN public.osm_buildings b ON b.geometry && c.bbox
+        WHERE c.source IN ('osm_postal_code', 'osm_admin') AND b.house_number <> '';
+
+    -- current state of the affected houses, streets and cities
+    CREATE TEMPORARY TABLE _old_house ON COMMIT DROP AS
+        SELECT h.id, h.street_id
+        FROM public.osm_struct_house h
+        JOIN _affected a ON h.source = a.source AND h.osm_id = a.osm_id;
+
+    CREATE TEMPORARY TABLE _streets ON COMMIT DROP AS
+        SELECT DISTINCT street_id AS id FROM _old_house WHERE street_id IS NOT NULL;
+
+    CREATE TEMPORARY TABLE _cities ON COMMIT DROP AS
+        SELECT DISTINCT s.city_id AS id
+        FROM public.osm_struct_streets s
+        JOIN _streets x ON s.id = x.id
+        WHERE s.city_id IS NOT NULL;
+
+    -- re-derive the houses like optimize steps 001 to 005
+    CREATE TEMPORARY TABLE _new_house (
+        source "char",
+        osm_id bigint,
+        city text,
+        postcode text,
+        street text,
+        house_number text,
+        geometry gis.geometry(point, 3857),
+        city_id integer,
+        street_id integer
+    ) ON COMMIT DROP;
+
+    INSERT INTO _new_house (source, osm_id, city, postcode, street, house_number, geometry)
+    SELECT 'h', n.osm_id, n.city, n.postcode, n.street, n.house_number, n.geometry
+    FROM public.osm_house_number n
+    JOIN _affected a ON a.source = 'h' AND a.osm_id = n.osm_id;
+
+    INSERT INTO _new_house (source, osm_id, city, postcode, street, house_number, geometry)
+    SELECT 'b', b.osm_id, '', p.postcode, b.street, b.house_number, gis.ST_Centroid(b.geometry)
+    FROM public.osm_buildings b
+    JOIN _affected a ON a.source = 'b' AND a.osm_id = b.osm_id
+    JOIN public.osm_postal_code p ON gis.ST_Within(gis.ST_Centroid(b.geometry), p.geometry)
+    WHERE b.house_number <> '';
+
+    UPDATE _new_house h SET postcode = p.postcode
+    FROM public.osm_postal_code p
+    WHERE h.city = '' AND h.postcode = '' AND gis.ST_Within(h.geometry, p.geometry);
+
+    UPDATE _new_house h SET city = a.name
+    FROM public.osm_admin a
+    WHERE h.city = '' AND h.postcode <> '' AND a.admin_level = 8 AND gis.ST_Within(h.geometry, a.geometry);
+
+    UPDATE _new_house h SET city = a.name
+    FROM public.osm_admin a
+    WHERE h.city = '' AND h.postcode <> '' AND a.admin_level = 6 AND gis.ST_Within(h.geometry, a.geometry);
+
+    -- word counts of all names that may change, before changing anything
+    IF wordlist_exists THEN
+        SELECT array_agg(DISTINCT name) INTO street_names FROM (
+            SELECT s.name FROM public.osm_struct_streets s JOIN _streets x ON s.id = x.id
+            UNION ALL
+            SELECT street FROM _new_house
+        ) x;
+        SELECT array_agg(DISTINCT name) INTO city_names FROM (
+            SELECT c.name FROM public.osm_struct_cities c JOIN _cities x ON c.id = x.id
+            UNION ALL
+            SELECT city FROM _new_house
+        ) x;
+
+        CREATE TEMPORARY TABLE _word_delta ON COMMIT DROP AS
+            SELECT w.region COLLATE "C" AS region, w.word, -w.ct AS ct FROM public._osm_word_counts(street_names, city_names) w;
+    END IF;
+
+    -- cities and streets that do not exist yet (optimize steps 006 to 011)
+    INSERT INTO public.osm_struct_cities (id, name, postcode)
+    SELECT m.max_id + row_number() OVER (ORDER BY x.city, x.postcode), x.city, x.postcode
+    FROM (SELECT DISTINCT city, postcode FROM _new_house WHERE city <> '' OR postcode <> '') x
+    CROSS JOIN (SELECT coalesce(max(id), 0) AS max_id FROM public.osm_struct_cities) m
+    WHERE NOT EXISTS (
+        SELECT 1 FROM public.osm_struct_cities c WHERE c.name = x.city AND c.postcode = x.postcode
+    );
+
+    UPDATE _new_house h SET city_id = c.id
+    FROM public.osm_struct_cities c
+    WHERE h.city = c.name AND h.postcode = c.postcode;
+
+    INSERT INTO public.osm_struct_streets (id, name, city_id)
+    SELECT m.max_id + row_number() OVER (ORDER BY x.city_id, x.street), x.street, x.city_id
+    FROM (SELECT DISTINCT city_id, street FROM _new_house WHERE city_id IS NOT NULL) x
+    CROSS JOIN (SELECT coalesce(max(id), 0) AS max_id FROM public.osm_struct_streets) m
+    WHERE NOT EXISTS (
+        SELECT 1 FROM public.osm_struct_streets s WHERE s.city_id = x.city_id AND s.name = x.street
+    );
+
+    UPDATE _new_house h SET street_id = s.id
+    FROM public.osm_struct_streets s
+    WHERE s.city_id = h.city_id AND s.name = h.street;
+
+    INSERT INTO _streets SELECT DISTINCT street_id FROM _new_house WHERE street_id IS NOT NULL;
+    INSERT INTO _cities SELECT DISTINCT city_id FROM _new_house WHERE city_id IS NOT NULL;
+
+    -- replace the houses
+    DELETE FROM public.osm_struct_house_number n USING _old_house o WHERE n.house_id = o.id;
+    IF search_exists THEN
+        DELETE FROM public.osm_struct_search s USING _old_house o WHERE s.id = o.id;
+    END IF;
+    IF completion_exists THEN
+        DELETE FROM public.address_completion a USING _old_house o WHERE a.source = 'o' AND a.id = o.id;
+    END IF;
+    DELETE FROM public.osm_struct_house h USING _old_house o WHERE h.id = o.id;
+
+    CREATE TEMPORARY TABLE _inserted (id integer, street_id integer, house_number text) ON COMMIT DROP;
+    WITH i AS (
+        INSERT INTO public.osm_struct_house (source, osm_id, house_number, street_id, geometry)
+        SELECT source, osm_id, house_number, street_id, geometry FROM _new_house
+        RETURNING id, street_id, house_number
+    )
+    INSERT INTO _inserted SELECT * FROM i;
+
+    INSERT INTO public.osm_struct_house_number (house_id, street_id, number, suffix)
+    SELECT i.id, i.street_id, p.number, p.suffix
+    FROM _inserted i
+    CROSS JOIN LATERAL public.parse_house_number(i.house_number) p
+    WHERE i.street_id IS NOT NULL;
+
+    -- streets: drop the empty ones, update extents and geometries (optimize step 012),
+    -- streets near changed roads get a new geometry too
+    DELETE FROM public.osm_struct_streets s
+    USING _streets x
+    WHERE s.id = x.id AND NOT EXISTS (SELECT 1 FROM public.osm_struct_house h WHERE h.street_id = s.id);
+
+    UPDATE public.osm_struct_streets s SET extent = e.extent
+    FROM (
+        SELECT h.street_id, gis.ST_SetSRID(gis.ST_Extent(h.geometry), 3857) AS extent
+        FROM public.osm_struct_house h
+        WHERE h.street_id IN (SELECT id FROM _streets)
+        GROUP BY h.street_id
+    ) e
+    WHERE s.id = e.street_id;
+
+    INSERT INTO _streets
+    SELECT s.id
+    FROM public.osm_struct_streets s
+    JOIN _changes c ON c.source = 'osm_roads' AND s.extent && c.bbox;
+
+    UPDATE public.osm_struct_streets s SET geometry = NULL WHERE s.id IN (SELECT id FROM _streets);
+    UPDATE public.osm_struct_streets s SET geometry = r.geometry
+    FROM public.osm_roads r
+    WHERE
+        s.id IN (SELECT id FROM _streets)
+        AND r.street = s.name
+        AND gis.ST_Intersects(s.extent, gis.ST_SetSRID(gis.Box2D(r.geometry), 3857));
+
+    -- cities: drop the empty ones, update extents and geometries (optimize step 013),
+    -- cities near changed boundaries get a new geometry too
+    DELETE FROM public.osm_struct_cities c
+    USING _cities x
+    WHERE c.id = x.id AND NOT EXISTS (SELECT 1 FROM public.osm_struct_streets s WHERE s.city_id = c.id);
+
+    UPDATE public.osm_struct_cities c SET extent = e.extent
+    FROM (
+        SELECT s.city_id, gis.ST_SetSRID(gis.ST_Extent(h.geometry), 3857) AS extent
+        FROM public.osm_struct_house h
+        JOIN public.osm_struct_streets s ON h.street_id = s.id
+        WHERE s.city_id IN (SELECT id FROM _cities)
+        GROUP BY s.city_id
+    ) e
+    WHERE c.id = e.city_id;
+
+    INSERT INTO _cities
+    SELECT c.id
+    FROM public.osm_struct_cities c
+    JOIN _changes x ON x.source IN ('osm_postal_code', 'osm_admin') AND c.extent && x.bbox;
+
+    UPDATE public.osm_struct_cities c SET geometry = NULL WHERE c.id IN (SELECT id FROM _cities);
+    UPDATE public.osm_struct_cities c SET geometry = p.geometry
+    FROM public.osm_postal_code p
+    WHERE
+        c.id IN (SELECT id FROM _cities)
+        AND c.geometry IS NULL
+        AND p.postcode = c.postcode
+        AND gis.ST_Intersects(c.extent, gis.ST_SetSRID(gis.Box2D(p.geometry), 3857));
+    UPDATE public.osm_struct_cities c SET geometry = a.geometry
+    FROM public.osm_admin a
+    WHERE
+        c.id IN (SELECT id FROM _cities)
+        AND c.geometry IS NULL
+        AND a.name = c.name
+        AND a.admin_level = 8
+        AND gis.ST_Intersects(c.extent, gis.ST_SetSRID(gis.Box2D(a.geometry), 3857));
+
+    -- search table rows of the new houses (see optimize_search_table)
+    IF search_exists THEN
+        INSERT INTO public.osm_struct_search
+        SELECT
+            h.id,
+            s.id AS street_id,
+            s.name AS road,
+            h.house_number,
+            p.number_min,
+            p.number_max,
+            p.suffix,
+            c.postcode,
+            NULLIF(c.name, '') AS city,
+            (SELECT NULLIF(a.name, '') FROM public.osm_admin a WHERE a.admin_level = 6 AND gis.ST_Contains(a.geometry, h.geometry) LIMIT 1) AS county,
+            (SELECT NULLIF(a.name, '') FROM public.osm_admin a WHERE a.admin_level = 4 AND gis.ST_Contains(a.geometry, h.geometry) LIMIT 1) AS "state",
+            (SELECT NULLIF(a.name, '') FROM public.osm_admin a WHERE a.admin_level = 2 AND gis.ST_Contains(a.geometry, h.geometry) LIMIT 1) AS country,
+            h.geometry::gis.geometry(point, 3857) AS geometry,
+            gis.ST_Y(gis.ST_Transform(h.geometry, 4326)) AS lat,
+            gis.ST_X(gis.ST_Transform(h.geometry, 4326)) AS lon
+        FROM _inserted i
+        JOIN public.osm_struct_house h ON h.id = i.id
+        JOIN public.osm_struct_streets s ON h.street_id = s.id
+        JOIN public.osm_struct_cities c ON s.city_id = c.id
+        CROSS JOIN LATERAL (
+            SELECT min(number) AS number_min, max(number) AS number_max, min(suffix) AS suffix
+            FROM public.parse_house_number(h.house_number)
+        ) p;
+    END IF;
+
+    -- address completion keys of the new houses (see address_completion/001)
+    IF completion_exists THEN
+        INSERT INTO public.address_completion (key, region, source, id, road, house_number, postcode, city, geometry)
+        SELECT k.key, public._word_region(h.geometry), 'o', h.id, s.name, h.house_number, NULLIF(c.postcode, ''), NULLIF(c.name, ''), h.geometry
+        FROM _inserted i
+        JOIN public.osm_struct_house h ON h.id = i.id
+        JOIN public.osm_struct_streets s ON h.street_id = s.id
+        JOIN public.osm_struct_cities c ON s.city_id = c.id
+        CROSS JOIN LATERAL public.address_keys(s.name, h.house_number, c.postcode, c.name) k(key)
+        WHERE s.name <> '';
+    END IF;
+
+    -- wordlist: add the new word counts, drop words that are not used anymore
+    IF wordlist_exists THEN
+        INSERT INTO _word_delta
+        SELECT w.region, w.word, w.ct FROM public._osm_word_counts(street_names, city_names) w;
+
+        PERFORM public._apply_word_delta();
+    END IF;
+
+    RETURN change_count;
+END;
+$$ LANGUAGE 'plpgsql';
+
+-- SELECT track_osm_changes();
+-- SELECT apply_osm_changes();
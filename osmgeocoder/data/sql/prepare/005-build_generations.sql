@@ -0,0 +1,81 @@
+--
+-- Derived tables are built in the `osm_build` schema and then published into `public`
+-- in one short transaction, the generation they replace is kept in `osm_previous`
+-- for a rollback. The geocoder keeps running on the old tables while building.
+--
+CREATE SCHEMA IF NOT EXISTS osm_build;
+CREATE SCHEMA IF NOT EXISTS osm_previous;
+
+--
+-- Move tables from `osm_build` to `public`, the published tables go to `osm_previous`
+--
+-- Indices, constraints and owned sequences move with their tables, functions reference
+-- the tables by name and use the new ones for the next query.
+--
+CREATE OR REPLACE FUNCTION public.publish_build(tables text[]) RETURNS void AS
+$$
+DECLARE
+    t text;
+BEGIN
+    FOREACH t IN ARRAY tables LOOP
+        IF to_regclass(format('osm_build.%I', t)) IS NULL THEN
+            RAISE EXCEPTION 'Table osm_build.% does not exist, nothing to publish', t;
+        END IF;
+    END LOOP;
+
+    -- drop the oldest generation before locking anything, this is the slow part
+    FOREACH t IN ARRAY tables LOOP
+        EXECUTE format('DROP TABLE IF EXISTS osm_previous.%I CASCADE;', t);
+    END LOOP;
+
+    -- take all locks first, the swap itself only changes the catalog
+    FOREACH t IN ARRAY tables LOOP
+        IF to_regclass(format('public.%I', t)) IS NOT NULL THEN
+            EXECUTE format('LOCK TABLE public.%I IN ACCESS EXCLUSIVE MODE;', t);
+        END IF;
+    END LOOP;
+
+    FOREACH t IN ARRAY tables LOOP
+        IF to_regclass(format('public.%I', t)) IS NOT NULL THEN
+            EXECUTE format('ALTER TABLE public.%I SET SCHEMA osm_previous;', t);
+        END IF;
+        EXECUTE format('ALTER TABLE osm_build.%I SET SCHEMA public;', t);
+    END LOOP;
+END;
+$$ LANGUAGE 'plpgsql';
+
+--
+-- Swap the published tables with the previous generation, running it again undoes the
+-- rollback
+--
+CREATE OR REPLACE FUNCTION public.rollback_build(tables text[]) RETURNS void AS
+$$
+DECLARE
+    t text;
+BEGIN
+    FOREACH t IN ARRAY tables LOOP
+        IF to_regclass(format('osm_previous.%I', t)) IS NULL THEN
+            RAISE EXCEPTION 'Table osm_previous.% does not exist, nothing to roll back to', t;
+        END IF;
+        IF to_regclass(format('public.%I', t)) IS NOT NULL THEN
+            EXECUTE format('LOCK TABLE public.%I IN ACCESS EXCLUSIVE MODE;', t);
+        END IF;
+    END LOOP;
+
+    -- index names are unique per schema, so swap through a scratch schema
+    CREATE SCHEMA IF NOT EXISTS osm_rollback;
+    FOREACH t IN ARRAY tables LOOP
+        IF to_regclass(format('public.%I', t)) IS NOT NULL THEN
+            EXECUTE format('ALTER TABLE public.%I SET SCHEMA osm_rollback;', t);
+        END IF;
+        EXECUTE format('ALTER TABLE osm_previous.%I SET SCHEMA public;', t);
+        IF to_regclass(format('osm_rollback.%I', t)) IS NOT NULL THEN
+            EXECUTE format('ALTER TABLE osm_rollback.%I SET SCHEMA osm_previous;', t);
+        END IF;
+    END LOOP;
+    DROP SCHEMA osm_rollback;
+END;
+$$ LANGUAGE 'plpgsql';
+
+-- SELECT publish_build(ARRAY['osm_struct_house', 'osm_struct_streets', 'osm_struct_cities', 'osm_struct_house_number']);
+-- SELECT rollback_build(ARRAY['osm_struct_house', 'osm_struct_streets', 'osm_struct_cities', 'osm_struct_house_number']);
@@ -0,0 +1,23 @@
+--
+-- Keys of the address completion table, the user input is normalized the same way
+-- before searching for it as a prefix
+--
+-- lower case, `ß` is spelled `ss` and everything that is neither a letter nor a digit
+-- separates words, so `Hauptstraße 12a, 86150` becomes `hauptstrasse 12a 86150`
+--
+CREATE OR REPLACE FUNCTION public.normalize_address(address text) RETURNS text AS
+$$
+    SELECT trim(regexp_replace(replace(lower(address), 'ß', 'ss'), '[^[:alnum:]]+', ' ', 'g'));
+$$ LANGUAGE 'sql' IMMUTABLE;
+
+--
+-- Keys of one address: `street number postcode city` and, for users that skip the
+-- postcode, `street number city`
+--
+CREATE OR REPLACE FUNCTION public.address_keys(road text, house_number text, postcode text, city text) RETURNS SETOF text AS
+$$
+    SELECT public.normalize_address(concat_ws(' ', road, house_number, postcode, city))
+    UNION ALL
+    SELECT public.normalize_address(concat_ws(' ', road, house_number, city))
+    WHERE coalesce(postcode, '') <> '';
+$$ LANGUAGE 'sql' IMMUTABLE;
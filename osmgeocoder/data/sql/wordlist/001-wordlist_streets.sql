@@ -0,0 +1,40 @@
+-- depends:
+--
+-- Parallel rebuild of the wordlist with `prepare_osm.py --wordlist`, counts the words
+-- like `build_wordlist()` but split into tiles by the center of the street extents.
+--
+-- Streets of openaddresses.io data without extent (not optimized) all go into one tile.
+--
+DROP TABLE IF EXISTS osm_build.wordlist_streets;
+DROP TABLE IF EXISTS osm_build.wordlist_counts;
+
+CREATE UNLOGGED TABLE osm_build.wordlist_streets (
+	source "char", -- 'o' = osm_struct_streets, 'a' = oa_street
+	id integer,
+	center gis.geometry(point, 3857)
+);
+
+CREATE UNLOGGED TABLE osm_build.wordlist_counts (
+	region text COLLATE "C",
+	word text,
+	ct bigint
+);
+
+DO
+$$
+BEGIN
+	IF to_regclass('public.osm_struct_streets') IS NOT NULL THEN
+		INSERT INTO osm_build.wordlist_streets (source, id, center)
+		SELECT 'o', id, gis.ST_Centroid(extent) FROM public.osm_struct_streets;
+	END IF;
+
+	IF to_regclass('public.oa_street') IS NOT NULL THEN
+		INSERT INTO osm_build.wordlist_streets (source, id, center)
+		SELECT 'a', id, coalesce(gis.ST_Centroid(extent), gis.ST_SetSRID(gis.ST_MakePoint(0, 0), 3857))
+		FROM public.oa_street;
+	END IF;
+END;
+$$ LANGUAGE 'plpgsql';
+
+CREATE INDEX wordlist_streets_center_idx ON osm_build.wordlist_streets USING GIST(center);
+ANALYZE osm_build.wordlist_streets;
@@ -0,0 +1,59 @@
+-- depends: 001
+-- tiles: osm_build.wordlist_streets.center
+--
+-- Count the words of the streets in the tile and of their cities per region, the counts
+-- of the tiles are summed up afterwards
+--
+-- per tile:
+DO
+$$
+BEGIN
+	IF to_regclass('public.osm_struct_streets') IS NOT NULL THEN
+		INSERT INTO osm_build.wordlist_counts (region, word, ct) SELECT region, word, ct FROM (
+			SELECT public._word_region(s.extent) as region, unnest(regexp_split_to_array(c.name, '\W')) as word, count(s.*) as ct
+				FROM osm_build.wordlist_streets t
+				JOIN public.osm_struct_streets s ON s.id = t.id
+				JOIN public.osm_struct_cities c ON c.id = s.city_id
+				WHERE
+					t.source = 'o'
+					AND t.center && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+					AND public._in_tile(t.center, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
+			GROUP BY c.name, public._word_region(s.extent)
+			UNION ALL
+			SELECT public._word_region(s.extent) as region, unnest(regexp_split_to_array(s.name, '\W')) as word, count(h.*) as ct
+				FROM osm_build.wordlist_streets t
+				JOIN public.osm_struct_streets s ON s.id = t.id
+				JOIN public.osm_struct_house h ON s.id = h.street_id
+				WHERE
+					t.source = 'o'
+					AND t.center && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+					AND public._in_tile(t.center, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
+			GROUP BY s.name, public._word_region(s.extent)
+		) x;
+	END IF;
+
+	IF to_regclass('public.oa_street') IS NOT NULL THEN
+		INSERT INTO osm_build.wordlist_counts (region, word, ct) SELECT region, word, ct FROM (
+			SELECT public._word_region(s.extent) as region, unnest(regexp_split_to_array(c.city, '\W')) as word, count(s.*) as ct
+				FROM osm_build.wordlist_streets t
+				JOIN public.oa_street s ON s.id = t.id
+				JOIN public.oa_city c ON c.id = s.city_id
+				WHERE
+					t.source = 'a'
+					AND t.center && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+					AND public._in_tile(t.center, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
+			GROUP BY c.city, public._word_region(s.extent)
+			UNION ALL
+			SELECT public._word_region(s.extent) as region, unnest(regexp_split_to_array(s.street, '\W')) as word, count(h.*) as ct
+				FROM osm_build.wordlist_streets t
+				JOIN public.oa_street s ON s.id = t.id
+				JOIN public.oa_house h ON s.id = h.street_id
+				WHERE
+					t.source = 'a'
+					AND t.center && gis.ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857)
+					AND public._in_tile(t.center, %(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s)
+			GROUP BY s.street, public._word_region(s.extent)
+		) x;
+	END IF;
+END;
+$$ LANGUAGE 'plpgsql';
@@ -0,0 +1,24 @@
+-- depends: 002
+-- sum up the counts of all tiles, the global and the regional list are built concurrently
+DROP TABLE IF EXISTS osm_build.wordlist;
+DROP TABLE IF EXISTS osm_build.wordlist_region;
+
+CREATE TABLE osm_build.wordlist (
+	word TEXT,
+	ct INT DEFAULT 1
+);
+
+CREATE TABLE osm_build.wordlist_region (
+	region TEXT COLLATE "C",
+	word TEXT,
+	ct INT DEFAULT 1
+);
+-- job: wordlist
+INSERT INTO osm_build.wordlist (word, ct)
+SELECT word, sum(ct) FROM osm_build.wordlist_counts GROUP BY word;
+-- job: regional wordlist
+INSERT INTO osm_build.wordlist_region (region, word, ct)
+SELECT region, word, sum(ct) FROM osm_build.wordlist_counts WHERE region <> '' AND word <> '' GROUP BY region, word;
+-- finally:
+DROP TABLE osm_build.wordlist_streets;
+DROP TABLE osm_build.wordlist_counts;
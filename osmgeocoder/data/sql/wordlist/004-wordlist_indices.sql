@@ -0,0 +1,17 @@
+-- depends: 003
+-- same indices as `build_wordlist()`, the primary keys are attached to their indices afterwards
+-- job: wordlist primary key
+CREATE UNIQUE INDEX IF NOT EXISTS wordlist_pkey ON osm_build.wordlist USING BTREE(word);
+-- job: wordlist trigram index
+CREATE INDEX IF NOT EXISTS wordlist_word_trgm_idx ON osm_build.wordlist USING GIN(word gin_trgm_ops);
+-- job: wordlist metaphone index
+CREATE INDEX IF NOT EXISTS wordlist_word_dmetaphone_idx ON osm_build.wordlist USING GIN(str.dmetaphone(word) gin_trgm_ops);
+-- job: wordlist alternative metaphone index
+CREATE INDEX IF NOT EXISTS wordlist_word_dmetaphone_alt_idx ON osm_build.wordlist USING GIN(str.dmetaphone_alt(word) gin_trgm_ops);
+-- job: regional wordlist primary key
+CREATE UNIQUE INDEX IF NOT EXISTS wordlist_region_pkey ON osm_build.wordlist_region USING BTREE(region, word);
+-- job: regional wordlist prefix index
+CREATE INDEX IF NOT EXISTS wordlist_region_word_idx ON osm_build.wordlist_region USING BTREE(region, word COLLATE "C");
+-- finally:
+ALTER TABLE osm_build.wordlist ADD CONSTRAINT wordlist_pkey PRIMARY KEY USING INDEX wordlist_pkey;
+ALTER TABLE osm_build.wordlist_region ADD CONSTRAINT wordlist_region_pkey PRIMARY KEY USING INDEX wordlist_region_pkey;
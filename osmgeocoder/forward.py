@@ -95,8 +95,10 @@ def fetch_coordinate_struct(
     :param limit: maximum number of results to return
     """
 
+    # search openstreetmap and openaddresses.io data in one query, the denormalized
+    # search table replaces the joins of the openstreetmap part if enabled
     query = '''
-        SELECT * FROM geocode_{typ}(
+        SELECT * FROM {function}(
             %(road)s,
             %(house_number)s,
             %(postcode)s,
@@ -110,28 +112,27 @@ def fetch_coordinate_struct(
                 3857
             ),
             %(radius)s,
-            %(country)s
+            %(country)s,
+            %(max_streets)s
         ) LIMIT %(limit)s;
-    '''
+    '''.format(
+        function='geocode_search' if geocoder.search_table else 'geocode'
+    )
 
     cursor = geocoder.db.cursor(cursor_factory=RealDictCursor)
 
-    for typ in ['osm']:  # TODO: Implement for openaddresses.io
-        q = query.format(typ=typ)
-        cursor.execute(q, {
-            'lat': center[0] if center is not None else None,
-            'lon': center[1] if center is not None else None,
-            'radius': radius,
-            'limit': limit,
-            'country': country,
-            'road': road,
-            'house_number': house_number,
-            'postcode': postcode,
-            'city': city
-        })
-
-        if cursor.rowcount > 0:
-            break
+    cursor.execute(query, {
+        'lat': center[0] if center is not None else None,
+        'lon': center[1] if center is not None else None,
+        'radius': radius,
+        'limit': limit,
+        'country': country,
+        'max_streets': geocoder.max_streets,
+        'road': road,
+        'house_number': house_number,
+        'postcode': postcode,
+        'city': city
+    })
 
     for result in cursor:
         yield result
\ No newline at end of file
@@ -8,6 +8,8 @@ from pyproj import Proj, transform
 from .format import AddressFormatter
 from .reverse import fetch_address
 from .forward import fetch_coordinate, fetch_coordinate_struct
+from .prediction import PredictionIndex
+from .reverse_index import ReverseIndex
 
 
 class Geocoder():
@@ -16,7 +18,12 @@ class Geocoder():
         db:Optional[Dict[str, Any]]=None,
         db_handle=None,
         address_formatter_config:Optional[str]=None,
-        postal:Optional[Dict[str, Any]]=None
+        postal:Optional[Dict[str, Any]]=None,
+        max_streets:int=100,
+        search_table:bool=False,
+        merge_sources:bool=False,
+        prediction_index:Optional[str]=None,
+        reverse_index:Optional[str]=None
     ):
         """
         Initialize a new geocoder
@@ -27,8 +34,28 @@ class Geocoder():
         :param address_formatter_config: Custom configuration for the address formatter,
                                          by default uses the datafile included in the bundle
         :param postal: postal service information, dict with at least ``service_url``
+        :param max_streets: number of candidate streets the forward geocoder searches for houses,
+                            raise if results are missing for very common street names
+        :param search_table: use the denormalized search table, only available if the DB was
+                             optimized with ``--search-table``
+        :param merge_sources: reverse geocoding returns the nearest addresses from osm and
+                              openaddresses.io data instead of using openaddresses.io only
+                              as a fallback
+        :param prediction_index: serve ``predict_text`` from this index file instead of the DB,
+                                 build it with ``finalize_geocoder.py --prediction-index``
+        :param reverse_index: reverse geocode with this index file instead of the DB, build it
+                              with ``finalize_geocoder.py --reverse-index``
         """
         self.postal_service = postal
+        self.max_streets = max_streets
+        self.search_table = search_table
+        self.merge_sources = merge_sources
+        self.prediction_index = None
+        if prediction_index is not None:
+            self.prediction_index = PredictionIndex(prediction_index)
+        self.reverse_index = None
+        if reverse_index is not None:
+            self.reverse_index = ReverseIndex(reverse_index)
         if db is not None:
             self.db = self._init_db(db)
         if db_handle is not None:
@@ -63,12 +90,15 @@ class Geocoder():
 
         results = []
         for coordinate in fetch_coordinate(self, address, country=country, center=center):
-            p = loads(coordinate['location'], hex=True)
-
             name = self.formatter.format(coordinate)
 
-            # project location back to lat/lon
-            lon, lat = transform(mercProj, latlonProj, p.x, p.y)
+            if coordinate.get('lat', None) is not None:
+                # search table results are already projected
+                lat, lon = coordinate['lat'], coordinate['lon']
+            else:
+                # project location back to lat/lon
+                p = loads(coordinate['location'], hex=True)
+                lon, lat = transform(mercProj, latlonProj, p.x, p.y)
             results.append((
                 name, lat, lon
             ))
@@ -103,13 +133,13 @@ class Geocoder():
             self, road=road, house_number=house_number,
             postcode=postcode, city=city, country=country,
             center=center):
-            
-            p = loads(coordinate['location'], hex=True)
 
-            # project location back to lat/lon
-            lon, lat = transform(mercProj, latlonProj, p.x, p.y)
-            coordinate['lat'] = lat
-            coordinate['lon'] = lon
+            if coordinate.get('lat', None) is None:
+                # project location back to lat/lon
+                p = loads(coordinate['location'], hex=True)
+                lon, lat = transform(mercProj, latlonProj, p.x, p.y)
+                coordinate['lat'] = lat
+                coordinate['lon'] = lon
 
             results.append(coordinate)
 
@@ -246,17 +276,94 @@ class Geocoder():
         for item in items:
             yield self.formatter.format(item)
 
-    def predict_text(self, input:str) -> Generator[str, None, None]:
+    def predict_text(
+        self,
+        input:str,
+        center:Optional[Tuple[float, float]]=None,
+        region:Optional[str]=None
+    ) -> Generator[str, None, None]:
         """
         Predict word the user is typing currently
 
         :param input: user input
+        :param center: optional, center coordinate (EPSG 4326/WGS84 (lat, lon) tuple), prefer words
+                       used in the region around it
+        :param region: optional, geohash of the region to prefer words of (the first three characters
+                       are used, shorter geohashes cover multiple regions), overrides ``center``
         :returns: generator for word list, sorted by most common
         """
-        query = 'SELECT word FROM predict_text(%s)'
+        if center is None and region is None and self.prediction_index is not None:
+            for word, ct, dist in self.prediction_index.predict(input):
+                yield word
+            return
+
+        if region is not None:
+            query = 'SELECT word FROM predict_text(%(input)s, %(regions)s)'
+        elif center is not None:
+            query = '''
+                SELECT word FROM predict_text(
+                    %(input)s,
+                    word_regions(
+                        ST_Transform(
+                            ST_SetSRID(
+                                ST_MakePoint(%(lon)s, %(lat)s),
+                                4326
+                            ),
+                            3857
+                        )
+                    )
+                )
+            '''
+        else:
+            query = 'SELECT word FROM predict_text(%(input)s)'
 
         cursor = self.db.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(query, [input])
+        cursor.execute(query, {
+            'input': input,
+            'regions': [region],
+            'lat': center[0] if center is not None else None,
+            'lon': center[1] if center is not None else None
+        })
 
         for result in cursor:
             yield result['word']
+
+    def complete_address(
+        self,
+        input:str,
+        center:Optional[Tuple[float, float]]=None,
+        limit=10
+    ) -> Generator[Dict[str, Any], None, None]:
+        """
+        Complete the address the user is typing currently (street, house number,
+        postcode and city in that order, postcode and punctuation may be left out)
+
+        Needs the address completion table, build it with ``prepare_osm.py --address-completion``.
+
+        :param input: user input
+        :param center: optional, center coordinate (EPSG 4326/WGS84 (lat, lon) tuple), addresses
+                       near it are returned first, sorted by distance
+        :param limit: maximum number of suggestions
+        :returns: generator for dicts with the keys address (``street number, postcode city``),
+                  road, house_number, postcode, city, lat, lon and distance (in meters,
+                  web mercator, only with a center)
+        """
+        cursor = self.db.cursor(cursor_factory=RealDictCursor)
+        cursor.execute('''
+            SELECT * FROM complete_address(
+                %(input)s,
+                ST_Transform(ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326), 3857),
+                %(limit)s
+            )
+        ''', {
+            'input': input,
+            'lat': center[0] if center is not None else None,
+            'lon': center[1] if center is not None else None,
+            'limit': limit
+        })
+
+        for result in cursor:
+            street = ' '.join(part for part in (result['road'], result['house_number']) if part)
+            city = ' '.join(part for part in (result['postcode'], result['city']) if part)
+            result['address'] = ', '.join(part for part in (street, city) if part)
+            yield result
@@ -0,0 +1,143 @@
+from typing import Any, Callable, Optional, Tuple
+from threading import Condition
+from time import time
+import json
+import os
+
+# MB, index builds and clustering never get less maintenance_work_mem (unless the whole budget is smaller)
+MIN_INDEX_MEMORY = 64
+
+# path of the JSON lines telemetry file of the preparation scripts, set with ``set_telemetry``
+TELEMETRY = None
+
+
+class MaintenanceBudget():
+    """
+    Share a memory budget for index builds and clustering between concurrent jobs.
+
+    Schedulers ``reserve`` a share for every job they start, the job then ``acquire``s
+    an equal part of the whole budget for all reserved jobs (a job running alone gets
+    everything) and waits until that much memory is free, so the budget is never
+    over-committed. At most ``slots`` jobs hold a share at a time. Parallel maintenance
+    workers are split the same way, but jobs take fewer instead of waiting for them.
+    """
+
+    def __init__(self, memory:int, workers:Optional[int], slots:int):
+        self.memory = memory
+        self.workers = workers
+        self.free_memory = memory
+        self.free_workers = workers
+        self.slots = slots
+        self.running = 0
+        self.reserved = 0
+        self.condition = Condition()
+
+    def reserve(self, count:int=1):
+        """Announce ``count`` jobs that will ``acquire`` a share, call before starting them"""
+        with self.condition:
+            self.reserved += count
+
+    def share(self) -> int:
+        """Number of parts the budget is split into currently"""
+        return max(1, min(self.slots, self.reserved))
+
+    def acquire(self) -> Tuple[int, Optional[int]]:
+        """
+        Take a share for a reserved job, returns maintenance_work_mem in MB and the
+        number of parallel maintenance workers (``None`` if the server has none)
+        """
+        with self.condition:
+            while True:
+                memory = min(self.memory, max(MIN_INDEX_MEMORY, self.memory // self.share()))
+                if self.running < self.slots and self.free_memory >= memory:
+                    break
+                self.condition.wait()
+            workers = None
+            if self.free_workers is not None:
+                workers = min(self.free_workers, self.workers // self.share())
+                self.free_workers -= workers
+            self.free_memory -= memory
+            self.running += 1
+            return memory, workers
+
+    def release(self, memory:int, workers:Optional[int]):
+        """Return the share of a finished job, this ends its reservation"""
+        with self.condition:
+            self.free_memory += memory
+            if workers is not None:
+                self.free_workers += workers
+            self.running -= 1
+            self.reserved -= 1
+            self.condition.notify_all()
+
+
+def maintenance_budget(db, memory:Optional[int], slots:int) -> MaintenanceBudget:
+    """
+    Budget for ``slots`` concurrent jobs, ``memory`` is the total in MB and defaults to the
+    server's maintenance_work_mem per slot. The parallel maintenance workers are shared
+    from the server's ``max_parallel_workers``.
+
+    :param db: DB cursor
+    :param memory: total memory in MB or ``None``
+    :param slots: maximum number of concurrent jobs
+    """
+    db.execute('''
+        SELECT
+            pg_size_bytes(current_setting('maintenance_work_mem')) / 1024 / 1024,
+            current_setting('max_parallel_maintenance_workers', true) IS NOT NULL,
+            coalesce(current_setting('max_parallel_workers', true)::int, 0);
+    ''')
+    default_memory, parallel, workers = db.fetchone()
+    if memory is None:
+        memory = default_memory * slots
+    return MaintenanceBudget(memory, workers if parallel else None, slots)
+
+
+def set_telemetry(path:Optional[str]):
+    """Enable telemetry (``--telemetry`` of the scripts), ``None`` disables it. Also used as initializer of worker pools."""
+    global TELEMETRY
+    TELEMETRY = path
+
+
+def get_telemetry() -> Optional[str]:
+    """Path of the telemetry file or ``None``, to pass it on to worker processes"""
+    return TELEMETRY
+
+
+def telemetry(event:str, **fields):
+    """Append an event to the telemetry file as one JSON line, does nothing when telemetry is disabled"""
+    if TELEMETRY is None:
+        return
+    record = dict(time=round(time(), 3), event=event, pid=os.getpid())
+    record.update(fields)
+
+    # one write on a file opened for appending, so lines of concurrent steps and workers do not mix
+    fd = os.open(TELEMETRY, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + '\n').encode('utf8'))
+    finally:
+        os.close(fd)
+
+
+def write_index(db, filename:str, build:Callable[[Any, str], int], event:str, unit:str, telemetry:Optional[Callable]=None) -> int:
+    """
+    Write an index file with ``build`` (``build_prediction_index`` or ``build_reverse_index``)
+    and report the progress, used by the preparation scripts
+
+    :param db: DB cursor, the index is built on its connection
+    :param filename: destination file
+    :param build: index builder
+    :param event: telemetry event, e.g. ``prediction_index``
+    :param unit: what the index counts, e.g. ``words``
+    :param telemetry: called with ``event``, the count as ``unit`` and the runtime as
+        ``seconds`` when done (optional)
+    :returns: number of entries in the index
+    """
+    print('Writing {} to {}... '.format(event.replace('_', ' '), filename), end='', flush=True)
+    start = time()
+    count = build(db.connection, filename)
+    seconds = time() - start
+    print('{} {} in {} s'.format(count, unit, round(seconds, 2)), flush=True)
+    if telemetry is not None:
+        telemetry(event, seconds=round(seconds, 3), **{unit: count})
+    return count
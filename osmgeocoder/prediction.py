@@ -0,0 +1,298 @@
+from typing import List, Tuple
+from array import array
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+# file layout: header, word offsets (uint32, one more than words), usage counts (uint32),
+# word lengths in characters (uint16), padding to 4 bytes, UTF-8 encoded words in byte order
+MAGIC = b'OSMGPI01'
+BYTE_ORDER_MARK = 0x01020304
+HEADER = struct.Struct('=8sIII')
+
+# maximum edit distance of the word prefix to the user input, like the `predict_text` DB function
+MAX_DISTANCE = 2
+
+# ranges at most this long are ranked in python, larger ones with numpy
+SMALL_RANGE = 64
+
+# sorts after every UTF-8 sequence, appended to a prefix to find the end of its range
+PREFIX_END = b'\xff'
+
+
+def build_prediction_index(db, filename:str) -> int:
+    """
+    Write the ``wordlist`` table into a prediction index file
+
+    The file is written next to the destination and moved into place when complete,
+    geocoders that have the old file mapped keep using it until they are restarted.
+
+    :param db: DB connection
+    :param filename: destination file
+    :returns: number of words in the index
+    """
+    offsets = array('I', [0])
+    counts = array('I')
+    lengths = array('H')
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    with tempfile.TemporaryFile(dir=directory) as blob:
+        cursor = db.cursor(name='prediction_index')
+        cursor.itersize = 100000
+        # the C collation sorts by bytes, which is code point order for UTF-8
+        cursor.execute('''
+            SELECT word, ct FROM public.wordlist
+            WHERE word <> '' AND ct > 0
+            ORDER BY word COLLATE "C"
+        ''')
+
+        size = 0
+        previous = b''
+        for word, ct in cursor:
+            encoded = word.encode('utf-8')
+            if encoded <= previous:
+                raise ValueError('Wordlist is not sorted by bytes, is the database encoding UTF-8?')
+            previous = encoded
+
+            blob.write(encoded)
+            size += len(encoded)
+            offsets.append(size)
+            counts.append(min(ct, 0xffffffff))
+            lengths.append(min(len(word), 0xffff))
+        cursor.close()
+
+        tmp_name = filename + '.tmp'
+        with open(tmp_name, 'wb') as fp:
+            fp.write(HEADER.pack(MAGIC, BYTE_ORDER_MARK, len(counts), size))
+            offsets.tofile(fp)
+            counts.tofile(fp)
+            lengths.tofile(fp)
+            fp.write(b'\0' * (-fp.tell() % 4))
+            blob.seek(0)
+            while True:
+                data = blob.read(1024 * 1024)
+                if not data:
+                    break
+                fp.write(data)
+        os.replace(tmp_name, filename)
+
+    return len(counts)
+
+
+class PredictionIndex():
+
+    def __init__(self, filename:str):
+        """
+        Open a prediction index built with ``build_prediction_index``
+
+        The file is memory mapped read only, so all processes that open the same
+        file share its pages.
+
+        :param filename: index file
+        """
+        with open(filename, 'rb') as fp:
+            self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byte_order, count, size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a prediction index'.format(filename))
+        if byte_order != BYTE_ORDER_MARK:
+            raise ValueError('{} was built on a machine with a different byte order'.format(filename))
+
+        self.count = count
+        position = HEADER.size
+        view = memoryview(self.map)
+        self.offsets = view[position:position + 4 * (count + 1)].cast('I')
+        position += 4 * (count + 1)
+        self.counts = np.frombuffer(self.map, dtype=np.uint32, count=count, offset=position)
+        position += 4 * count
+        self.lengths = np.frombuffer(self.map, dtype=np.uint16, count=count, offset=position)
+        position += 2 * count
+        position += -position % 4
+        self.blob = view[position:position + size]
+
+    def word(self, index:int) -> bytes:
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].tobytes()
+
+    def _lower_bound(self, key:bytes, lo:int, hi:int) -> int:
+        """First index in ``lo:hi`` with a word not smaller than ``key``"""
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.word(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _range_end(self, key:bytes, lo:int, hi:int) -> int:
+        """
+        First index in ``lo:hi`` with a word not smaller than ``key``, searched by
+        doubling the step from ``lo`` as most ranges are short
+        """
+        bound = lo
+        step = 1
+        while bound < hi and self.word(bound) < key:
+            lo = bound + 1
+            bound += step
+            step *= 2
+        return self._lower_bound(key, lo, min(bound, hi))
+
+    def prefix_range(self, prefix:bytes) -> Tuple[int, int]:
+        """Index range of the words starting with ``prefix``"""
+        lo = self._lower_bound(prefix, 0, self.count)
+        return lo, self._range_end(prefix + PREFIX_END, lo, self.count)
+
+    def _top(self, lo:int, hi:int, limit:int) -> List[int]:
+        """Indices of the most common words in ``lo:hi``, shorter words first on equal counts"""
+        if hi - lo <= SMALL_RANGE:
+            indices = list(range(lo, hi))
+            indices.sort(key=lambda i: (-int(self.counts[i]), int(self.lengths[i]), i))
+            return indices[:limit]
+
+        counts = self.counts[lo:hi]
+        if hi - lo > limit:
+            threshold = np.partition(counts, hi - lo - limit)[hi - lo - limit]
+            candidates = np.flatnonzero(counts >= threshold)
+        else:
+            candidates = np.arange(hi - lo)
+        order = np.lexsort((candidates, self.lengths[lo + candidates], -counts[candidates].astype(np.int64)))
+        return [lo + int(i) for i in candidates[order[:limit]]]
+
+    def predict(self, user_input:str, limit:int=10) -> List[Tuple[str, int, int]]:
+        """
+        Predict the word the user is typing currently
+
+        Like the ``predict_text`` DB function a word matches when its prefix of the length
+        of the input has an edit distance of at most two characters to the input, results
+        are sorted by edit distance, usage count, length and finally alphabetically.
+        The DB function additionally requires a similar double metaphone, so this may find
+        some more words with typos.
+
+        :param user_input: the word the user is typing
+        :param limit: maximum number of predictions
+        :returns: list of tuples of word, usage count and edit distance
+        """
+        if user_input == '' or self.count == 0:
+            return []
+
+        # words starting with the input have no typos, if there are enough of them
+        # there is no need to search for corrections
+        lo, hi = self.prefix_range(user_input.encode('utf-8'))
+        if hi - lo >= limit:
+            return [
+                (self.word(i).decode('utf-8'), int(self.counts[i]), 0)
+                for i in self._top(lo, hi, limit)
+            ]
+
+        matches = _FuzzySearch(self, user_input, limit).run()
+        candidates = []
+        for dist, lo, hi in matches:
+            for i in self._top(lo, hi, limit):
+                candidates.append((dist, -int(self.counts[i]), int(self.lengths[i]), i))
+        candidates.sort()
+
+        return [
+            (self.word(i).decode('utf-8'), -ct, dist)
+            for dist, ct, length, i in candidates[:limit]
+        ]
+
+
+class _FuzzySearch():
+    """
+    Depth first search through the sorted words as if they were a trie, keeping a row of
+    the levenshtein matrix per prefix and dropping prefixes that cannot get below the
+    maximum distance anymore
+
+    Only the cells near the diagonal of the matrix can stay below the maximum distance,
+    all others are capped to ``MAX_DISTANCE + 1`` and not calculated. The first cell of
+    a row is the length of the prefix.
+    """
+
+    def __init__(self, index:PredictionIndex, user_input:str, limit:int):
+        self.index = index
+        self.query = user_input
+        self.limit = limit
+        self.max_distance = MAX_DISTANCE
+        self.found = [0] * (MAX_DISTANCE + 1)
+        self.matches = []
+
+    def run(self) -> List[Tuple[int, int, int]]:
+        row = [min(j, MAX_DISTANCE + 1) for j in range(len(self.query) + 1)]
+        row[0] = 0
+        self.search(b'', 0, self.index.count, row)
+        return [match for match in self.matches if match[0] <= self.max_distance]
+
+    def match(self, dist:int, lo:int, hi:int):
+        self.matches.append((dist, lo, hi))
+
+        # when there are enough words with a lower distance the others will not be returned,
+        # so stop searching for them
+        self.found[dist] += hi - lo
+        total = 0
+        for d in range(self.max_distance + 1):
+            total += self.found[d]
+            if total >= self.limit:
+                self.max_distance = d
+                break
+
+    def search(self, prefix:bytes, lo:int, hi:int, row:List[int]):
+        index = self.index
+        query = self.query
+        depth = row[0]
+
+        if depth == len(query):
+            # the prefix of all these words has the length of the input
+            if row[-1] <= self.max_distance:
+                self.match(row[-1], lo, hi)
+            return
+
+        # a word that is shorter than the input is compared as a whole
+        if index.word(lo) == prefix:
+            if row[-1] <= self.max_distance:
+                self.match(row[-1], lo, lo + 1)
+            lo += 1
+
+        position = len(prefix)
+        length = len(row)
+        capped = MAX_DISTANCE + 1
+        first = max(1, depth + 1 - MAX_DISTANCE)
+        last = min(len(query), depth + 1 + MAX_DISTANCE)
+        while lo < hi:
+            word = index.word(lo)
+            char_length = _utf8_length(word[position])
+            child = word[:position + char_length]
+            end = index._range_end(child + PREFIX_END, lo, hi)
+
+            char = child[position:].decode('utf-8')
+            next_row = [capped] * length
+            next_row[0] = depth + 1
+            left = depth + 1 if first == 1 else capped
+            best = capped
+            for j in range(first, last + 1):
+                dist = row[j - 1] + (query[j - 1] != char)
+                if row[j] + 1 < dist:
+                    dist = row[j] + 1
+                if left + 1 < dist:
+                    dist = left + 1
+                if dist > capped:
+                    dist = capped
+                next_row[j] = left = dist
+                if dist < best:
+                    best = dist
+
+            if best <= self.max_distance:
+                self.search(child, lo, end, next_row)
+            lo = end
+
+
+def _utf8_length(first_byte:int) -> int:
+    if first_byte < 0x80:
+        return 1
+    if first_byte < 0xe0:
+        return 2
+    if first_byte < 0xf0:
+        return 3
+    return 4
@@ -15,6 +15,12 @@ def fetch_address(
     """
     Fetch address by searching osm and openaddresses.io data.
 
+    openaddresses.io data is only used if there is no osm address in the radius,
+    unless the geocoder has been configured to merge both sources.
+
+    If the geocoder has a reverse geocoding index the addresses are read from it
+    instead of the DB.
+
     This is a generator and returns an iterator of dicts with the
     following keys: house, road, house_number, postcode, city, distance.
 
@@ -36,31 +42,34 @@ def fetch_address(
     else:
         raise ValueError('Unsupported projection {}'.format(projection))
 
+    if geocoder.reverse_index is not None:
+        for result in geocoder.reverse_index.reverse(x, y, radius, limit=int(limit), merge_sources=geocoder.merge_sources):
+            yield result
+        return
+
     query = '''
-        SELECT * FROM point_to_address_osm(
+        SELECT * FROM {function}(
             ST_SetSRID(
                 ST_MakePoint(%(x)s, %(y)s),
                 3857
             ),
-            %(radius)s
-        ) LIMIT {limit};
-    '''.format(limit=int(limit))
+            %(radius)s,
+            %(limit)s,
+            %(merge)s
+        );
+    '''.format(
+        function='point_to_address_search' if geocoder.search_table else 'point_to_address'
+    )
 
+    # the openaddresses.io fallback (or merge) is done by the DB in the same query
     cursor = geocoder.db.cursor(cursor_factory=RealDictCursor)
-    cursor.execute(query, { 'x': x, 'y': y, 'radius': radius })
-
-    if cursor.rowcount == 0:
-        # try openaddresses.io
-        query = '''
-        SELECT * FROM point_to_address_oa(
-            ST_SetSRID(
-                ST_MakePoint(%(x)s, %(y)s),
-                3857
-            ),
-            %(radius)s
-        ) LIMIT {limit};
-        '''.format(limit=int(limit))
-        cursor.execute(query, { 'x': x, 'y': y, 'radius': radius })
+    cursor.execute(query, {
+        'x': x,
+        'y': y,
+        'radius': radius,
+        'limit': int(limit),
+        'merge': geocoder.merge_sources
+    })
 
     for result in cursor:
         yield result
@@ -0,0 +1,343 @@
+from typing import Any, Dict, List, Optional, Tuple
+from array import array
+import math
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+
+# file layout: header, x and y (float64), grid cell keys (int64), first point of every cell
+# (uint32, one more than cells), house, road and house number string ids and area ids of
+# the points (uint32), areas as postcode, city, county, state and license string ids
+# (uint32), string offsets (uint32, one more than strings), source of the points (uint8),
+# UTF-8 encoded strings
+MAGIC = b'OSMGRI01'
+BYTE_ORDER_MARK = 0x01020304
+HEADER = struct.Struct('=8sIdQQQQQ')
+
+# default edge length of the grid cells in meters (web mercator)
+CELL_SIZE = 250.0
+
+# shifts the web mercator coordinates to positive cell numbers
+ORIGIN = 20037508.342789244
+
+# a grid cell key is the row in the upper and the column in the lower 32 bits
+CELL_ROW_SHIFT = 32
+
+# EWKB header of a little endian point with SRID 3857, the DB returns locations as hex EWKB
+EWKB_POINT_3857 = struct.Struct('<BIIdd')
+
+# postcode, city, county, state and license
+AREA_FIELDS = 5
+
+# rows are written to the column files in batches of this size
+BATCH_SIZE = 100000
+
+# same rows as the `point_to_address_osm` and `point_to_address_oa` DB functions,
+# houses in overlapping admin boundaries are there once per boundary as well
+OSM_HOUSES = '''
+    SELECT
+        'o' AS source,
+        gis.ST_X(h.geometry) AS x,
+        gis.ST_Y(h.geometry) AS y,
+        NULL::text AS house,
+        s.name AS road,
+        h.house_number,
+        c.postcode,
+        c.name AS city,
+        NULLIF(a6.name, '')::text AS county,
+        NULLIF(a4.name, '')::text AS "state",
+        '00000000-0000-0000-0000-000000000000' AS license_id
+    FROM public.osm_struct_house h
+    JOIN public.osm_struct_streets s ON h.street_id = s.id
+    JOIN public.osm_struct_cities c ON s.city_id = c.id
+    LEFT JOIN public.osm_admin a4 ON gis.ST_Contains(a4.geometry, h.geometry::gis.geometry(point, 3857)) AND a4.admin_level = 4
+    LEFT JOIN public.osm_admin a6 ON gis.ST_Contains(a6.geometry, h.geometry::gis.geometry(point, 3857)) AND a6.admin_level = 6
+'''
+
+OA_HOUSES = '''
+    SELECT
+        'a' AS source,
+        gis.ST_X(h.location) AS x,
+        gis.ST_Y(h.location) AS y,
+        h.name AS house,
+        s.street AS road,
+        h.housenumber AS house_number,
+        c.postcode,
+        c.city,
+        NULL::text AS county,
+        NULL::text AS "state",
+        c.license_id::text AS license_id
+    FROM public.oa_house h
+    JOIN public.oa_street s ON h.street_id = s.id
+    JOIN public.oa_city c ON s.city_id = c.id
+'''
+
+
+def _cell(coordinate:float, cell_size:float) -> int:
+    return max(0, math.floor((coordinate + ORIGIN) / cell_size))
+
+
+def build_reverse_index(db, filename:str, cell_size:float=CELL_SIZE) -> int:
+    """
+    Write the OpenStreetMap and openaddresses.io houses into a reverse geocoding index file
+
+    The DB sorts the houses by grid cell, the strings and the areas (postcode, city,
+    county, state and license) of the houses are stored once. The file is written next
+    to the destination and moved into place when complete, geocoders that have the old
+    file mapped keep using it until they are restarted.
+
+    :param db: DB connection
+    :param filename: destination file
+    :param cell_size: edge length of the grid cells in meters, about the usual search radius
+    :returns: number of points in the index
+    """
+    cursor = db.cursor()
+    # only the sources that are imported, like the `point_to_address` DB function
+    cursor.execute('''
+        SELECT
+            to_regclass('public.osm_struct_cities') IS NOT NULL AND to_regclass('public.osm_struct_house') IS NOT NULL,
+            to_regclass('public.oa_house') IS NOT NULL;
+    ''')
+    osm_exists, oa_exists = cursor.fetchone()
+    # coordinates have to survive the text protocol unchanged to get the same distances
+    cursor.execute('SET LOCAL extra_float_digits = 3;')
+    cursor.close()
+
+    sources = []
+    if osm_exists:
+        sources.append(OSM_HOUSES)
+    if oa_exists:
+        sources.append(OA_HOUSES)
+
+    strings = {None: 0}
+    string_offsets = array('I', [0])
+    areas = {}
+    area_table = array('I')
+    cells = array('q')
+    starts = array('I')
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    columns = dict(
+        x=array('d'), y=array('d'),
+        house=array('I'), road=array('I'), house_number=array('I'), area=array('I'),
+        source=array('B')
+    )
+    files = {name: tempfile.TemporaryFile(dir=directory) for name in list(columns) + ['blob']}
+
+    def flush():
+        for name, values in columns.items():
+            values.tofile(files[name])
+            del values[:]
+
+    def string_id(value:Optional[str]) -> int:
+        result = strings.get(value)
+        if result is None:
+            encoded = value.encode('utf-8')
+            files['blob'].write(encoded)
+            string_offsets.append(string_offsets[-1] + len(encoded))
+            result = strings[value] = len(strings)
+        return result
+
+    try:
+        # without any source the index is written empty
+        cursor = None
+        if sources:
+            cursor = db.cursor(name='reverse_index')
+            cursor.itersize = BATCH_SIZE
+            cursor.execute('''
+                SELECT * FROM ({houses}) x
+                ORDER BY
+                    (greatest(0, floor((x.y + %(origin)s) / %(cell_size)s))::bigint << {shift})
+                    | greatest(0, floor((x.x + %(origin)s) / %(cell_size)s))::bigint
+            '''.format(houses='UNION ALL'.join(sources), shift=CELL_ROW_SHIFT), dict(origin=ORIGIN, cell_size=cell_size))
+
+        count = 0
+        for source, x, y, house, road, house_number, postcode, city, county, state, license_id in (cursor if cursor is not None else []):
+            key = (_cell(y, cell_size) << CELL_ROW_SHIFT) | _cell(x, cell_size)
+            if not cells or key != cells[-1]:
+                if cells and key < cells[-1]:
+                    raise ValueError('Houses are not sorted by grid cell')
+                cells.append(key)
+                starts.append(count)
+
+            area = (string_id(postcode), string_id(city), string_id(county), string_id(state), string_id(license_id))
+            area_id = areas.get(area)
+            if area_id is None:
+                area_id = areas[area] = len(areas)
+                area_table.extend(area)
+
+            columns['x'].append(x)
+            columns['y'].append(y)
+            columns['house'].append(string_id(house))
+            columns['road'].append(string_id(road))
+            columns['house_number'].append(string_id(house_number))
+            columns['area'].append(area_id)
+            columns['source'].append(ord(source))
+
+            count += 1
+            if count % BATCH_SIZE == 0:
+                flush()
+        if cursor is not None:
+            cursor.close()
+        flush()
+        starts.append(count)
+
+        tmp_name = filename + '.tmp'
+        with open(tmp_name, 'wb') as fp:
+            fp.write(HEADER.pack(
+                MAGIC, BYTE_ORDER_MARK, cell_size, count, len(cells), len(areas), len(strings) - 1, string_offsets[-1]
+            ))
+            fp.write(b'\0' * (-fp.tell() % 8))
+            for name in ('x', 'y'):
+                _copy(files[name], fp)
+            cells.tofile(fp)
+            starts.tofile(fp)
+            for name in ('house', 'road', 'house_number', 'area'):
+                _copy(files[name], fp)
+            area_table.tofile(fp)
+            string_offsets.tofile(fp)
+            _copy(files['source'], fp)
+            _copy(files['blob'], fp)
+        os.replace(tmp_name, filename)
+    finally:
+        for fp in files.values():
+            fp.close()
+
+    return count
+
+
+def _copy(source, destination):
+    source.seek(0)
+    shutil.copyfileobj(source, destination, 1024 * 1024)
+
+
+class ReverseIndex():
+
+    def __init__(self, filename:str):
+        """
+        Open a reverse geocoding index built with ``build_reverse_index``
+
+        The file is memory mapped read only, so all processes that open the same
+        file share its pages.
+
+        :param filename: index file
+        """
+        with open(filename, 'rb') as fp:
+            self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byte_order, cell_size, count, cells, areas, strings, size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a reverse geocoding index'.format(filename))
+        if byte_order != BYTE_ORDER_MARK:
+            raise ValueError('{} was built on a machine with a different byte order'.format(filename))
+
+        self.cell_size = cell_size
+        self.count = count
+        position = HEADER.size
+        position += -position % 8
+
+        def column(dtype, length):
+            nonlocal position
+            result = np.frombuffer(self.map, dtype=dtype, count=length, offset=position)
+            position += result.nbytes
+            return result
+
+        self.x = column(np.float64, count)
+        self.y = column(np.float64, count)
+        self.cells = column(np.int64, cells)
+        self.starts = column(np.uint32, cells + 1)
+        self.house = column(np.uint32, count)
+        self.road = column(np.uint32, count)
+        self.house_number = column(np.uint32, count)
+        self.area = column(np.uint32, count)
+        self.areas = column(np.uint32, areas * AREA_FIELDS).reshape((areas, AREA_FIELDS))
+        self.string_offsets = column(np.uint32, strings + 1)
+        self.source = column(np.uint8, count)
+        self.blob = memoryview(self.map)[position:position + size]
+
+    def string(self, index:int) -> Optional[str]:
+        """String with the id ``index``, id zero is ``None``"""
+        index = int(index)
+        if index == 0:
+            return None
+        return self.blob[int(self.string_offsets[index - 1]):int(self.string_offsets[index])].tobytes().decode('utf-8')
+
+    def _within(self, x:float, y:float, radius:float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Indices of the points within ``radius`` of ``x, y`` and their distances, with the
+        same bounding box filter and distance calculation as the DB functions
+        """
+        indices = []
+        distances = []
+        x0, x1 = _cell(x - radius, self.cell_size), _cell(x + radius, self.cell_size)
+        for row in range(_cell(y - radius, self.cell_size), _cell(y + radius, self.cell_size) + 1):
+            # the cells of a row are sorted by column, so every row is one range of points
+            lo = np.searchsorted(self.cells, (row << CELL_ROW_SHIFT) | x0, side='left')
+            hi = np.searchsorted(self.cells, (row << CELL_ROW_SHIFT) | x1, side='right')
+            if lo == hi:
+                continue
+            start, end = int(self.starts[lo]), int(self.starts[hi])
+            xs = self.x[start:end]
+            dist = np.hypot(xs - x, self.y[start:end] - y)
+            matches = np.flatnonzero((xs >= x - radius) & (xs <= x + radius) & (dist <= radius))
+            indices.append(matches + start)
+            distances.append(dist[matches])
+
+        if not indices:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return np.concatenate(indices), np.concatenate(distances)
+
+    def _nearest(self, indices:np.ndarray, distances:np.ndarray, source:str, limit:int) -> List[Tuple[float, int]]:
+        mask = self.source[indices] == ord(source)
+        indices, distances = indices[mask], distances[mask]
+        order = np.lexsort((indices, distances))[:limit]
+        return [(float(distances[i]), int(indices[i])) for i in order]
+
+    def address(self, index:int, distance:float) -> Dict[str, Any]:
+        """
+        Address of a point as returned by the ``point_to_address`` DB function
+        """
+        postcode, city, county, state, license_id = (self.string(i) for i in self.areas[self.area[index]])
+        return dict(
+            house=self.string(self.house[index]),
+            road=self.string(self.road[index]),
+            house_number=self.string(self.house_number[index]),
+            postcode=postcode,
+            city=city,
+            county=county,
+            state=state,
+            location=EWKB_POINT_3857.pack(1, 0x20000001, 3857, float(self.x[index]), float(self.y[index])).hex().upper(),
+            distance=distance,
+            license_id=license_id
+        )
+
+    def reverse(self, x:float, y:float, radius:float, limit:int=1, merge_sources:bool=False) -> List[Dict[str, Any]]:
+        """
+        Nearest addresses to a point, like the ``point_to_address`` DB function
+
+        openaddresses.io data is only used if there is no OpenStreetMap address in the
+        radius, unless ``merge_sources`` is set. Addresses with the same distance are
+        sorted in file order, the DB may return them in any order.
+
+        :param x: X (EPSG 3857/Web Mercator)
+        :param y: Y (EPSG 3857/Web Mercator)
+        :param radius: search radius
+        :param limit: maximum number of results to return
+        :param merge_sources: return the nearest addresses of both sources
+        :returns: list of address dicts
+        """
+        if limit < 1:
+            return []
+
+        indices, distances = self._within(x, y, radius)
+        nearest = self._nearest(indices, distances, 'o', limit)
+        if merge_sources:
+            nearest = sorted(nearest + self._nearest(indices, distances, 'a', limit))[:limit]
+        elif not nearest:
+            nearest = self._nearest(indices, distances, 'a', limit)
+
+        return [self.address(index, distance) for distance, index in nearest]
@@ -59,7 +59,7 @@ See `README.md` in the [repository](https://github.com/dunkelstern/osmgeocoder)
             'requests >= 2.18',
             'PyYAML >= 5.0',
             'pystache >= 0.5',
-            'python-geohash >= 0.8.5'
+            'numpy >= 1.16'
         ],
         dependency_links=[
         ]
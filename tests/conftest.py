@@ -0,0 +1,24 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BIN = os.path.join(ROOT, 'bin')
+
+# run the tests against the source checkout
+sys.path.insert(0, ROOT)
+
+
+def load_script(name):
+    """Import a script from ``bin`` as a module"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BIN, name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def importer():
+    return load_script('import_openaddress_data')
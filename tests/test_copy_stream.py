@@ -0,0 +1,64 @@
+from threading import Thread
+
+import pytest
+
+
+class FailingCursor:
+    """Reads the whole COPY input and then fails like the server does"""
+
+    def __init__(self):
+        self.data = b''
+
+    def copy_expert(self, sql, stream, size=8192):
+        while True:
+            data = stream.read(size)
+            if not data:
+                break
+            self.data += data
+        raise ValueError('COPY failed')
+
+
+def finishes(function, timeout=5):
+    """Run ``function`` in a thread, returns the exception it raised or fails on timeout"""
+    result = []
+
+    def run():
+        try:
+            function()
+        except Exception as e:
+            result.append(e)
+        else:
+            result.append(None)
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        pytest.fail('{} did not return'.format(function.__name__))
+    return result[0]
+
+
+def test_close_raises_copy_error(importer):
+    stream = importer.CopyStream(FailingCursor(), 'public.oa_city', importer.CITY_COLUMNS)
+    stream.write((1, 2, 'Augsburg', None, None, '86150', None))
+    error = finishes(stream.close)
+    assert isinstance(error, ValueError)
+
+
+def test_abort_without_rows(importer):
+    stream = importer.CopyStream(FailingCursor(), 'public.oa_city', importer.CITY_COLUMNS)
+    assert finishes(stream.abort) is None
+    assert stream.error is not None
+
+
+def test_close_after_early_error(importer):
+    class EarlyFailingCursor:
+        def copy_expert(self, sql, stream, size=8192):
+            stream.read(size)
+            raise ValueError('COPY failed')
+
+    stream = importer.CopyStream(EarlyFailingCursor(), 'public.oa_city', importer.CITY_COLUMNS)
+    stream.buffer += b'x' * 10
+    stream.flush()
+    error = finishes(stream.close)
+    assert isinstance(error, ValueError)
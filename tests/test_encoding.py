@@ -0,0 +1,48 @@
+import warnings
+
+import numpy as np
+import pytest
+from pyproj import Proj
+
+geohash = pytest.importorskip('geohash')
+
+# the edges of the coordinate ranges and random points
+EDGES = [
+    (90.0, 180.0), (90.0, -180.0), (-90.0, 180.0), (-90.0, -180.0),
+    (0.0, 180.0), (0.0, -180.0), (90.0, 0.0), (-90.0, 0.0), (0.0, 0.0), (-0.0, -0.0),
+    (np.nextafter(90.0, 0.0), np.nextafter(180.0, 0.0)), (np.nextafter(-90.0, 0.0), np.nextafter(-180.0, 0.0)),
+    (45.0, 190.0), (45.0, -190.0), (45.0, 540.0),
+]
+
+
+def points(count=2000):
+    rnd = np.random.RandomState(1)
+    lat = np.concatenate([np.array([p[0] for p in EDGES]), rnd.uniform(-90.0, 90.0, count)])
+    lon = np.concatenate([np.array([p[1] for p in EDGES]), rnd.uniform(-180.0, 180.0, count)])
+    return lat, lon
+
+
+def test_geohashes_match_python_geohash(importer):
+    lat, lon = points()
+    with warnings.catch_warnings():
+        # python-geohash warns about latitude 90
+        warnings.simplefilter('ignore')
+        expected = [geohash.encode(a, o, importer.GEOHASH_PRECISION).encode('ascii') for a, o in zip(lat, lon)]
+    assert importer.geohashes(lat, lon) == expected
+
+    assert importer.geohashes(lat[:50], lon[:50], 5) == [h[:5] for h in expected[:50]]
+
+
+# the importer projects with the deprecated init string
+@pytest.mark.filterwarnings('ignore::FutureWarning')
+def test_ewkb_points_match_per_point_projection(importer):
+    lat, lon = points()
+    lat, lon = np.clip(lat, -85.0, 85.0), np.clip(lon, -180.0, 180.0)
+    proj = Proj(init='epsg:3857')
+
+    wkbs, _ = importer.encode_houses(proj, lon, lat)
+    for wkb, a, o in zip(wkbs, lat, lon):
+        x, y = proj(float(o), float(a))
+        assert wkb == importer.EWKB_POINT_HEADER.tobytes() + np.array([x, y], dtype='<f8').tobytes()
+
+    assert importer.ewkb_points(np.array([]), np.array([])) == []
@@ -0,0 +1,66 @@
+import json
+import os
+from threading import Thread
+
+from osmgeocoder import maintenance
+from osmgeocoder.maintenance import MaintenanceBudget, MIN_INDEX_MEMORY
+
+
+def test_lone_job_gets_everything():
+    budget = MaintenanceBudget(4096, 8, 8)
+    budget.reserve()
+    assert budget.acquire() == (4096, 8)
+
+
+def test_reserved_jobs_share():
+    budget = MaintenanceBudget(4096, 8, 8)
+    budget.reserve(4)
+    shares = [budget.acquire() for _ in range(4)]
+    assert shares == [(1024, 2)] * 4
+    assert budget.free_memory == 0
+
+    # released shares end their reservation, the next job alone gets everything
+    for memory, workers in shares:
+        budget.release(memory, workers)
+    budget.reserve()
+    assert budget.acquire() == (4096, 8)
+
+
+def test_no_over_commit():
+    # the minimum per job does not fit twice, the second job waits for the first
+    budget = MaintenanceBudget(MIN_INDEX_MEMORY + 10, None, 8)
+    budget.reserve(2)
+    first = budget.acquire()
+    assert first == (MIN_INDEX_MEMORY, None)
+
+    second = []
+    thread = Thread(target=lambda: second.append(budget.acquire()), daemon=True)
+    thread.start()
+    thread.join(0.2)
+    assert thread.is_alive()
+    assert budget.free_memory >= 0
+
+    # alone now, so it gets everything
+    budget.release(*first)
+    thread.join(5)
+    assert second == [(MIN_INDEX_MEMORY + 10, None)]
+
+
+def test_telemetry_appends_json_lines(tmp_path):
+    path = str(tmp_path / 'events.jsonl')
+    maintenance.set_telemetry(None)
+    maintenance.telemetry('ignored')
+    assert not os.path.exists(path)
+
+    maintenance.set_telemetry(path)
+    try:
+        maintenance.telemetry('step', name='001', seconds=1.5)
+        maintenance.telemetry('import', rows=3)
+    finally:
+        maintenance.set_telemetry(None)
+
+    with open(path) as fp:
+        events = [json.loads(line) for line in fp]
+    assert [event['event'] for event in events] == ['step', 'import']
+    assert events[0]['name'] == '001' and events[1]['rows'] == 3
+    assert all(event['pid'] == os.getpid() for event in events)
@@ -0,0 +1,129 @@
+import random
+
+import pytest
+
+from osmgeocoder import prediction
+from osmgeocoder.prediction import PredictionIndex, build_prediction_index, MAX_DISTANCE
+
+# multibyte characters of every UTF-8 sequence length
+ALPHABET = 'abcdeäöüßé中文😀'
+
+
+class FakeConnection():
+    """Serves the ``wordlist`` query of ``build_prediction_index`` from a list"""
+
+    def __init__(self, words):
+        # like ORDER BY word COLLATE "C"
+        self.rows = sorted(words.items(), key=lambda item: item[0].encode('utf-8'))
+
+    def cursor(self, name=None):
+        return self
+
+    def execute(self, query):
+        pass
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        pass
+
+
+def levenshtein(a, b):
+    row = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        previous, row[0] = row[0], i
+        for j, cb in enumerate(b, 1):
+            previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (ca != cb))
+    return row[-1]
+
+
+def naive_predict(words, user_input, limit=10):
+    """Rank every word by the distance of its prefix to the input, like ``predict`` documents it"""
+    matches = []
+    for word, ct in words.items():
+        dist = levenshtein(word[:len(user_input)], user_input)
+        if dist <= MAX_DISTANCE:
+            matches.append((dist, -ct, len(word), word.encode('utf-8'), word))
+    matches.sort()
+    return [(word, -ct, dist) for dist, ct, length, encoded, word in matches[:limit]]
+
+
+def random_word(rnd, max_length=8):
+    return ''.join(rnd.choice(ALPHABET) for _ in range(rnd.randint(1, max_length)))
+
+
+@pytest.fixture(scope='module')
+def words():
+    rnd = random.Random(4711)
+    result = {}
+    while len(result) < 1000:
+        # few distinct counts, so the ties are ranked by length and bytes
+        result[random_word(rnd)] = rnd.randint(1, 5)
+    return result
+
+
+@pytest.fixture(scope='module')
+def index(words, tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('prediction') / 'words.idx')
+    assert build_prediction_index(FakeConnection(words), filename) == len(words)
+    return PredictionIndex(filename)
+
+
+def test_predict_matches_naive_ranking(words, index):
+    rnd = random.Random(42)
+    inputs = [random_word(rnd, 5) for _ in range(200)]
+
+    # typos in existing words
+    for word in rnd.sample(sorted(words), 60):
+        chars = list(word)
+        chars[rnd.randrange(len(chars))] = rnd.choice(ALPHABET)
+        inputs.append(''.join(chars))
+
+    for user_input in inputs:
+        expected = naive_predict(words, user_input)
+        for limit in (1, 3, 10):
+            assert index.predict(user_input, limit) == expected[:limit], user_input
+
+
+def test_predict_multibyte_words(words, index):
+    for user_input in ('中', '😀a', 'ä😀', 'ß中文', 'é'):
+        result = index.predict(user_input)
+        assert result == naive_predict(words, user_input)
+        assert any(any(len(c.encode('utf-8')) > 1 for c in word) for word, _, _ in result)
+
+
+def test_predict_input_longer_than_every_word(words, index):
+    longest = max(words, key=len)
+    user_input = longest + 'ab'
+    assert len(user_input) > max(len(word) for word in words)
+
+    result = index.predict(user_input)
+    assert result == naive_predict(words, user_input)
+    assert (longest, words[longest], 2) in result
+
+
+def test_predict_stops_at_enough_prefix_matches(words, index, monkeypatch):
+    prefix = 'a'
+    starting = sorted(
+        (word for word in words if word.startswith(prefix)),
+        key=lambda word: (-words[word], len(word), word.encode('utf-8'))
+    )
+    assert len(starting) >= 10
+
+    # enough words start with the input, so there is no need to search for typos
+    def no_fuzzy_search(*args):
+        raise AssertionError('searched for typos')
+    monkeypatch.setattr(prediction, '_FuzzySearch', no_fuzzy_search)
+
+    result = index.predict(prefix)
+    assert result == [(word, words[word], 0) for word in starting[:10]]
+    assert result == naive_predict(words, prefix)
+
+
+def test_predict_empty(index, tmp_path):
+    assert index.predict('') == []
+
+    filename = str(tmp_path / 'empty.idx')
+    assert build_prediction_index(FakeConnection({}), filename) == 0
+    assert PredictionIndex(filename).predict('abc') == []
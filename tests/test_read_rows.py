@@ -0,0 +1,34 @@
+import csv
+import io
+
+
+class Wrapped():
+    position = 0
+
+
+ROWS = [
+    ['{}.0'.format(i), '48.0', ' {}a '.format(i), ' main street ', '', ' city {} '.format(i % 7), '', 'bavaria', ' ab{} '.format(i % 3)]
+    for i in range(100)
+]
+
+
+def read(importer, shard=0, shards=1):
+    reader = csv.reader(io.StringIO(''.join(','.join(row) + '\n' for row in ROWS)))
+    return list(importer.read_rows(reader, Wrapped(), 1, 'us/test.csv', 1, shard, shards))
+
+
+def test_shards_partition_the_rows(importer):
+    rows = read(importer)
+    assert len(rows) == 100
+    assert rows[1][3:] == ('1.0', '48.0', '1A', 'Main Street', '', 'City 1', '', 'Bavaria', 'AB1')
+
+    sharded = []
+    for shard in range(3):
+        sharded.extend(read(importer, shard, 3))
+    assert sorted(sharded) == sorted(rows)
+
+    # every city (by name and postcode) is imported by exactly one shard
+    cities = {}
+    for shard in range(3):
+        for row in read(importer, shard, 3):
+            assert cities.setdefault((row[8], row[11]), shard) == shard
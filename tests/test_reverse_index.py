@@ -0,0 +1,138 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from osmgeocoder.reverse_index import build_reverse_index, ReverseIndex, ORIGIN, CELL_SIZE
+
+OSM_LICENSE = '00000000-0000-0000-0000-000000000000'
+OA_LICENSE = 'a3c4e2f0-1111-2222-3333-444455556666'
+STREETS = ['Hauptstraße', 'Bahnhofstr.', 'Am Markt', 'Ringstraße', 'Gartenweg']
+
+
+def cell_key(row, cell_size=CELL_SIZE):
+    row_cell = max(0, math.floor((row[2] + ORIGIN) / cell_size))
+    column_cell = max(0, math.floor((row[1] + ORIGIN) / cell_size))
+    return (row_cell << 32) | column_cell
+
+
+def make_rows(count):
+    rnd = random.Random(1)
+    rows = []
+    for _ in range(count):
+        x, y = rnd.uniform(1.2e6, 1.22e6), rnd.uniform(6.1e6, 6.12e6)
+        if rnd.random() < 0.7:
+            rows.append((
+                'o', x, y, None, rnd.choice(STREETS), str(rnd.randint(1, 200)), '8615{}'.format(rnd.randint(0, 9)),
+                'Augsburg', rnd.choice([None, 'Schwaben']), 'Bayern', OSM_LICENSE
+            ))
+        else:
+            rows.append((
+                'a', x, y, rnd.choice([None, 'Rathaus']), rnd.choice(STREETS), str(rnd.randint(1, 200)), '',
+                rnd.choice(['', 'Augsburg']), None, None, OA_LICENSE
+            ))
+    # duplicate locations tie on the distance
+    rows.append(rows[0][:1] + rows[1][1:3] + rows[0][3:])
+    # outside of the grid origin
+    rows.append(('o', -2.5e7, 0.0, None, 'X', '1', '', '', None, None, OSM_LICENSE))
+    return rows
+
+
+class FakeCursor():
+    """Answers the queries of ``build_reverse_index`` from a list of rows"""
+
+    def __init__(self, rows, tables):
+        self.rows = rows
+        self.tables = tables
+        self.result = []
+
+    def execute(self, sql, params=None):
+        self.result = []
+        if 'to_regclass' in sql:
+            self.result = [('osm_struct_house' in self.tables, 'oa_house' in self.tables)]
+        elif params is not None:
+            # only the sources the query reads from, in cell order like the ORDER BY
+            sources = set()
+            if 'public.osm_struct_house' in sql:
+                assert 'osm_struct_house' in self.tables
+                sources.add('o')
+            if 'public.oa_house' in sql:
+                assert 'oa_house' in self.tables
+                sources.add('a')
+            self.result = sorted((row for row in self.rows if row[0] in sources), key=lambda row: cell_key(row, params['cell_size']))
+
+    def fetchone(self):
+        return self.result[0]
+
+    def __iter__(self):
+        return iter(self.result)
+
+    def close(self):
+        pass
+
+
+class FakeDB():
+
+    def __init__(self, rows, tables=('osm_struct_house', 'oa_house')):
+        self.rows = rows
+        self.tables = tables
+
+    def cursor(self, name=None):
+        return FakeCursor(self.rows, self.tables)
+
+
+def reference(rows, x, y, radius, limit, merge_sources):
+    """Brute force version of the ``point_to_address`` DB function"""
+    order = sorted(rows, key=cell_key)
+    xs = np.array([row[1] for row in order])
+    ys = np.array([row[2] for row in order])
+    dist = np.hypot(xs - x, ys - y)
+    matches = np.flatnonzero((xs >= x - radius) & (xs <= x + radius) & (dist <= radius))
+
+    def nearest(source):
+        return sorted((float(dist[i]), int(i)) for i in matches if order[i][0] == source)[:limit]
+
+    result = nearest('o')
+    if merge_sources:
+        result = sorted(result + nearest('a'))[:limit]
+    elif not result:
+        result = nearest('a')
+    return [(d, order[i][3:11]) for d, i in result]
+
+
+def results(index, x, y, radius, limit, merge_sources):
+    return [
+        (r['distance'], (r['house'], r['road'], r['house_number'], r['postcode'], r['city'], r['county'], r['state'], r['license_id']))
+        for r in index.reverse(x, y, radius, limit, merge_sources)
+    ]
+
+
+@pytest.fixture(scope='module')
+def rows():
+    return make_rows(20000)
+
+
+def test_same_results_as_brute_force(rows, tmp_path):
+    filename = str(tmp_path / 'houses.idx')
+    assert build_reverse_index(FakeDB(rows), filename) == len(rows)
+    index = ReverseIndex(filename)
+
+    rnd = random.Random(2)
+    for _ in range(300):
+        x, y = rnd.uniform(1.19e6, 1.23e6), rnd.uniform(6.09e6, 6.13e6)
+        radius = rnd.choice([10, 30, 100, 250, 1000])
+        limit = rnd.choice([1, 3, 10])
+        merge_sources = rnd.random() < 0.5
+        assert results(index, x, y, radius, limit, merge_sources) == reference(rows, x, y, radius, limit, merge_sources)
+
+    assert index.reverse(-2.5e7, 0.0, 5)[0]['road'] == 'X'
+
+
+@pytest.mark.parametrize('tables', [('oa_house',), ('osm_struct_house',), ()])
+def test_missing_sources(rows, tmp_path, tables):
+    filename = str(tmp_path / 'houses.idx')
+    available = [row for row in rows if (row[0] == 'o' and 'osm_struct_house' in tables) or (row[0] == 'a' and 'oa_house' in tables)]
+    assert build_reverse_index(FakeDB(rows, tables), filename) == len(available)
+    index = ReverseIndex(filename)
+    assert results(index, 1.21e6, 6.11e6, 250, 5, True) == reference(available, 1.21e6, 6.11e6, 250, 5, True)
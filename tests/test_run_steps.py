@@ -0,0 +1,111 @@
+from threading import Lock
+from time import sleep
+
+import pytest
+
+from conftest import load_script
+from osmgeocoder.maintenance import MaintenanceBudget
+
+
+@pytest.fixture(scope='session')
+def prepare():
+    return load_script('prepare_osm')
+
+
+class Connections():
+    """Counts the open fake connections"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.open = 0
+        self.most = 0
+
+    def change(self, delta):
+        with self.lock:
+            self.open += delta
+            self.most = max(self.most, self.open)
+
+
+class FakeConnection():
+
+    def __init__(self, connections):
+        self.connections = connections
+        connections.change(1)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.connections.change(-1)
+
+
+class FakeCursor():
+
+    def __init__(self, connections):
+        self.connection = FakeConnection(connections)
+        self.name = None
+        self.result = []
+
+    def execute(self, sql, args=None):
+        self.result = []
+        if 'ST_EstimatedExtent' in sql:
+            self.result = [(0.0, 0.0, 1.0, 1.0)]
+        elif 'work' in sql:
+            sleep(0.01)
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+STEPS = [
+    ('001-plain.sql', 'SELECT work();'),
+    ('002-tiled.sql', '-- depends:\n-- tiles: public.t.geometry\nSELECT 1;\n-- per tile:\nSELECT work(%(xmin)s);'),
+    ('003-jobs.sql', '-- depends:\nSELECT 1;\n' + ''.join('-- job: j{}\nSELECT work();\n'.format(i) for i in range(6)) + '-- finally:\nSELECT 1;'),
+    ('004-plain.sql', '-- depends:\nSELECT work();'),
+]
+
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_steps_tiles_and_jobs_share_the_connections(prepare, monkeypatch, threads):
+    connections = Connections()
+    monkeypatch.setattr(prepare, 'open_db', lambda url, cursor_name=None: FakeCursor(connections))
+    monkeypatch.setattr(prepare, 'sql_files', lambda path: STEPS)
+    monkeypatch.setattr(prepare, 'maintenance_budget', lambda db, memory, slots: MaintenanceBudget(1024, None, slots))
+
+    assert prepare.run_steps('postgresql://', 'data/sql/optimize', threads=threads, grid=3)
+    assert connections.open == 0
+    assert connections.most == threads
+
+
+class RegclassCursor(FakeCursor):
+    """``to_regclass`` finds the ``existing`` tables"""
+
+    def __init__(self, existing):
+        super().__init__(Connections())
+        self.existing = existing
+        self.calls = []
+
+    def execute(self, sql, args=None):
+        self.calls.append((sql, args))
+        if 'to_regclass' in sql:
+            self.result = [(args[0] if args[0] in self.existing else None,)]
+
+
+def test_rollback_swaps_every_published_table(prepare):
+    existing = ['osm_previous.' + table for table in prepare.PUBLISHED_TABLES if table != 'osm_struct_search']
+    db = RegclassCursor(existing)
+    prepare.rollback(db)
+
+    sql, args = db.calls[-1]
+    assert 'rollback_build' in sql
+    assert args[0] == [table for table in prepare.PUBLISHED_TABLES if table != 'osm_struct_search']
+    assert 'wordlist_region' in args[0] and 'address_completion' in args[0]
@@ -0,0 +1,35 @@
+import io
+import math
+import zipfile
+
+
+def make_zip(rows):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as z:
+        z.writestr('us/sorted.csv', 'LON,LAT,NUMBER\n' + ''.join('{},0,1\n'.format(lon) for lon in rows))
+    buffer.seek(0)
+    return zipfile.ZipFile(buffer)
+
+
+def test_samples_cover_whole_file(importer):
+    # sorted by longitude, the head of the file only has western coordinates
+    count = 20000
+    lons = [-180 + 360 * i / count for i in range(count)]
+    z = make_zip(lons)
+    samples = importer.sample_x_coordinates(z, ['us/sorted.csv'], rows_per_file=500)
+
+    assert len(samples) == 500
+    xs = sorted(x for x, _ in samples)
+    half = math.pi * 6378137.0
+    assert xs[0] < -0.9 * half
+    assert xs[-1] > 0.9 * half
+    # roughly half of the samples in each hemisphere
+    east = sum(1 for x in xs if x > 0)
+    assert 150 < east < 350
+
+
+def test_short_file_is_sampled_completely(importer):
+    rng = importer.random.Random(1)
+    assert importer.reservoir_sample(range(10), 20, rng) == list(range(10))
+    sample = importer.reservoir_sample(range(100000), 100, rng)
+    assert len(sample) == 100 and len(set(sample)) == 100
@@ -0,0 +1,27 @@
+import random
+
+
+def make_rows(count):
+    rnd = random.Random(4)
+    return [
+        (rnd.randrange(50), rnd.randrange(20), rnd.randrange(5), str(i), 'Hauptstraße', '')
+        for i in range(count)
+    ]
+
+
+def test_sort_in_memory(importer):
+    rows = make_rows(1000)
+    count, spilled, result = importer.sort_rows(iter(rows), 2000)
+    assert (count, spilled) == (1000, 0)
+    assert list(result) == sorted(rows, key=importer.SORT_KEY)
+
+
+def test_sort_multi_pass_merge(importer, monkeypatch):
+    # 100 runs with a fan in of 8 need three merge passes
+    monkeypatch.setattr(importer, 'MERGE_FAN_IN', 8)
+    rows = make_rows(5000)
+    count, spilled, result = importer.sort_rows(iter(rows), 50)
+    assert (count, spilled) == (5000, 100)
+    # the merge is stable, equal keys keep the input order
+    assert list(result) == sorted(rows, key=importer.SORT_KEY)
+
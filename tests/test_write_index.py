@@ -0,0 +1,20 @@
+from osmgeocoder.maintenance import write_index
+
+
+class FakeCursor():
+    connection = object()
+
+
+def build_reverse_index(db, filename):
+    assert db is FakeCursor.connection
+    return 42
+
+
+def test_write_index_reports_to_telemetry(capsys):
+    events = []
+    count = write_index(FakeCursor(), 'houses.idx', build_reverse_index, 'reverse_index', 'houses', lambda event, **fields: events.append((event, fields)))
+
+    assert count == 42
+    assert events[0][0] == 'reverse_index'
+    assert events[0][1]['houses'] == 42 and events[0][1]['seconds'] >= 0
+    assert 'Writing reverse index to houses.idx... 42 houses' in capsys.readouterr().out